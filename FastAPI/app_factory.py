@@ -0,0 +1,201 @@
+"""
+create_app(): the FastAPI() used by the lessons, with faster JSON responses.
+
+When a handler returns a dict, FastAPI normally does two passes over it:
+
+    jsonable_encoder(result)   walks the whole value in Python and builds a copy
+    json.dumps(copy)           encodes the copy (stdlib json, also mostly Python)
+
+For small answers like {"data": "Kedar Damale"} that is a big part of the time spent
+on the request. FastJSONResponse encodes the returned value in one go with a native
+encoder: orjson if it is installed (pip install orjson), otherwise pydantic-core's
+to_json, which comes with pydantic anyway. Pydantic models are written straight to
+JSON bytes, there is no dict in between.
+
+The apps made by create_app() use FastJSONRoute for their routes:
+
+  - routes with a response_model (lesson7's PublicUser) keep FastAPI's own fast path,
+    where pydantic validates and writes the JSON bytes in Rust; if the handler returns
+    another model that already has the right fields (lesson7's InternalUser) even the
+    validation is skipped, see projection.py (create_app(strict_responses=True) turns that off)
+  - routes without one get their result wrapped in a FastJSONResponse right away,
+    so FastAPI skips jsonable_encoder
+  - routes that need anything else (another response class, a `response: Response`
+    parameter to set headers, generators, 204 ...) are left exactly as FastAPI makes them
+  - with create_app(fast_request_bodies=True), a JSON body model is validated straight
+    from the request bytes, without json.loads first, see body_decoder.py
+
+Everything else behaves like a plain FastAPI() app.
+"""
+
+import functools
+import inspect
+import os
+import typing
+from typing import Any, Callable, Optional
+
+from fastapi import FastAPI
+from fastapi.datastructures import Default, DefaultPlaceholder
+from fastapi.dependencies.models import Dependant
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute, request_response
+from pydantic import BaseModel
+import pydantic_core
+
+from body_decoder import BodyDecoder
+from metrics import MetricsMiddleware, metrics_endpoint
+from openapi_cache import OpenAPICache
+from projection import Projector
+
+try:
+    import orjson
+except ImportError:  # optional, pydantic-core is used instead
+    orjson = None
+
+
+def _orjson_default(value: Any) -> Any:
+    # types orjson doesn't know: models, sets, ... (called once per such value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    if isinstance(content, BaseModel):
+        return content.model_dump_json(by_alias=True).encode()
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return pydantic_core.to_json(content, by_alias=True, fallback=jsonable_encoder)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _uses_response_param(dependant: Dependant) -> bool:
+    return dependant.response_param_name is not None or any(
+        _uses_response_param(sub) for sub in dependant.dependencies)
+
+
+def _wrap_endpoint(call: Callable, respond: Callable[[Any], Any]) -> Callable:
+    # same kind of function as `call` (sync or async), so FastAPI still runs it the same way;
+    # respond() turns the result into a Response, or gives it back for FastAPI to handle
+    if inspect.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            return respond(await call(*args, **kwargs))
+    else:
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            return respond(call(*args, **kwargs))
+    return endpoint
+
+
+def _json_responder(status_code: int) -> Callable[[Any], Any]:
+    def respond(result):
+        return result if isinstance(result, Response) else FastJSONResponse(result, status_code)
+    return respond
+
+
+def _projecting_responder(projector: Projector, status_code: int, by_alias: bool) -> Callable[[Any], Any]:
+    def respond(result):
+        plan = projector.plan_for(type(result))
+        if plan is None:
+            return result  # not a model that can be projected: FastAPI validates it
+        return Response(plan.dump_json(result, by_alias), status_code, media_type="application/json")
+    return respond
+
+
+def _return_model(endpoint: Callable) -> Optional[type]:
+    try:
+        returns = typing.get_type_hints(endpoint).get("return")
+    except Exception:  # string annotations that can't be resolved: plans are made on first use
+        return None
+    return returns if isinstance(returns, type) and issubclass(returns, BaseModel) else None
+
+
+class FastJSONRoute(APIRoute):
+    strict_responses = False
+    fast_request_bodies = False
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if kwargs.get("response_class") is FastJSONResponse:
+            # the app's default: FastAPI only takes its response_model fast path for a *default* class
+            kwargs["response_class"] = Default(FastJSONResponse)
+        super().__init__(path, endpoint, **kwargs)
+        respond = self._responder(endpoint) if self._wrappable() else None
+        if respond is not None:
+            self.dependant.call = _wrap_endpoint(self.dependant.call, respond)
+        # JSON body validated straight from the request bytes, see body_decoder.py
+        self.body_decoder = BodyDecoder.for_route(self) if self.fast_request_bodies else None
+        if respond is None and self.body_decoder is None:
+            return
+        handler = self.get_route_handler()
+        if self.body_decoder is not None:
+            handler = self.body_decoder.wrap(handler)
+        self.app = request_response(handler)
+
+    def _responder(self, endpoint: Callable) -> Optional[Callable[[Any], Any]]:
+        status_code = self.status_code or 200
+        if self.response_field is None:
+            return _json_responder(status_code)
+        if self._projectable():
+            # plans are made now for the model named in the return annotation (-> InternalUser),
+            # other returned models get theirs on first use
+            returns = _return_model(endpoint)
+            projector = Projector(self.response_model, [returns] if returns else [])
+            return _projecting_responder(projector, status_code, self.response_model_by_alias)
+        return None
+
+    def _wrappable(self) -> bool:
+        call = self.dependant.call
+        return (
+            isinstance(self.response_class, DefaultPlaceholder)
+            and self.response_class.value is FastJSONResponse
+            and self.status_code not in (204, 304)
+            and not (inspect.isgeneratorfunction(call) or inspect.isasyncgenfunction(call))
+            and not _uses_response_param(self.dependant)
+        )
+
+    def _projectable(self) -> bool:
+        return (
+            not self.strict_responses
+            and isinstance(self.response_model, type) and issubclass(self.response_model, BaseModel)
+            and self.response_model_include is None and self.response_model_exclude is None
+            and not (self.response_model_exclude_unset or self.response_model_exclude_defaults
+                     or self.response_model_exclude_none)
+        )
+
+
+class StrictJSONRoute(FastJSONRoute):
+    """FastJSONRoute that always lets FastAPI validate response models."""
+    strict_responses = True
+
+
+def create_app(strict_responses: bool = False, openapi_cache_dir: Optional[str] = None,
+               metrics: bool = True, fast_request_bodies: bool = False, **kwargs) -> FastAPI:
+    """
+    FastAPI(**kwargs) with FastJSONResponse as the default response class.
+
+    With openapi_cache_dir (or OPENAPI_CACHE_DIR in the environment) /openapi.json is
+    built once and served from files in that folder, see openapi_cache.py.
+    With metrics, requests are timed per route and /metrics serves the numbers, see metrics.py.
+    With fast_request_bodies, JSON bodies are validated straight from the request bytes, see body_decoder.py.
+    """
+    kwargs.setdefault("default_response_class", FastJSONResponse)
+    app = FastAPI(**kwargs)
+    route_class = StrictJSONRoute if strict_responses else FastJSONRoute
+    if fast_request_bodies:
+        route_class = type(route_class.__name__, (route_class,), {"fast_request_bodies": True})
+    app.router.route_class = route_class
+    if metrics:
+        app.add_middleware(MetricsMiddleware)
+        app.add_route("/metrics", metrics_endpoint(), include_in_schema=False)
+    openapi_cache_dir = openapi_cache_dir or os.environ.get("OPENAPI_CACHE_DIR")
+    if openapi_cache_dir and app.openapi_url:
+        OpenAPICache(app, openapi_cache_dir).install()
+    return app
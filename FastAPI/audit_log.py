@@ -0,0 +1,168 @@
+"""
+Bounded, asynchronous audit log used by lesson6 instead of print(users_db).
+
+print(users_db) turns the whole database into a string on every write, which is
+O(number of users) per request and blocks the request thread on stdout.
+
+Here a request only puts a small event (what changed, for which login) into a
+fixed-size ring buffer. A background thread drains the buffer in batches and
+appends them as JSON lines to a file that is rotated when it gets too big.
+
+What happens when the buffer is full is the back-pressure `policy`:
+
+    "drop"    the new event is thrown away (counted in stats()["dropped"])
+    "block"   the request waits for free space (up to `block_timeout` seconds, then drops);
+              async handlers use emit_async(), which waits on a worker thread so the
+              event loop keeps serving the other requests meanwhile
+    "sample"  once the buffer is more than half full only every `sample_every`-th
+              event is kept (counted in "sampled_out"), when full it drops
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+POLICIES = ("drop", "block", "sample")
+
+
+class AuditLog:
+    def __init__(self, path: str, capacity: int = 10_000, policy: str = "drop",
+                 batch_size: int = 512, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 block_timeout: Optional[float] = 1.0, sample_every: int = 10,
+                 flush_interval: float = 0.2):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.path = path
+        self.policy = policy
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.block_timeout = block_timeout
+        self.sample_every = sample_every
+        self.flush_interval = flush_interval
+
+        # ring buffer: fixed list, `_head` is the oldest event, `_size` how many are queued
+        self._ring: List[Optional[dict]] = [None] * capacity
+        self._head = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._counters: Dict[str, int] = {
+            "emitted": 0, "written": 0, "dropped": 0, "sampled_out": 0, "batches": 0,
+        }
+        self._sample_counter = 0
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- producer side (request threads) ----------
+
+    def emit(self, event: str, **fields) -> bool:
+        """Queue one event. Returns False if it was dropped or sampled out."""
+        return self._put({"ts": time.time(), "event": event, **fields}, wait=True)
+
+    async def emit_async(self, event: str, **fields) -> bool:
+        """emit() for async code: never blocks the event loop, even with the "block" policy."""
+        record = {"ts": time.time(), "event": event, **fields}
+        queued = self._put(record, wait=False)
+        if queued is None:  # full and the policy is "block": wait for space on a worker thread
+            queued = await asyncio.to_thread(self._put, record, True)
+        return queued
+
+    def _put(self, record: dict, wait: bool) -> Optional[bool]:
+        # None: the buffer is full, the policy says wait and `wait` is False (nothing was counted)
+        capacity = len(self._ring)
+        with self._lock:
+            if self._size == capacity and self.policy == "block" and not self._closed and not wait:
+                return None
+            self._counters["emitted"] += 1
+            if self.policy == "sample" and self._size >= capacity // 2:
+                self._sample_counter += 1
+                if self._sample_counter % self.sample_every:
+                    self._counters["sampled_out"] += 1
+                    return False
+            if self._size == capacity and self.policy == "block":
+                self._not_full.wait_for(lambda: self._size < capacity or self._closed, self.block_timeout)
+            if self._size == capacity or self._closed:
+                self._counters["dropped"] += 1
+                return False
+            self._ring[(self._head + self._size) % capacity] = record
+            self._size += 1
+            if self._size >= self.batch_size:
+                self._not_empty.notify()
+            return True
+
+    # ---------- consumer side (background thread) ----------
+
+    def _take_batch(self) -> List[dict]:
+        capacity = len(self._ring)
+        count = min(self._size, self.batch_size)
+        batch = []
+        for _ in range(count):
+            batch.append(self._ring[self._head])
+            self._ring[self._head] = None
+            self._head = (self._head + 1) % capacity
+        self._size -= count
+        if count:
+            self._not_full.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                # wake up for a full batch, or every flush_interval for whatever is there
+                self._not_empty.wait_for(lambda: self._size >= self.batch_size or self._closed,
+                                         self.flush_interval)
+                batch = self._take_batch()
+                closed = self._closed and not self._size
+            if batch:
+                self._write(batch)
+            if closed:
+                return
+
+    def _write(self, batch: List[dict]) -> None:
+        # serialization happens here, off the request threads
+        self._file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch))
+        self._file.flush()
+        with self._lock:
+            self._counters["written"] += len(batch)
+            self._counters["batches"] += 1
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        # audit.log -> audit.log.1 -> audit.log.2 ... the oldest one is deleted
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    # ---------- misc ----------
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "queued": self._size, "capacity": len(self._ring)}
+
+    def close(self) -> None:
+        """Write out everything still queued and stop the writer thread."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._thread.join()
+        self._file.close()
@@ -0,0 +1,201 @@
+"""
+Bulk arithmetic for lesson5's POST /sum:batch: millions of additions in one request.
+
+/sum?a=1&b=2 does one addition per HTTP request, and the request (parsing, routing,
+validation, the JSON answer) costs a thousand times more than the addition. A batch
+request sends two whole arrays and gets all the sums back, computed by numpy in one call:
+
+    a + b elementwise, and reductions of the result: count, total, min, max, mean
+
+Three body formats, the answer comes back in the same one:
+
+    application/json                      {"a": [1, 2, 3], "b": [10, 20, 30]}   (b is optional)
+    application/octet-stream              raw little-endian numbers: all of a, then all of b
+                                          (same length), ?dtype=int64 (default) or float64.
+                                          The reductions come back in X-Sum-* headers
+    application/vnd.apache.arrow.stream   an Arrow IPC stream with columns a and b (needs pyarrow)
+
+Raw and Arrow bodies are read straight into numpy arrays without converting number by
+number (np.frombuffer makes no copy at all), which is where most of the time of a JSON
+batch goes. Binary answers are sent in chunks of 1 MB.
+
+int64 is checked for overflow (a + b past 2**63 - 1 is a 422, not a silently wrapped
+number) and the total is exact: it is added up in two 32-bit halves, so it can be
+bigger than an int64. float64 sums or totals that overflow to inf are a 422 as well.
+"""
+
+import json
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional, json is used instead
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # optional, only needed for Arrow bodies
+    pyarrow = None
+
+MAX_BODY = 256 * 2 ** 20  # bytes
+CHUNK = 2 ** 20
+DTYPES = {"int64": numpy.dtype("<i8"), "float64": numpy.dtype("<f8")}
+JSON, RAW, ARROW = "application/json", "application/octet-stream", "application/vnd.apache.arrow.stream"
+
+
+async def read_body(request: Request) -> bytes:
+    """The request body, refused with 413 as soon as it is bigger than MAX_BODY."""
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > MAX_BODY:
+        raise HTTPException(status_code=413, detail=f"Body larger than {MAX_BODY} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BODY:
+            raise HTTPException(status_code=413, detail=f"Body larger than {MAX_BODY} bytes")
+    return bytes(body)
+
+
+def body_format(content_type: str) -> str:
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in ("", JSON):
+        return JSON
+    if media_type in (RAW, ARROW):
+        return media_type
+    raise HTTPException(status_code=415, detail=f"Send {JSON}, {RAW} or {ARROW}")
+
+
+def _json_array(values: Any, name: str, dtype: Optional[str] = None) -> numpy.ndarray:
+    if not isinstance(values, list):
+        raise HTTPException(status_code=422, detail=f"'{name}' must be an array of numbers")
+    if not values:  # numpy.asarray([]) is float64, whatever dtype was asked for
+        return numpy.empty(0, dtype=DTYPES[dtype or "int64"])
+    try:
+        array = numpy.asarray(values)  # int64 if they are all ints, else float64
+    except (ValueError, TypeError, OverflowError):
+        raise HTTPException(status_code=422, detail=f"'{name}' must be an array of int64 or float64 numbers")
+    if array.ndim != 1 or array.dtype.kind not in "iuf" or array.dtype.itemsize > 8:
+        raise HTTPException(status_code=422, detail=f"'{name}' must be an array of int64 or float64 numbers")
+    if array.dtype.kind == "u":
+        if len(array) and array.max() > numpy.iinfo(numpy.int64).max:
+            raise HTTPException(status_code=422, detail=f"'{name}' has numbers too big for int64")
+        array = array.astype(numpy.int64)
+    if dtype == "int64" and array.dtype.kind == "f":
+        raise HTTPException(status_code=422, detail=f"'{name}' has numbers that are not integers (dtype=int64)")
+    kind = "float64" if dtype == "float64" or array.dtype.kind == "f" else "int64"
+    return array.astype(DTYPES[kind], copy=False)
+
+
+def _column(values: numpy.ndarray, name: str) -> numpy.ndarray:
+    if values.dtype in (numpy.int64, numpy.float64):
+        return values  # no conversion at all
+    return _json_array(values.tolist(), name)  # int32, float32, ... (or nulls, which are refused)
+
+
+def parse(body: bytes, fmt: str, dtype: Optional[str]) -> Tuple[numpy.ndarray, Optional[numpy.ndarray]]:
+    """(a, b) from the body; b is None when only a was sent."""
+    if dtype is not None and dtype not in DTYPES:
+        raise HTTPException(status_code=422, detail=f"dtype must be one of {', '.join(DTYPES)}")
+    if fmt == RAW:
+        dtype = DTYPES[dtype or "int64"]
+        if len(body) % (2 * dtype.itemsize):
+            raise HTTPException(status_code=422, detail=f"Body must be two arrays of {dtype.itemsize}-byte numbers of the same length")
+        values = numpy.frombuffer(body, dtype=dtype)
+        return values[:len(values) // 2], values[len(values) // 2:]
+    if fmt == ARROW:
+        if pyarrow is None:
+            raise HTTPException(status_code=415, detail="Arrow bodies need pyarrow installed on the server")
+        try:
+            table = pyarrow.ipc.open_stream(body).read_all()
+        except pyarrow.ArrowInvalid as exc:
+            raise HTTPException(status_code=400, detail=f"Not an Arrow IPC stream: {exc}")
+        if "a" not in table.column_names:
+            raise HTTPException(status_code=422, detail="The Arrow table needs a column 'a' (and optionally 'b')")
+        a = _column(table.column("a").to_numpy(), "a")
+        b = _column(table.column("b").to_numpy(), "b") if "b" in table.column_names else None
+        return a, b
+    try:
+        data = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Body must be JSON: {"a": [...], "b": [...]}')
+    if not isinstance(data, dict) or "a" not in data:
+        raise HTTPException(status_code=422, detail='Body must be JSON: {"a": [...], "b": [...]}')
+    a = _json_array(data["a"], "a", dtype)
+    b = _json_array(data["b"], "b", dtype) if data.get("b") is not None else None
+    return a, b
+
+
+def compute(a: numpy.ndarray, b: Optional[numpy.ndarray]) -> Tuple[numpy.ndarray, Dict[str, Any]]:
+    """a + b (or a alone) and its reductions."""
+    if b is not None:
+        if len(a) != len(b):
+            raise HTTPException(status_code=422, detail=f"a and b must have the same length ({len(a)} != {len(b)})")
+        if a.dtype != b.dtype:  # int64 + float64
+            a, b = a.astype(numpy.float64), b.astype(numpy.float64)
+        result = a + b
+        if result.dtype.kind == "i":
+            # overflow: both operands have the same sign and the result the other one
+            overflow = numpy.flatnonzero(((a ^ result) & (b ^ result)) < 0)
+            if len(overflow):
+                raise HTTPException(status_code=422, detail=f"int64 overflow at index {int(overflow[0])}")
+    else:
+        result = a
+    if result.dtype.kind == "f":
+        # float64 overflows to inf (and raw bodies can carry inf/nan): JSON has no such numbers
+        not_finite = numpy.flatnonzero(~numpy.isfinite(result))
+        if len(not_finite):
+            raise HTTPException(status_code=422, detail=f"float64 overflow (or inf/nan) at index {int(not_finite[0])}")
+    reductions: Dict[str, Any] = {"count": len(result)}
+    if result.dtype.kind == "i":
+        # exact total of any size: the high and low 32 bits added up separately can't overflow
+        high, low = int(numpy.sum(result >> 32)), int(numpy.sum(result & 0xFFFFFFFF))
+        reductions["total"] = (high << 32) + low
+        reductions["mean"] = reductions["total"] / len(result) if len(result) else None
+    else:
+        reductions["total"] = float(numpy.sum(result))
+        if not numpy.isfinite(reductions["total"]):
+            raise HTTPException(status_code=422, detail="The total overflows float64")
+        reductions["mean"] = float(numpy.mean(result)) if len(result) else None
+    reductions["min"] = result.min().item() if len(result) else None
+    reductions["max"] = result.max().item() if len(result) else None
+    return result, reductions
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:  # an int bigger than 64 bits (the exact total)
+            pass
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _chunks(data: memoryview) -> Iterator[bytes]:
+    for start in range(0, len(data), CHUNK):
+        yield bytes(data[start:start + CHUNK])
+
+
+def respond(body: bytes, content_type: str, dtype: Optional[str]) -> Response:
+    """Parse, compute and encode the answer in the format of the request (runs on the threadpool)."""
+    fmt = body_format(content_type)
+    result, reductions = compute(*parse(body, fmt, dtype))
+    if fmt == JSON:
+        return Response(_dumps({"sum": result.tolist(), **reductions}), media_type=JSON)
+    headers = {f"X-Sum-{name.capitalize()}": "" if value is None else str(value) for name, value in reductions.items()}
+    headers["X-Sum-Dtype"] = "int64" if result.dtype.kind == "i" else "float64"
+    if fmt == RAW:
+        data = memoryview(numpy.ascontiguousarray(result, dtype=result.dtype.newbyteorder("<"))).cast("B")
+    else:
+        schema = pyarrow.schema([("sum", pyarrow.from_numpy_dtype(result.dtype))],
+                                metadata={name: json.dumps(value) for name, value in reductions.items()})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, schema) as writer:
+            writer.write_table(pyarrow.table({"sum": result}, schema=schema), max_chunksize=CHUNK // 8)
+        data = memoryview(sink.getvalue())
+    headers["Content-Length"] = str(len(data))
+    return StreamingResponse(_chunks(data), media_type=fmt, headers=headers)
@@ -0,0 +1,64 @@
+"""
+Batch vs single-item throughput for the lesson6 user API.
+
+Creates and then deletes --users accounts twice:
+  - one request per user through POST /create_user and DELETE /delete_user
+  - --batch-size users per request through POST /users:batch and DELETE /users:batch
+
+The scrypt cost is lowered (--scrypt-n) so the numbers show request overhead
+rather than hashing time, which is the same for both paths.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_batch --users 2000 --batch-size 500
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("LESSON6_DATA_DIR", tempfile.mkdtemp(prefix="lesson6-bench-"))
+
+import lesson6
+
+
+def report(name: str, count: int, elapsed: float) -> None:
+    print(f"{name:<28} {count:,} users in {elapsed:6.2f}s ({count / elapsed:>10,.0f} users/s)")
+
+
+def main(users: int, batch_size: int, scrypt_n: int) -> None:
+    lesson6.passwords.n = scrypt_n
+    client = TestClient(lesson6.app)
+
+    bodies = [{"login": f"single{i}", "password": "pw", "xyz": None} for i in range(users)]
+    start = time.perf_counter()
+    for body in bodies:
+        client.post("/create_user", json=body)
+    report("single create", users, time.perf_counter() - start)
+    start = time.perf_counter()
+    for body in bodies:
+        client.delete("/delete_user", params={"login": body["login"]})
+    report("single delete", users, time.perf_counter() - start)
+
+    bodies = [{"login": f"batch{i}", "password": "pw", "xyz": None} for i in range(users)]
+    chunks = [bodies[i:i + batch_size] for i in range(0, users, batch_size)]
+    start = time.perf_counter()
+    for chunk in chunks:
+        client.post("/users:batch", json=chunk)
+    report(f"batch create ({batch_size}/req)", users, time.perf_counter() - start)
+    start = time.perf_counter()
+    for chunk in chunks:
+        client.request("DELETE", "/users:batch", json=[body["login"] for body in chunk])
+    report(f"batch delete ({batch_size}/req)", users, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--scrypt-n", type=int, default=2 ** 4)
+    args = parser.parse_args()
+    main(args.users, args.batch_size, args.scrypt_n)
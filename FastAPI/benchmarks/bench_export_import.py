@@ -0,0 +1,144 @@
+"""
+Streaming NDJSON import/export benchmark for lesson6 (/users/import, /users/export).
+
+Streams --users synthetic accounts (already hashed, so no scrypt cost) into
+POST /users/import, then reads them all back from GET /users/export.
+Reports rows/s for both directions and how much the process RSS grew while
+each stream was running. The users are kept in an in-memory ShardedUserStore
+unless --durable is given.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_export_import --users 10000000
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("LESSON6_DATA_DIR", tempfile.mkdtemp(prefix="lesson6-bench-"))
+
+import lesson6
+from user_store import ShardedUserStore
+
+FAKE_HASH = "scrypt$16384$8$1$" + "ab" * 16 + "$" + "cd" * 32
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # not Linux: peak RSS is the best we have
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Records the highest RSS seen while the `with` block runs."""
+
+    def __enter__(self):
+        self.baseline = self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(0.05):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+    @property
+    def growth_mb(self) -> float:
+        return (self.peak - self.baseline) / 2 ** 20
+
+
+def synthetic_body(users: int, piece: int = 64 * 1024):
+    buffer = []
+    size = 0
+    for i in range(users):
+        line = f'{{"login":"user{i}","password":"{FAKE_HASH}"}}\n'.encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= piece:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def call_asgi(method: str, path: str, body_pieces=(), on_body=None) -> None:
+    """
+    Drive lesson6.app directly over ASGI.
+    (TestClient reads whole request/response bodies into memory, which would hide the streaming.)
+    """
+    pieces = iter(body_pieces)
+    body_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            # like a real server: nothing more to read until the client goes away
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+        piece = next(pieces, None)
+        if piece is None:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": piece, "more_body": True}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            if on_body:
+                on_body(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", b"application/x-ndjson")], "client": ("bench", 0), "server": ("bench", 80),
+    }
+    await lesson6.app(scope, receive, send)
+
+
+def main(users: int, durable: bool) -> None:
+    if not durable:
+        lesson6.users_db = ShardedUserStore()
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        asyncio.run(call_asgi("POST", "/users/import", synthetic_body(users)))
+        elapsed = time.perf_counter() - start
+    imported = len(lesson6.users_db)
+    print(f"import: {imported:,} rows in {elapsed:.1f}s ({imported / elapsed:,.0f} rows/s), "
+          f"RSS grew {rss.growth_mb:,.0f} MB (this is mostly the users now held in memory)")
+
+    rows = 0
+
+    def count(piece: bytes) -> None:
+        nonlocal rows
+        rows += piece.count(b"\n")
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        asyncio.run(call_asgi("GET", "/users/export", on_body=count))
+        elapsed = time.perf_counter() - start
+    print(f"export: {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s), "
+          f"RSS grew {rss.growth_mb:,.1f} MB while streaming")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000_000)
+    parser.add_argument("--durable", action="store_true", help="import into the persistent lesson6 store")
+    args = parser.parse_args()
+    main(args.users, args.durable)
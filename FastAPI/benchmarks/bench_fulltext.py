@@ -0,0 +1,91 @@
+"""
+search_index.SearchIndex at scale: build time, memory and query latency.
+
+Generates --docs documents of 10-60 words drawn from a --vocabulary word list with a
+Zipf distribution (a few words are everywhere, most are rare, as in real text), indexes
+them, and times --queries searches of 1-3 words (also drawn by frequency, so many
+queries contain common words with huge posting lists). Reports p50/p99 latency for the
+first page (limit 10) and a deeper page (offset 100), the memory the index takes, and
+the cost of adding/removing documents afterwards.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_fulltext --docs 1000000
+"""
+
+import argparse
+import gc
+import random
+import resource
+import time
+
+from search_index import SearchIndex
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def corpus(docs: int, vocabulary: int, seed: int = 1):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocabulary)]
+    cumulative = []
+    total = 0.0
+    for rank in range(1, vocabulary + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    lengths = [rng.randint(10, 60) for _ in range(docs)]
+    tokens = rng.choices(words, cum_weights=cumulative, k=sum(lengths))
+    position = 0
+    for number, length in enumerate(lengths):
+        yield number, " ".join(tokens[position:position + length])
+        position += length
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 2] * 1000, ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+
+
+def main(docs: int, vocabulary: int, queries: int) -> None:
+    before = peak_rss_mb()
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.add_many(corpus(docs, vocabulary))
+    build = time.perf_counter() - start
+    gc.collect()
+    stats = index.stats()
+    print(f"{docs:,} documents, {stats['terms']:,} terms, {stats['postings']:,} postings, built in {build:.1f} s")
+    print(f"index: {stats['memory_bytes'] / 2 ** 20:.0f} MB ({stats['bytes_per_posting']} bytes per compressed posting),"
+          f" peak process memory +{peak_rss_mb() - before:.0f} MB (includes the generated text)")
+
+    rng = random.Random(2)
+    words = [f"w{int(vocabulary ** rng.random())}" for _ in range(queries * 3)]  # log-uniform: common and rare
+    batch = [" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(queries)]
+    for label, offset in (("limit 10", 0), ("offset 100", 100)):
+        latencies = []
+        for query in batch:
+            start = time.perf_counter()
+            index.search(query, limit=10, offset=offset)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = percentiles(latencies)
+        print(f"query {label:<11} p50 {p50:>7.2f} ms   p99 {p99:>7.2f} ms")
+
+    start = time.perf_counter()
+    for number in range(1000):
+        index.add(("new", number), "w1 w2 w3 fresh words for the index")
+    added = (time.perf_counter() - start) / 1000
+    start = time.perf_counter()
+    for number in range(0, docs, max(1, docs // 1000)):
+        index.remove(number)
+    removed = (time.perf_counter() - start) / 1000
+    print(f"add {added * 1e6:.0f} us/document, remove {removed * 1e6:.1f} us/document (no rebuild)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+    main(args.docs, args.vocabulary, args.queries)
@@ -0,0 +1,94 @@
+"""
+Store writes with lesson6's two secondary indexes attached (LoginIndex, FuzzyLoginIndex),
+from many threads, while other threads read the indexes.
+
+Compares the listeners the indexes use (ChangeQueue, change_queue.py: the writer only
+queues its change if the index lock is busy) with listeners that simply take the index
+lock, which makes writers of all shards wait for each other and for the readers.
+Also checks that both indexes end up with exactly the logins of the store.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_index_listeners --threads 16 --ops 5000 --readers 2
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fuzzy_index import FuzzyLoginIndex, TrigramIndex
+from login_index import LoginIndex
+from user_store import ShardedUserStore
+
+
+def locking_listener(index):
+    # what the indexes did before ChangeQueue: the index lock, taken under the shard lock
+    def listener(op, login, record):
+        if op == "delete":
+            index.discard(login)
+        elif op in ("create", "upsert"):
+            index.add(login)
+    return listener
+
+
+def attach(store, queued: bool):
+    if queued:
+        return LoginIndex(store), FuzzyLoginIndex(store)
+    sorted_index, fuzzy = LoginIndex(), TrigramIndex()
+    store.add_listener(locking_listener(sorted_index))
+    store.add_listener(locking_listener(fuzzy))
+    return sorted_index, fuzzy
+
+
+def run(threads: int, ops: int, readers: int, queued: bool) -> float:
+    store = ShardedUserStore(shards=16)
+    sorted_index, fuzzy = attach(store, queued)
+    done = threading.Event()
+
+    def writer(offset):
+        for i in range(ops):
+            login = f"user{offset:03d}x{i:06d}"
+            store.create(login, {"password": "x"})
+            if i % 3 == 0:
+                store.delete(login)
+
+    def reader():
+        while not done.is_set():
+            sorted_index.page("user", 100)
+            fuzzy.search("user001x000100", 1, 10)
+
+    reading = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in reading:
+        thread.start()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(writer, range(threads)))
+        elapsed = time.perf_counter() - start
+    finally:
+        done.set()
+        for thread in reading:
+            thread.join()
+
+    expected = sorted(login for login, _ in store.items())
+    assert sorted_index.page(None, len(expected) + 1) == expected, "LoginIndex differs from the store"
+    if queued:
+        assert len(fuzzy) == len(expected), "FuzzyLoginIndex differs from the store"
+    return threads * ops * 4 / 3 / elapsed  # creates + deletes per second
+
+
+def main(threads: int, ops: int, readers: int) -> None:
+    print(f"{threads} writer threads x {ops:,} creates (a third deleted again), {readers} reader threads\n")
+    print(f"{'listener':<24} {'writes/s':>10}")
+    for name, queued in (("index lock", False), ("ChangeQueue", True)):
+        print(f"{name:<24} {run(threads, ops, readers, queued):>10,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=2)
+    args = parser.parse_args()
+    main(args.threads, args.ops, args.readers)
@@ -0,0 +1,117 @@
+"""
+JSON response micro-benchmarks for lessons 1-7: create_app() (app_factory.py) vs plain FastAPI().
+
+Every lesson module is imported twice: once as it is (create_app) and once with
+create_app swapped for FastAPI, so both apps have exactly the same routes.
+For each endpoint the same GET request is sent --requests times straight to the
+ASGI app (no network) and the average time per request is printed.
+
+A second table times only the encoding step: jsonable_encoder + JSONResponse vs
+FastJSONResponse, for values shaped like the lessons' answers.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_json --requests 5000
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import tempfile
+import time
+import timeit
+
+os.environ.setdefault("LESSON6_DATA_DIR", tempfile.mkdtemp(prefix="lesson6-bench-"))
+
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import app_factory
+from app_factory import FastJSONResponse
+
+ENDPOINTS = {
+    "lesson1": ["/"],
+    "lesson2": ["/", "/about"],
+    "lesson3": ["/", "/kedar", "/addint/3/4"],
+    "lesson5": ["/?id=Kedar", "/sum?a=45&b=45", "/search?q=python"],
+    "lesson6": ["/users?limit=100", "/audit_stats"],
+    "lesson7": ["/user"],
+}
+
+
+def scope_for(target: str) -> dict:
+    path, _, query = target.partition("?")
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+        "headers": [], "client": ("bench", 0), "server": ("bench", 80),
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def per_request_us(app, target: str, requests: int) -> float:
+    for _ in range(min(100, requests)):  # warm up
+        await app(scope_for(target), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope_for(target), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def both_apps(name: str):
+    module = importlib.import_module(name)
+    fast = module.app
+    create_app = app_factory.create_app
+    app_factory.create_app = lambda **kwargs: FastAPI(**kwargs)
+    try:
+        if name == "lesson6":
+            module.audit.close()
+            os.environ["LESSON6_DATA_DIR"] = tempfile.mkdtemp(prefix="lesson6-bench-")
+        plain = importlib.reload(module).app
+    finally:
+        app_factory.create_app = create_app
+    return plain, fast
+
+
+def encoding_table() -> None:
+    from lesson7 import PublicUser
+    values = {
+        "small dict": {"data": "Kedar Damale"},
+        "list of 100 dicts": {"users": [{"login": f"user{i}", "id": i} for i in range(100)], "next": None},
+        "model": PublicUser(id=1, name="Kedar", email="kedar@example.com"),
+    }
+    print(f"\n{'encoding only':<22}{'JSONResponse':>16}{'FastJSONResponse':>20}")
+    for label, value in values.items():
+        n = 20_000
+        plain = timeit.timeit(lambda: JSONResponse(jsonable_encoder(value)), number=n) / n * 1e6
+        fast = timeit.timeit(lambda: FastJSONResponse(value), number=n) / n * 1e6
+        print(f"{label:<22}{plain:>13,.1f} us{fast:>17,.1f} us")
+
+
+def main(requests: int) -> None:
+    print(f"JSON encoder: {'orjson' if app_factory.orjson else 'pydantic-core'}")
+    print(f"{'endpoint':<30}{'FastAPI()':>14}{'create_app()':>16}")
+    for name, targets in ENDPOINTS.items():
+        plain, fast = both_apps(name)
+        for target in targets:
+            plain_us = asyncio.run(per_request_us(plain, target, requests))
+            fast_us = asyncio.run(per_request_us(fast, target, requests))
+            print(f"{name + ' ' + target:<30}{plain_us:>11,.1f} us{fast_us:>13,.1f} us  "
+                  f"({(plain_us - fast_us) / plain_us:+.0%})")
+    encoding_table()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.requests)
@@ -0,0 +1,91 @@
+"""
+Cost of keeping loop_monitor.LoopMonitor always on, and what it reports for a blocking handler.
+
+Times --requests calls to a tiny `async def` endpoint on an app without and with the
+monitor (middleware + heartbeat + watchdog thread), then calls an endpoint that does
+time.sleep(--block) inside `async def` and prints the stall the monitor recorded.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_loop_monitor --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from loop_monitor import LoopMonitor
+
+
+def build_app(monitor: LoopMonitor = None, block: float = 0.3) -> FastAPI:
+    app = FastAPI()
+    if monitor is not None:
+        monitor.install(app)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/blocking")
+    async def blocking():
+        time.sleep(block)  # the bug the monitor is for
+        return {"ok": True}
+
+    return app
+
+
+async def call(app, path: str) -> None:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "client": ("bench", 0), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def per_request_us(app, requests: int) -> float:
+    await call(app, "/ping")
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, "/ping")
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def stall_demo(app, monitor: LoopMonitor) -> None:
+    await call(app, "/ping")
+    await asyncio.sleep(0.05)
+    await call(app, "/blocking")
+    await asyncio.sleep(monitor.interval * 3)  # let the heartbeat see the loop is back
+
+
+def main(requests: int, block: float) -> None:
+    without = asyncio.run(per_request_us(build_app(), requests))
+    monitor = LoopMonitor()
+    with_monitor = asyncio.run(per_request_us(build_app(monitor), requests))
+    print(f"without monitor {without:>8.1f} us/request")
+    print(f"with monitor    {with_monitor:>8.1f} us/request   ({(with_monitor - without) / without:+.1%})")
+
+    monitor = LoopMonitor()
+    asyncio.run(stall_demo(build_app(monitor, block), monitor))
+    stats = monitor.stats()
+    print(f"\nstalls: {stats['routes']}")
+    for stall in stats["recent"][:1]:
+        print(f"{stall['route']} blocked the loop for {stall['ms']} ms at:")
+        print("\n".join((stall["stack"] or ["(no stack captured)"])[-2:]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--block", type=float, default=0.3)
+    args = parser.parse_args()
+    main(args.requests, args.block)
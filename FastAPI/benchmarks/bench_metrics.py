@@ -0,0 +1,82 @@
+"""
+Cost of metrics.MetricsMiddleware per request, and of rendering /metrics.
+
+Times --requests calls to a small `async def` endpoint with a path parameter on a plain
+FastAPI() app and on the same app with the metrics middleware. Then fills a registry
+with --routes routes (as many recorded requests each as --requests / 10) and times render().
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import FastAPI
+
+from metrics import MetricsMiddleware, MetricsRegistry
+
+
+def build_app(registry: MetricsRegistry = None) -> FastAPI:
+    app = FastAPI()
+    if registry is not None:
+        app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/users/{login}")
+    async def user(login: str):
+        return {"login": login}
+
+    return app
+
+
+async def per_request_us(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/users/kedar", "raw_path": b"/users/kedar", "root_path": "",
+        "query_string": b"", "headers": [], "client": ("bench", 0), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main(requests: int, routes: int) -> None:
+    # alternate and keep the best of 5, the difference is small next to the noise of one run
+    without, with_metrics = [], []
+    for _ in range(5):
+        without.append(asyncio.run(per_request_us(build_app(), requests)))
+        with_metrics.append(asyncio.run(per_request_us(build_app(MetricsRegistry()), requests)))
+    without, with_metrics = min(without), min(with_metrics)
+    print(f"without metrics {without:>8.1f} us/request")
+    print(f"with metrics    {with_metrics:>8.1f} us/request   ({with_metrics - without:+.1f} us)")
+
+    registry = MetricsRegistry()
+    random.seed(1)
+    for i in range(routes):
+        for _ in range(max(1, requests // 10)):
+            registry.record(f"/api/svc{i}/{{id}}", "GET", random.choice((200, 200, 200, 404)),
+                            random.lognormvariate(-5, 1), random.randint(50, 50_000))
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"\nrender, {routes} routes: {(time.perf_counter() - start) * 1000:.1f} ms, {len(text) / 1024:.0f} KB"
+          f" (on the threadpool, requests keep going meanwhile)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--routes", type=int, default=100)
+    args = parser.parse_args()
+    main(args.requests, args.routes)
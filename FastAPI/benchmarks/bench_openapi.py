@@ -0,0 +1,101 @@
+"""
+First /openapi.json for a big app: FastAPI building the schema vs openapi_cache.OpenAPICache.
+
+Builds an app with --routes routes, each with its own body and response models, and times
+what a fresh worker pays for its first /openapi.json request:
+
+    FastAPI             app.openapi() (the schema is built) + JSONResponse encoding
+    cache, first start  fingerprint + build + gzip + write the files (once per deploy)
+    cache, later starts fingerprint + mmap the files that are already there
+
+and then the cost of every following request (FastAPI keeps the schema, but encodes it
+again each time; the cache sends the same bytes).
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_openapi --routes 500
+"""
+
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI
+from pydantic import BaseModel, create_model
+
+from openapi_cache import OpenAPICache
+
+
+def build_app(routes: int, cache_dir: Optional[str] = None) -> FastAPI:
+    app = FastAPI()
+    if cache_dir:
+        OpenAPICache(app, cache_dir).install()
+    for i in range(routes):
+        item = create_model(f"Item{i}", name=(str, ...), price=(float, ...), tags=(List[str], []))
+        order = create_model(f"Order{i}", id=(int, ...), items=(List[item], ...), note=(Optional[str], None))
+
+        def endpoint(order_id: int, body: BaseModel, verbose: bool = False):
+            return body
+
+        endpoint.__annotations__["body"] = order
+        app.post(f"/api/svc{i}/orders/{{order_id}}", response_model=order, name=f"order{i}")(endpoint)
+    return app
+
+
+async def get_openapi(app, headers) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/openapi.json", "raw_path": b"/openapi.json", "root_path": "",
+        "query_string": b"", "headers": headers, "client": ("bench", 0), "server": ("bench", 80),
+    }
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message["body"])
+
+    await app(scope, receive, send)
+    return size
+
+
+def timed(app, headers=(), requests: int = 1):
+    start = time.perf_counter()
+    for _ in range(requests):
+        size = asyncio.run(get_openapi(app, list(headers)))
+    return (time.perf_counter() - start) / requests * 1000, size
+
+
+def main(routes: int, requests: int) -> None:
+    gzip_header = [(b"accept-encoding", b"gzip")]
+    cache_dir = tempfile.mkdtemp(prefix="openapi-bench-")
+    try:
+        app = build_app(routes)
+        first, size = timed(app)
+        again, _ = timed(app, requests=requests)
+        print(f"FastAPI             first {first:>9.1f} ms   then {again:>8.3f} ms/request   {size / 1024:>8.1f} KB")
+
+        first, size = timed(build_app(routes, cache_dir), gzip_header)
+        print(f"cache, first start  first {first:>9.1f} ms", end="")
+        app = build_app(routes, cache_dir)  # another worker, the files are there now
+        first, size = timed(app, gzip_header)
+        again, _ = timed(app, gzip_header, requests)
+        print(f"\ncache, later starts first {first:>9.1f} ms   then {again:>8.3f} ms/request   {size / 1024:>8.1f} KB gzip")
+        again, size = timed(app, requests=requests)
+        print(f"{'':<35} then {again:>8.3f} ms/request   {size / 1024:>8.1f} KB plain")
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    main(args.routes, args.requests)
@@ -0,0 +1,52 @@
+"""
+Login throughput of the hashed-password check (passwords.py) at several scrypt costs.
+
+For each cost setting it measures:
+  - cold logins: every login is a different user, so every one is hashed in the process pool
+  - burst logins: the same few users log in again and again, served by the verified-login cache
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_password --logins 200 --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+
+from passwords import PasswordHasher, hash_password
+
+
+async def measure(hasher: PasswordHasher, users, logins: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        login, stored = users[i % len(users)]
+        async with semaphore:
+            assert await hasher.verify(login, "secret", stored)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(logins)))
+    return logins / (time.perf_counter() - start)
+
+
+async def main(logins: int, workers: int, concurrency: int) -> None:
+    for n in (2 ** 12, 2 ** 14, 2 ** 15):
+        hasher = PasswordHasher(n=n, workers=workers)
+        users = [(f"user{i}", hash_password("secret", n=n)) for i in range(logins)]
+        await hasher.hash("warm up")  # start the pool outside the timing
+
+        cold = await measure(hasher, users, logins, concurrency)
+        burst = await measure(hasher, users[:10], logins * 20, concurrency)
+        print(f"n=2**{n.bit_length() - 1:<3} cold: {cold:>10,.0f} logins/s   "
+              f"burst (cached): {burst:>10,.0f} logins/s   cache hits={hasher.cache_hits}")
+        hasher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.workers, args.concurrency))
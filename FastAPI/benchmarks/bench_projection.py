@@ -0,0 +1,139 @@
+"""
+Per-request latency of response_model filtering (projection.py) for big nested models.
+
+The handler returns an internal user with N addresses (each with a private field)
+and response_model is the public version of both models, like lesson7's
+InternalUser -> PublicUser. Three apps serve the same route:
+
+    FastAPI()                               validates into the response model, then writes JSON
+    create_app(strict_responses=True)       same, strict mode
+    create_app()                            projection plan: writes the allowed fields directly
+
+Before timing, check_parity() makes sure create_app() answers exactly like FastAPI() for
+response models that projection must not shortcut (constraints, Annotated serializers).
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_projection --requests 2000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Annotated, List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, Field, PlainSerializer
+
+from app_factory import create_app
+
+
+class InternalAddress(BaseModel):
+    street: str
+    city: str
+    zip: str
+    geo_hash: str  # internal only
+
+
+class PublicAddress(BaseModel):
+    street: str
+    city: str
+    zip: str
+
+
+class InternalUser(BaseModel):
+    id: int
+    name: str
+    email: str
+    password: str
+    addresses: List[InternalAddress]
+    tags: List[str]
+
+
+class PublicUser(BaseModel):
+    id: int
+    name: str
+    email: str
+    addresses: List[PublicAddress]
+    tags: List[str]
+
+
+class Source(BaseModel):
+    name: str
+    score: float
+
+
+class ShortName(BaseModel):  # max_length is checked by FastAPI: "abcdefgh" is a 500
+    name: str = Field(max_length=3)
+
+
+class RoundedScore(BaseModel):  # the serializer of the response model must run
+    score: Annotated[float, PlainSerializer(round)]
+
+
+def check_parity() -> None:
+    source = Source(name="abcdefgh", score=1.7)
+    for model in (ShortName, RoundedScore):
+        answers = []
+        for app in (FastAPI(), create_app(metrics=False)):
+            @app.get("/item", response_model=model)
+            def item() -> Source:
+                return source
+            response = TestClient(app, raise_server_exceptions=False).get("/item")
+            answers.append((response.status_code, response.content))
+        assert answers[0] == answers[1], (model.__name__, answers)
+
+
+def make_app(app: FastAPI, user: InternalUser) -> FastAPI:
+    @app.get("/user", response_model=PublicUser)
+    async def get_user() -> InternalUser:
+        return user
+    return app
+
+
+async def per_request_us(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/user", "raw_path": b"/user", "root_path": "", "query_string": b"",
+        "headers": [], "client": ("bench", 0), "server": ("bench", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    elapsed = (time.perf_counter() - start) / requests * 1e6
+    assert b"geo_hash" not in body[0] and b"password" not in body[0]
+    return elapsed
+
+
+def main(requests: int, sizes: List[int]) -> None:
+    check_parity()
+    print(f"{'addresses':>10}{'FastAPI()':>14}{'strict':>14}{'projection':>14}")
+    for size in sizes:
+        user = InternalUser(
+            id=1, name="Kedar", email="kedar@example.com", password="secret", tags=[f"tag{i}" for i in range(10)],
+            addresses=[InternalAddress(street=f"{i} Main St", city="Pune", zip="411001", geo_hash="tdr1y")
+                       for i in range(size)])
+        count = max(20, requests // max(1, size // 10))
+        results = [asyncio.run(per_request_us(make_app(app, user), count))
+                   for app in (FastAPI(), create_app(strict_responses=True), create_app())]
+        print(f"{size:>10}" + "".join(f"{us:>11,.1f} us" for us in results)
+              + f"   ({(results[0] - results[2]) / results[0]:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+    main(args.requests, args.sizes)
@@ -0,0 +1,93 @@
+"""
+query_cache.QueryCache in front of a search index: hit ratio and latency on skewed traffic.
+
+Indexes --docs generated documents (see bench_fulltext), then replays --queries searches
+where --hot-share of the traffic picks from a few hundred popular queries (Zipf: the first
+is asked most) and the rest are one-off queries. The same stream is run with no cache,
+with a plain LRU and with W-TinyLFU, both limited to --max-kb. Last, --threads threads
+miss the same key at once, to show single-flight computing it only once.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_query_cache --docs 100000
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from query_cache import QueryCache
+from search_index import SearchIndex, tokenize
+
+from benchmarks.bench_fulltext import corpus, percentiles
+
+
+def stream(queries: int, vocabulary: int, hot_share: float, seed: int = 3):
+    rng = random.Random(seed)
+
+    def query():
+        return " ".join(f"w{int(vocabulary ** rng.random())}" for _ in range(rng.randint(1, 3)))
+
+    hot = [query() for _ in range(500)]
+    weights = [1 / rank for rank in range(1, len(hot) + 1)]
+    return [rng.choices(hot, weights)[0] if rng.random() < hot_share else query() for _ in range(queries)]
+
+
+def replay(index: SearchIndex, batch, cache: QueryCache = None):
+    latencies = []
+    for q in batch:
+        start = time.perf_counter()
+        if cache is None:
+            index.search(q, limit=10)
+        else:
+            key = (" ".join(sorted(set(tokenize(q)))), 10, 0)
+            cache.get_or_compute(key, lambda: index.search(q, limit=10))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(docs: int, vocabulary: int, queries: int, hot_share: float, max_kb: int, threads: int) -> None:
+    index = SearchIndex()
+    index.add_many(corpus(docs, vocabulary))
+    batch = stream(queries, vocabulary, hot_share)
+    print(f"{docs:,} documents, {queries:,} queries, {hot_share:.0%} of them from 500 popular ones,"
+          f" cache {max_kb} KB\n")
+    for label, cache in (("no cache", None),
+                         ("LRU", QueryCache(max_bytes=max_kb * 1024, window_ratio=1.0)),
+                         ("W-TinyLFU", QueryCache(max_bytes=max_kb * 1024))):
+        latencies = replay(index, batch, cache)
+        p50, p99 = percentiles(latencies)
+        line = f"{label:<10} mean {sum(latencies) / len(latencies) * 1000:>6.2f} ms  p50 {p50:>6.2f} ms  p99 {p99:>7.2f} ms"
+        if cache is not None:
+            stats = cache.stats()
+            line += (f"  hit ratio {stats['hit_ratio']:.1%}, {stats['entries']} entries in {stats['bytes'] / 1024:.0f} KB,"
+                     f" {stats['evictions'] + stats['rejections']} evicted/rejected")
+        print(line)
+
+    cache, computations = QueryCache(), []
+
+    def slow_search():
+        computations.append(1)
+        time.sleep(0.05)
+        return index.search("w1 w2", limit=10)
+
+    workers = [threading.Thread(target=cache.get_or_compute, args=("w1 w2", slow_search)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(f"\nsingle-flight: {threads} concurrent misses on one key -> {len(computations)} computation,"
+          f" {cache.stats()['coalesced']} requests waited for it")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--hot-share", type=float, default=0.7)
+    parser.add_argument("--max-kb", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+    main(args.docs, args.vocabulary, args.queries, args.hot_share, args.max_kb, args.threads)
@@ -0,0 +1,97 @@
+"""
+Mixed read/write benchmark for the lesson6 store read path.
+
+Reader threads do what validate_user does (look a login up, compare the stored
+credential) while one writer thread updates users at a fixed rate. Read latency
+p50/p99 is reported for increasing write rates and three store setups:
+
+    locked reads    reads take the shard lock (what we don't want)
+    in-place        default ShardedUserStore, lock-free dict reads
+    copy-on-write   read-optimized mode, readers use the published shard snapshot
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_read_path --users 100000 --readers 4
+"""
+
+import argparse
+import hmac
+import random
+import threading
+import time
+
+from user_store import ShardedUserStore
+
+
+class LockedReadStore(ShardedUserStore):
+    def get(self, login):
+        shard = self._shard(login)
+        with shard.lock:
+            return shard.data.get(login)
+
+
+def run(store, users: int, readers: int, reads: int, write_rate: int):
+    stop = threading.Event()
+
+    def writer():
+        rng = random.Random(1)
+        interval = 1 / write_rate if write_rate else None
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            if interval is None:
+                stop.wait(0.01)
+                continue
+            store.update(f"user{rng.randrange(users)}", {"password": str(rng.random())})
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    latencies = []
+
+    def reader(seed):
+        rng = random.Random(seed)
+        local = []
+        for _ in range(reads):
+            login = f"user{rng.randrange(users)}"
+            start = time.perf_counter()
+            record = store.get(login)
+            hmac.compare_digest(record["password"], "guess")
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    writer_thread.join()
+
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1e6, latencies[int(len(latencies) * 0.99)] * 1e6
+
+
+def main(users: int, readers: int, reads: int) -> None:
+    seed = {f"user{i}": {"password": "x"} for i in range(users)}
+    setups = [
+        ("locked reads", lambda: LockedReadStore(seed, shards=16)),
+        ("in-place", lambda: ShardedUserStore(seed, shards=16)),
+        ("copy-on-write", lambda: ShardedUserStore(seed, shards=256, copy_on_write=True)),
+    ]
+    for write_rate in (0, 100, 1000, 5000):
+        for name, make in setups:
+            p50, p99 = run(make(), users, readers, reads, write_rate)
+            print(f"writes/s={write_rate:<5} {name:<14} read p50 {p50:6.2f} us   p99 {p99:8.2f} us")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--reads", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.users, args.readers, args.reads)
@@ -0,0 +1,58 @@
+"""
+Recovery-time benchmark for the persistent lesson6 store (durable_store.py).
+
+1. seeds a store with --users accounts (written as the first snapshot)
+2. writes --tail more changes from many threads (group-committed into the log)
+3. closes it and measures how long a cold start takes (snapshot + log replay)
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_recovery --users 1000000 --tail 20000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from durable_store import DurableUserStore
+
+
+def main(users: int, tail: int, threads: int) -> None:
+    directory = tempfile.mkdtemp(prefix="lesson6-recovery-")
+    try:
+        seed = {f"user{i}": {"password": f"pw{i}"} for i in range(users)}
+
+        start = time.perf_counter()
+        store = DurableUserStore(directory, seed, snapshot_every=10 * (users + tail))
+        print(f"seed + snapshot of {users:,} users: {time.perf_counter() - start:.2f}s")
+        del seed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda i: store.update(f"user{i}", {"password": "changed"}), range(tail)))
+        elapsed = time.perf_counter() - start
+        print(f"log tail: {tail:,} group-committed updates from {threads} threads "
+              f"in {elapsed:.2f}s ({tail / elapsed:,.0f} writes/s)")
+        store.close()
+        del store
+
+        start = time.perf_counter()
+        recovered = DurableUserStore(directory)
+        elapsed = time.perf_counter() - start
+        assert len(recovered) == users
+        assert tail == 0 or recovered.get("user0") == {"password": "changed"}
+        print(f"cold start: {len(recovered):,} users recovered in {elapsed:.3f}s")
+        recovered.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=20_000)
+    parser.add_argument("--threads", type=int, default=64)
+    args = parser.parse_args()
+    main(args.users, args.tail, args.threads)
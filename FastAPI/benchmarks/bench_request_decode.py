@@ -0,0 +1,146 @@
+"""
+Request body decoding per model: FastAPI's json.loads + validate vs body_decoder's validate_json.
+
+Models: lesson6's User, the nested User/Address schema from lesson8's notes, and that
+User with --addresses addresses (a bigger body). For each one:
+
+  - decode only: what FastAPI does with the body bytes (json.loads, then validating the
+    dict through the route's body field) vs what BodyDecoder does (the model's compiled
+    validator on the bytes, then the same body field check on the finished model)
+  - whole request: POST to a `create_app()` endpoint taking the model, without and with
+    fast_request_bodies, called straight as an ASGI app (no network)
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_request_decode --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+os.environ.setdefault("LESSON6_DATA_DIR", tempfile.mkdtemp(prefix="lesson6-bench-"))
+
+from pydantic import BaseModel
+
+from app_factory import create_app
+from body_decoder import BodyDecoder
+from lesson6 import User
+
+
+# the schemas of lesson8's notes
+class Address(BaseModel):
+    city: str
+    pincode: int
+
+
+class NestedUser(BaseModel):
+    name: str
+    email: str
+    age: Optional[int] = None
+    is_active: bool = True
+    address: Address
+
+
+class UserWithAddresses(BaseModel):
+    name: str
+    email: str
+    age: Optional[int] = None
+    is_active: bool = True
+    addresses: List[Address]
+
+
+def bodies(addresses: int):
+    address = {"city": "Pune", "pincode": 411001}
+    return [
+        ("lesson6 User", User, {"login": "kedard", "password": "1234", "xyz": True}),
+        ("lesson8 User + Address", NestedUser, {"name": "Kedar", "email": "kedar@example.com", "age": 25, "address": address}),
+        (f"User + {addresses} addresses", UserWithAddresses,
+         {"name": "Kedar", "email": "kedar@example.com", "age": 25, "addresses": [address] * addresses}),
+    ]
+
+
+def build_app(model, fast: bool):
+    app = create_app(metrics=False, fast_request_bodies=fast)
+
+    @app.post("/create")
+    async def create(u: model):
+        return {"ok": True}
+
+    return app
+
+
+def per_call_us(function, repeat: int) -> float:
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def per_request_us(app, body: bytes, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/create", "raw_path": b"/create", "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("bench", 0), "server": ("bench", 80),
+    }
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+
+    async def call():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                await asyncio.Future()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await app(dict(scope), receive, send)
+
+    await call()
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main(requests: int, addresses: int) -> None:
+    print(f"{'model':<26} {'body':>7}   {'decode: FastAPI':>15} {'fast':>7}    {'request: FastAPI':>16} {'fast':>7}")
+    for label, model, value in bodies(addresses):
+        body = json.dumps(value).encode()
+        route = build_app(model, fast=False).routes[-1]
+        field = route.body_field
+        decoder = BodyDecoder.for_route(route)
+        assert decoder is not None, label
+
+        def fastapi_decode():
+            validated, errors = field.validate(json.loads(body), {}, loc=("body",))
+            assert not errors
+
+        def fast_decode():
+            validated, errors = field.validate(decoder._validate_json(body), {}, loc=("body",))
+            assert not errors
+
+        repeat = max(1000, requests * 5)
+        slow_us, fast_us = per_call_us(fastapi_decode, repeat), per_call_us(fast_decode, repeat)
+        slow_request = asyncio.run(per_request_us(build_app(model, fast=False), body, requests))
+        fast_request = asyncio.run(per_request_us(build_app(model, fast=True), body, requests))
+        print(f"{label:<26} {len(body):>5} B   {slow_us:>12.1f} us {fast_us:>5.1f} us"
+              f"    {slow_request:>13.1f} us {fast_request:>5.1f} us   ({(fast_request - slow_request) / slow_request:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--addresses", type=int, default=50)
+    args = parser.parse_args()
+    main(args.requests, args.addresses)
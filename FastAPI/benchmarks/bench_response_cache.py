@@ -0,0 +1,95 @@
+"""
+Requests/sec for lesson3's /{id}/data with and without the response cache (response_cache.py).
+
+Three runs over the same data:
+
+    uncached   a copy of the old handler: look up the dict, FastAPI encodes the JSON every time
+    cached     lesson3's handler: pre-encoded bytes + ETag
+    304        lesson3's handler with a matching If-None-Match, so no body is sent
+
+--payload-kb makes every `data` value that big (the lesson's strings are a few bytes, real
+responses are bigger and that is where skipping the encoding pays off).
+Requests go straight to the ASGI app, one after the other, so no network cost is included.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_response_cache --requests 20000 --payload-kb 16
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+import lesson3
+
+
+def uncached_app(data) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/{id}/data')
+    def fetch_data_from_id(id):
+        return data.get(id).get('data')
+
+    return app
+
+
+def scope_for(path: str, headers) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": headers, "client": ("bench", 0), "server": ("bench", 80),
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def run(app, paths, headers) -> float:
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for path in paths:
+        await app(scope_for(path, headers), receive, send)
+    return len(paths) / (time.perf_counter() - start)
+
+
+async def fetch_etag(app, path: str) -> bytes:
+    etag = None
+
+    async def send(message):
+        nonlocal etag
+        if message["type"] == "http.response.start":
+            etag = dict(message["headers"])[b"etag"]
+
+    await app(scope_for(path, []), receive, send)
+    return etag
+
+
+def main(requests: int, payload_kb: int) -> None:
+    data = lesson3.data
+    if payload_kb:
+        for id in list(data):
+            data[id] = {'data': [f"item {i} of id {id}" for i in range(payload_kb * 1024 // 20)],
+                        'comments': data[id]['comments']}
+    paths = [f"/{(i % len(data)) + 1}/data" for i in range(requests)]
+    etag = asyncio.run(fetch_etag(lesson3.app, "/1/data"))
+
+    uncached = asyncio.run(run(uncached_app(data), paths, []))
+    cached = asyncio.run(run(lesson3.app, paths, []))
+    not_modified = asyncio.run(run(lesson3.app, ["/1/data"] * requests, [(b"if-none-match", etag)]))
+    print(f"uncached   {uncached:>10,.0f} req/s")
+    print(f"cached     {cached:>10,.0f} req/s  ({cached / uncached:.1f}x)")
+    print(f"304        {not_modified:>10,.0f} req/s  ({not_modified / uncached:.1f}x)")
+    print(f"cache hits {lesson3.data_cache.hits:,}, misses {lesson3.data_cache.misses:,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--payload-kb", type=int, default=16)
+    args = parser.parse_args()
+    main(args.requests, args.payload_kb)
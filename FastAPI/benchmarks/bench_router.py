@@ -0,0 +1,91 @@
+"""
+Route lookup latency: FastAPI's default router vs radix_router.RadixRouter.
+
+Registers --routes routes (groups of four shapes like /api/svc17, /api/svc17/{id},
+/api/svc17/{id}/items, /api/svc17/{id}/items/{item:int}) on two apps, then times
+only the matching step (no handler runs) for requests aimed at the first, middle
+and last registered routes, random routes and a path that matches nothing.
+Also reports how long the radix tree takes to build.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_router --routes 5000
+"""
+
+import argparse
+import random
+import time
+
+from fastapi import FastAPI
+from starlette.routing import Match
+
+from radix_router import use_radix_router
+
+
+def build_app(groups: int) -> FastAPI:
+    app = FastAPI()
+
+    def endpoint():
+        return None
+
+    for i in range(groups):
+        app.get(f"/api/svc{i}")(endpoint)
+        app.get(f"/api/svc{i}/{{id}}")(endpoint)
+        app.get(f"/api/svc{i}/{{id}}/items")(endpoint)
+        app.get(f"/api/svc{i}/{{id}}/items/{{item:int}}")(endpoint)
+    return app
+
+
+def scope_for(path: str) -> dict:
+    return {"type": "http", "method": "GET", "path": path, "root_path": "", "query_string": b"", "headers": []}
+
+
+def linear_match(router, scope):
+    # what the default router does for every request
+    for route in router.routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route, child_scope
+    return None
+
+
+def timed(paths, lookup) -> float:
+    scopes = [scope_for(path) for path in paths]
+    start = time.perf_counter()
+    for scope in scopes:
+        lookup(scope)
+    return (time.perf_counter() - start) / len(scopes) * 1e6
+
+
+def main(routes: int, lookups: int) -> None:
+    groups = max(1, routes // 4)
+    default = build_app(groups)
+    radix = build_app(groups)
+    router = use_radix_router(radix)
+    start = time.perf_counter()
+    problems = router.compile()
+    print(f"{len(radix.routes):,} routes, radix tree built in {(time.perf_counter() - start) * 1e3:.0f} ms, "
+          f"{len(problems)} conflicts/shadowed routes")
+
+    rng = random.Random(1)
+    cases = {
+        "first route": ["/api/svc0"] * lookups,
+        "middle route": [f"/api/svc{groups // 2}/42/items"] * lookups,
+        "last route": [f"/api/svc{groups - 1}/42/items/7"] * lookups,
+        "random routes": [f"/api/svc{rng.randrange(groups)}/42/items/7" for _ in range(lookups)],
+        "no match (404)*": ["/nothing/here"] * lookups,
+    }
+    print(f"{'':<16}{'default':>14}{'radix':>14}")
+    for label, paths in cases.items():
+        default_us = timed(paths, lambda scope: linear_match(default.router, scope))
+        radix_us = timed(paths, router.match)
+        print(f"{label:<16}{default_us:>11,.1f} us{radix_us:>11,.1f} us")
+    print("* a request the tree can't answer is then handed to the default router (404, 405, slash redirect)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+    main(args.routes, args.lookups)
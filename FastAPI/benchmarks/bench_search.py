@@ -0,0 +1,71 @@
+"""
+Latency of the lesson6 login search indexes (prefix: login_index.py, fuzzy: fuzzy_index.py).
+
+Builds both indexes over --logins random logins and reports build time plus
+p50/p99 query latency for prefix lookups and for fuzzy lookups at edit distance 1 and 2.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_search --logins 1000000
+"""
+
+import argparse
+import random
+import string
+import time
+
+from fuzzy_index import TrigramIndex
+from login_index import LoginIndex
+
+ALPHABET = string.ascii_lowercase + string.digits
+
+
+def random_login(rng: random.Random) -> str:
+    return "".join(rng.choices(ALPHABET, k=rng.randint(5, 12)))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def timed(label: str, queries, run) -> None:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        samples.append(time.perf_counter() - start)
+    p50, p99 = percentiles(samples)
+    print(f"{label:<22} p50 {p50:>10,.0f} us   p99 {p99:>10,.0f} us   ({len(samples)} queries)")
+
+
+def typo(rng: random.Random, login: str) -> str:
+    i = rng.randrange(len(login))
+    return login[:i] + rng.choice(ALPHABET) + login[i + 1:]
+
+
+def main(count: int, queries: int) -> None:
+    rng = random.Random(42)
+    logins = list({random_login(rng) for _ in range(count)})
+
+    start = time.perf_counter()
+    sorted_index = LoginIndex()
+    sorted_index._load(sorted(logins))
+    print(f"sorted index build:  {time.perf_counter() - start:.1f}s for {len(logins):,} logins")
+    start = time.perf_counter()
+    trigram_index = TrigramIndex(logins)
+    print(f"trigram index build: {time.perf_counter() - start:.1f}s")
+
+    samples = rng.sample(logins, queries)
+    timed("prefix (3 chars)", [login[:3] for login in samples], lambda q: sorted_index.starting_with(q, 20))
+    timed("fuzzy, distance 1", [typo(rng, login) for login in samples], lambda q: trigram_index.search(q, 1, 20))
+    timed("fuzzy, distance 2", [typo(rng, login) for login in samples[:max(1, queries // 5)]],
+          lambda q: trigram_index.search(q, 2, 20))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    main(args.logins, args.queries)
@@ -0,0 +1,103 @@
+"""
+Additions per second: one per request (lesson5 /sum, lesson3 /addint) vs POST /sum:batch.
+
+Adds --pairs pairs of numbers: one GET request each through /sum?a=..&b=.. and
+/addint/{a}/{b} (only --scalar-requests of them are timed, the rate is what matters),
+then all of them in one POST /sum:batch as JSON and as raw int64. The apps are called
+directly as ASGI apps, so the numbers leave out the network and the server, which would
+make the scalar routes look even worse.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_sum_batch --pairs 1000000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy
+
+import lesson3
+import lesson5
+
+
+async def call(app, method: str, path: str, query: bytes = b"", body: bytes = b"", content_type: bytes = b""):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        "client": ("bench", 0), "server": ("bench", 80),
+    }
+    received, chunks, status = False, [], None
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.Future()  # the client stays connected (StreamingResponse listens for a disconnect)
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    assert status == 200, (path, status, b"".join(chunks)[:200])
+    return b"".join(chunks)
+
+
+async def scalar_rate(app, requests: int, path_for) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        path, query = path_for(i)
+        await call(app, "GET", path, query)
+    return requests / (time.perf_counter() - start)
+
+
+def report(name: str, rate: float, baseline: float) -> None:
+    print(f"{name:<40} {rate:>14,.0f} additions/s   x{rate / baseline:,.0f}")
+
+
+async def run(pairs: int, scalar_requests: int) -> None:
+    a = numpy.arange(pairs, dtype="<i8")
+    b = numpy.arange(pairs, dtype="<i8")[::-1].copy()
+    expected = a + b
+
+    sum_rate = await scalar_rate(lesson5.app, scalar_requests, lambda i: ("/sum", f"a={i}&b={i}".encode()))
+    addint_rate = await scalar_rate(lesson3.app, scalar_requests, lambda i: (f"/addint/{i}/{i}", b""))
+
+    json_body = body = json.dumps({"a": a.tolist(), "b": b.tolist()}).encode()
+    start = time.perf_counter()
+    answer = await call(lesson5.app, "POST", "/sum:batch", body=body, content_type=b"application/json")
+    json_rate = pairs / (time.perf_counter() - start)
+    assert json.loads(answer)["sum"] == expected.tolist()
+
+    body = a.tobytes() + b.tobytes()
+    start = time.perf_counter()
+    answer = await call(lesson5.app, "POST", "/sum:batch", body=body, content_type=b"application/octet-stream")
+    raw_rate = pairs / (time.perf_counter() - start)
+    assert (numpy.frombuffer(answer, dtype="<i8") == expected).all()
+
+    print(f"{pairs:,} additions ({scalar_requests:,} timed for the one-per-request routes)\n")
+    report("GET /sum (lesson5), one per request", sum_rate, sum_rate)
+    report("GET /addint (lesson3), one per request", addint_rate, sum_rate)
+    report("POST /sum:batch, JSON", json_rate, sum_rate)
+    report("POST /sum:batch, raw int64", raw_rate, sum_rate)
+    print(f"\nbodies: JSON {len(json_body) / 2 ** 20:.1f} MB, raw {2 * a.nbytes / 2 ** 20:.1f} MB")
+
+
+def main(pairs: int, scalar_requests: int) -> None:
+    asyncio.run(run(pairs, min(scalar_requests, pairs)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=1_000_000)
+    parser.add_argument("--scalar-requests", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.pairs, args.scalar_requests)
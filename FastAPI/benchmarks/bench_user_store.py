@@ -0,0 +1,82 @@
+"""
+Contention benchmark for the lesson6 user store.
+
+Drives the four CRUD routes (create / validate / update / delete) of lesson6
+from many threads at once and checks that no login was created twice.
+It also hammers the store directly with 1 shard vs 16 shards to show what
+lock striping buys.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_user_store --threads 32 --users 2000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+# keep benchmark users out of the real lesson6 data folder
+os.environ.setdefault("LESSON6_DATA_DIR", tempfile.mkdtemp(prefix="lesson6-bench-"))
+
+import lesson6
+from user_store import ShardedUserStore
+
+
+def run_routes(threads: int, users: int) -> None:
+    client = TestClient(lesson6.app)
+    logins = [f"bench{i}" for i in range(users)]
+
+    def crud(login):
+        body = {"login": login, "password": "pw", "xyz": None}
+        created = client.post("/create_user", json=body).json()
+        client.get(f"/validate_user/{login}/pw")
+        client.put("/update_user", json={**body, "password": "pw2"})
+        client.delete("/delete_user", params={"login": login})
+        return isinstance(created, dict)
+
+    # every login is submitted twice, exactly one of the two creates may win
+    work = logins + logins
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(crud, work))
+    elapsed = time.perf_counter() - start
+
+    wins = sum(results)
+    print(f"routes: {len(work) * 4} requests from {threads} threads in {elapsed:.2f}s "
+          f"({len(work) * 4 / elapsed:,.0f} req/s)")
+    print(f"routes: {wins} successful creates for {users} logins submitted twice "
+          f"(>= {users} expected, duplicates only after a delete)")
+
+
+def run_store(threads: int, ops: int) -> None:
+    for shards in (1, 16):
+        store = ShardedUserStore(shards=shards)
+
+        def worker(offset):
+            for i in range(ops):
+                login = f"u{offset}-{i}"
+                store.create(login, {"password": "x"})
+                store.update(login, {"password": "y"}, expected={"password": "x"})
+                store.delete(login)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+        total = threads * ops * 3
+        print(f"store: shards={shards:<3} {total:,} ops in {elapsed:.2f}s ({total / elapsed:,.0f} ops/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=20000)
+    args = parser.parse_args()
+
+    run_store(args.threads, args.ops)
+    run_routes(args.threads, args.users)
@@ -0,0 +1,90 @@
+"""
+Memory per user and lookup time: the dict of dicts lesson6 keeps its users in vs a UserTable.
+
+Fills both with --users users shaped like lesson6's ({"password": "scrypt$16384$8$1$<salt>$<hash>"},
+random salts and hashes, no real scrypt) and reports:
+
+  - memory per user, as counted by tracemalloc while the structure is built
+  - get() time for logins that exist and logins that don't, on the bare mapping and
+    through ShardedUserStore(compact=False / True)
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.bench_user_table --users 1000000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from user_store import ShardedUserStore
+from user_table import UserTable
+
+
+def users(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield f"user{i:08d}", {"password": f"scrypt$16384$8$1${rng.randbytes(16).hex()}${rng.randbytes(32).hex()}"}
+
+
+def fill(mapping, count: int):
+    for login, record in users(count):
+        mapping[login] = record
+    return mapping
+
+
+def fill_store(store: ShardedUserStore, count: int) -> ShardedUserStore:
+    for login, record in users(count):
+        store.create(login, record)
+    return store
+
+
+def bytes_per_user(make, count: int) -> float:
+    tracemalloc.start()
+    try:
+        mapping = fill(make(), count)
+        used = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del mapping
+    return used / count
+
+
+def lookup_ns(get, logins) -> float:
+    for login in logins[:1000]:
+        get(login)
+    start = time.perf_counter()
+    for login in logins:
+        get(login)
+    return (time.perf_counter() - start) / len(logins) * 1e9
+
+
+def main(count: int, lookups: int) -> None:
+    print(f"{count:,} users\n")
+    print(f"{'memory per user':<30} {'bytes':>8}")
+    plain = bytes_per_user(dict, count)
+    compact = bytes_per_user(UserTable, count)
+    print(f"{'dict of dicts':<30} {plain:>8.0f}")
+    print(f"{'UserTable':<30} {compact:>8.0f}   ({compact / plain:.0%})\n")
+
+    rng = random.Random(2)
+    hits = [f"user{rng.randrange(count):08d}" for _ in range(lookups)]
+    misses = [f"nobody{i:08d}" for i in range(lookups)]
+    candidates = [
+        ("dict.get", fill({}, count).get),
+        ("UserTable.get", fill(UserTable(), count).get),
+        ("ShardedUserStore.get", fill_store(ShardedUserStore(), count).get),
+        ("ShardedUserStore(compact).get", fill_store(ShardedUserStore(compact=True), count).get),
+    ]
+    print(f"{'lookup':<30} {'hit':>8} {'miss':>8}")
+    for name, get in candidates:
+        print(f"{name:<30} {lookup_ns(get, hits):>6.0f}ns {lookup_ns(get, misses):>6.0f}ns")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+    main(args.users, args.lookups)
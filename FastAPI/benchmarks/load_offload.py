@@ -0,0 +1,116 @@
+"""
+Load test: does a flood of slow blocking requests hurt the rest of the app?
+
+One app, two endpoints:
+
+    /slow   `def` handler that blocks for --block seconds (time.sleep, like lesson10's /sync-task)
+    /fast   `def` handler that answers right away
+
+--clients clients call /slow in a loop while /fast is called every 10 ms, and the
+latency of /fast is reported for three setups:
+
+    idle          nobody calls /slow
+    shared pool   /slow is a plain `def` handler, on the threadpool /fast needs too
+    offloaded     /slow is @io_pool.offload (offload.py), a pool of its own with admission control
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.load_offload --clients 200 --seconds 5
+"""
+
+import argparse
+import asyncio
+import collections
+import time
+
+from fastapi import FastAPI
+
+from offload import OffloadPool
+
+
+def build_app(block: float, pool: OffloadPool = None) -> FastAPI:
+    app = FastAPI()
+
+    def slow():
+        time.sleep(block)
+        return {"slept": block}
+
+    @app.get("/fast")
+    def fast():
+        return {"ok": True}
+
+    app.get("/slow")(pool.offload(slow) if pool is not None else slow)
+    return app
+
+
+async def call(app, path: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "client": ("load", 0), "server": ("load", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(app, clients: int, seconds: float):
+    deadline = time.perf_counter() + seconds
+    slow_statuses = collections.Counter()
+    latencies = []
+
+    async def slow_client():
+        while time.perf_counter() < deadline:
+            status = await call(app, "/slow")
+            slow_statuses[status] += 1
+            if status == 503:
+                await asyncio.sleep(0.05)  # a real client would back off (Retry-After)
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await call(app, "/fast")
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(probe(), *(slow_client() for _ in range(clients)))
+    return latencies, slow_statuses
+
+
+def report(name: str, latencies, slow_statuses) -> None:
+    ordered = sorted(latencies)
+    p50, p99 = ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    statuses = ", ".join(f"{count} x {status}" for status, count in sorted(slow_statuses.items())) or "-"
+    print(f"{name:<13} /fast p50 {p50 * 1000:>8.2f} ms  p99 {p99 * 1000:>8.2f} ms  max {ordered[-1] * 1000:>8.2f} ms"
+          f"   ({len(ordered)} probes)   /slow: {statuses}")
+
+
+def main(clients: int, seconds: float, block: float, workers: int, max_queue: int) -> None:
+    report("idle", *asyncio.run(run(build_app(block), 0, seconds)))
+    report("shared pool", *asyncio.run(run(build_app(block), clients, seconds)))
+    pool = OffloadPool("io", workers=workers, max_queue=max_queue, queue_timeout=block * 4)
+    report("offloaded", *asyncio.run(run(build_app(block, pool), clients, seconds)))
+    stats = pool.stats()
+    print(f"io pool: {stats['completed']} done, {stats['rejected']} rejected, {stats['timed_out']} timed out,"
+          f" wait p99 {stats['wait_ms']['p99']} ms")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--block", type=float, default=0.2, help="seconds /slow blocks for")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=32)
+    args = parser.parse_args()
+    main(args.clients, args.seconds, args.block, args.workers, args.max_queue)
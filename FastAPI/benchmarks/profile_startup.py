@@ -0,0 +1,199 @@
+"""
+Cold-start profile of a lesson app: where the time goes between `python` and the first answer.
+
+Boots `module:app` in a fresh Python process (python -X importtime) and reports:
+
+  - import-time tree: `import fastapi` and the lesson module, the heaviest modules first
+  - model build time: every pydantic model class created while the lesson was imported
+    (User in lesson6, InternalUser/PublicUser in lesson7, plus the ones FastAPI makes)
+  - route registration time: every @app.get/.post/... (APIRouter.add_api_route)
+  - first request latency (GET --path, "/" by default)
+  - OpenAPI: FastAPI only builds the schema when /openapi.json (so /docs) is first requested.
+    By default the profile builds it right after startup and reports how long that took
+    (what warming it up in every worker would add to the cold start); with --defer-openapi
+    it is left alone and the first /docs + /openapi.json requests are timed instead.
+
+Run from the FastAPI folder:
+
+    python -m benchmarks.profile_startup lesson6:app
+    python -m benchmarks.profile_startup lesson7:app --path /user --defer-openapi
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RESULT_MARK = "PROFILE_RESULT "
+
+
+# ----------------------------------------------------------------------------
+# child: runs inside the profiled process
+# ----------------------------------------------------------------------------
+
+async def get(app, path: str) -> int:
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+        "headers": [], "client": ("profile", 0), "server": ("profile", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def timed_get(app, path: str):
+    start = time.perf_counter()
+    status = asyncio.run(get(app, path))
+    return {"path": path, "status": status, "ms": (time.perf_counter() - start) * 1000}
+
+
+def child(target: str, path: str, defer_openapi: bool) -> None:
+    result = {}
+    start = time.perf_counter()
+    import fastapi
+    import fastapi.routing
+    from pydantic._internal._model_construction import ModelMetaclass
+    result["import_fastapi_ms"] = (time.perf_counter() - start) * 1000
+
+    models, routes = [], []
+    original_new = ModelMetaclass.__new__
+    original_add = fastapi.routing.APIRouter.add_api_route
+
+    def timed_new(mcs, name, bases, namespace, *args, **kwargs):
+        start = time.perf_counter()
+        cls = original_new(mcs, name, bases, namespace, *args, **kwargs)
+        models.append({"model": f"{namespace.get('__module__', '?')}.{name}",
+                       "ms": (time.perf_counter() - start) * 1000})
+        return cls
+
+    def timed_add(self, path, endpoint, *args, **kwargs):
+        start = time.perf_counter()
+        original_add(self, path, endpoint, *args, **kwargs)
+        routes.append({"route": path, "ms": (time.perf_counter() - start) * 1000})
+
+    ModelMetaclass.__new__ = timed_new
+    fastapi.routing.APIRouter.add_api_route = timed_add
+    module_name, _, attribute = target.partition(":")
+    start = time.perf_counter()
+    __import__(module_name)  # not importlib.import_module: -X importtime doesn't see those
+    module = sys.modules[module_name]
+    app = getattr(module, attribute or "app")
+    result["import_app_ms"] = (time.perf_counter() - start) * 1000
+    ModelMetaclass.__new__ = original_new
+    fastapi.routing.APIRouter.add_api_route = original_add
+    result["models"] = models
+    result["routes"] = routes
+
+    result["openapi_built_at_import"] = getattr(app, "openapi_schema", None) is not None
+    result["first_request"] = timed_get(app, path)
+    if defer_openapi:
+        result["first_docs"] = [timed_get(app, "/docs"), timed_get(app, "/openapi.json")]
+    else:
+        start = time.perf_counter()
+        app.openapi()
+        result["openapi_ms"] = (time.perf_counter() - start) * 1000
+    print(RESULT_MARK + json.dumps(result), flush=True)
+
+
+# ----------------------------------------------------------------------------
+# parent: starts the child and prints the report
+# ----------------------------------------------------------------------------
+
+def import_tree(stderr: str):
+    """Parse `python -X importtime` output (children are listed before their parent) into a tree."""
+    stack = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|")  # "import time:  self | cumulative |   name"
+        self_us = head.split(":")[1]
+        depth = (len(name) - len(name.lstrip())) // 2
+        node = {"name": name.strip(), "self_ms": int(self_us) / 1000, "ms": int(cumulative_us) / 1000, "children": []}
+        while stack and stack[-1][0] > depth:
+            node["children"].insert(0, stack.pop()[1])
+        stack.append((depth, node))
+    return [node for _, node in stack]
+
+
+def print_tree(nodes, min_ms: float, max_depth: int, depth: int = 0) -> None:
+    for node in sorted(nodes, key=lambda node: -node["ms"]):
+        if node["ms"] < min_ms:
+            continue
+        print(f"  {'  ' * depth}{node['name']:<{48 - 2 * depth}} {node['ms']:>8.1f} ms  (self {node['self_ms']:.1f})")
+        if depth + 1 < max_depth:
+            print_tree(node["children"], min_ms, max_depth, depth + 1)
+
+
+def main(target: str, path: str, defer_openapi: bool, min_ms: float, depth: int, top: int) -> None:
+    env = dict(os.environ)
+    env.setdefault("LESSON6_DATA_DIR", tempfile.mkdtemp(prefix="lesson6-profile-"))
+    command = [sys.executable, "-X", "importtime", "-m", "benchmarks.profile_startup", target, "--child", "--path", path]
+    if defer_openapi:
+        command.append("--defer-openapi")
+    start = time.perf_counter()
+    process = subprocess.run(command, capture_output=True, text=True, env=env)
+    total_ms = (time.perf_counter() - start) * 1000
+    lines = [line for line in process.stdout.splitlines() if line.startswith(RESULT_MARK)]
+    if process.returncode != 0 or not lines:
+        sys.exit(f"profiling {target} failed:\n{process.stderr[-3000:]}")
+    result = json.loads(lines[-1][len(RESULT_MARK):])
+
+    print(f"{target}: whole process {total_ms:.0f} ms (including interpreter start and exit)\n")
+    print(f"import fastapi                 {result['import_fastapi_ms']:>8.1f} ms")
+    print(f"import {target:<23} {result['import_app_ms']:>8.1f} ms  (includes the models and routes below)")
+    print(f"\nimport tree (>= {min_ms} ms):")
+    roots = import_tree(process.stderr)
+    names = [node["name"] for node in roots]
+    # everything imported from `import fastapi` on: the lesson, plus what is only imported lazily later
+    print_tree(roots[names.index("fastapi"):] if "fastapi" in names else roots, min_ms, depth)
+
+    models = sorted(result["models"], key=lambda model: -model["ms"])
+    print(f"\npydantic models built: {len(models)}, {sum(model['ms'] for model in models):.1f} ms total")
+    for model in models[:top]:
+        print(f"  {model['model']:<48} {model['ms']:>8.2f} ms")
+    routes = sorted(result["routes"], key=lambda route: -route["ms"])
+    print(f"\nroutes registered: {len(routes)}, {sum(route['ms'] for route in routes):.1f} ms total")
+    for route in routes[:top]:
+        print(f"  {route['route']:<48} {route['ms']:>8.2f} ms")
+
+    first = result["first_request"]
+    print(f"\nfirst request  GET {first['path']:<26} {first['ms']:>8.1f} ms  ({first['status']})")
+    if result["openapi_built_at_import"]:
+        print("OpenAPI schema was already built while importing the app")
+    if defer_openapi:
+        for request in result["first_docs"]:
+            print(f"first request  GET {request['path']:<26} {request['ms']:>8.1f} ms  ({request['status']})")
+    else:
+        print(f"OpenAPI schema built in        {result['openapi_ms']:>8.1f} ms  (--defer-openapi leaves it for the first /docs)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="module:app, e.g. lesson6:app")
+    parser.add_argument("--path", default="/", help="path of the first request")
+    parser.add_argument("--defer-openapi", action="store_true",
+                        help="don't build the OpenAPI schema at startup, time the first /docs instead")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="hide imports faster than this")
+    parser.add_argument("--depth", type=int, default=4, help="import tree levels to show")
+    parser.add_argument("--top", type=int, default=10, help="slowest models/routes to list")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.target, args.path, args.defer_openapi)
+    else:
+        main(args.target, args.path, args.defer_openapi, args.min_ms, args.depth, args.top)
@@ -0,0 +1,150 @@
+"""
+Fast request bodies for create_app(fast_request_bodies=True) (app_factory.py), used by
+lesson6 for POST /create_user and PUT /update_user.
+
+For a body like `u: User` FastAPI does two passes over the request:
+
+    request.json()               json.loads builds a dict (stdlib json, Python objects for everything)
+    field.validate(that dict)    pydantic walks the dict and builds the User
+
+pydantic can also validate JSON *bytes* directly: every model has a validator compiled
+for it (in Rust, by pydantic-core) that parses the JSON and checks/converts each field
+as it reads it, without building the dict first. A BodyDecoder runs that validator on
+the raw body before FastAPI looks at it and hands FastAPI the finished model as the
+"parsed JSON"; FastAPI then only checks it is a User (it is: that's one isinstance).
+
+Anything that doesn't decode cleanly (invalid JSON, a missing field, a wrong type ...)
+is left to FastAPI, which parses it again the usual way, so error responses are exactly
+the same as without the fast path. Routes where the result could differ keep the normal
+path altogether:
+
+  - several body parameters, or Body(embed=True): the body is a dict around the model
+  - form bodies, Optional[...] bodies, bodies that are not a BaseModel
+  - models with validators or serializers, strict models or strict fields (Field(strict=True),
+    StrictInt, Annotated[..., Strict()]: strict JSON and strict Python validation accept
+    different things) and revalidate_instances other than "never"
+
+Two private details of Starlette/FastAPI are used: Request.json() returns `request._json`
+once it is set, and APIRoute._embed_body_fields. fast_path_available() checks both; if
+either is missing (another version) no route gets a BodyDecoder and nothing changes.
+
+Decoding lesson6's User takes 2.6 us instead of 7 (see benchmarks/bench_request_decode.py);
+a whole request costs much more than that, so it only gets 5-15% faster.
+"""
+
+import typing
+from typing import Any, Awaitable, Callable, Iterator, Optional, Set, Type
+
+from fastapi import params
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, Strict, ValidationError
+from starlette.requests import Request
+from starlette.responses import Response
+
+from projection import has_custom_logic
+
+
+def _json_content_type(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type == "application/json" or (media_type.startswith("application/") and media_type.endswith("+json"))
+
+
+def _models_in(annotation: Any) -> Iterator[Type[BaseModel]]:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        yield annotation
+    for arg in typing.get_args(annotation):  # Optional[Address], List[Address] ...
+        yield from _models_in(arg)
+
+
+def _strict_in(metadata: Any) -> bool:
+    return any(isinstance(item, Strict) and item.strict for item in metadata)
+
+
+def _has_strict_parts(annotation: Any) -> bool:
+    # StrictInt, List[Annotated[int, Strict()]] ...: the Strict marker sits in nested Annotated args
+    if typing.get_origin(annotation) is typing.Annotated and _strict_in(annotation.__metadata__):
+        return True
+    return any(_has_strict_parts(arg) for arg in typing.get_args(annotation))
+
+
+def _json_cache_works() -> bool:
+    request = Request({"type": "http", "method": "POST", "headers": []})
+    request._json = marker = object()
+    coroutine = request.json()
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value is marker
+    except Exception:
+        pass
+    coroutine.close()
+    return False
+
+
+_JSON_CACHE_WORKS = _json_cache_works()
+
+
+def fast_path_available(route: APIRoute) -> bool:
+    """True if this Starlette/FastAPI has the private details the fast path relies on."""
+    return _JSON_CACHE_WORKS and hasattr(route, "_embed_body_fields")
+
+
+def decodable(model: Any, seen: Optional[Set[type]] = None) -> bool:
+    """True if validating JSON bytes gives the same model as FastAPI's json.loads + validate (nested models too)."""
+    if not (isinstance(model, type) and issubclass(model, BaseModel)):
+        return False
+    seen = set() if seen is None else seen
+    if model in seen:
+        return True
+    seen.add(model)
+    if (has_custom_logic(model) or model.model_config.get("strict")
+            or model.model_config.get("revalidate_instances", "never") != "never"):
+        return False
+    for field in model.model_fields.values():
+        if _strict_in(field.metadata) or _has_strict_parts(field.annotation):
+            return False
+        if not all(decodable(nested, seen) for nested in _models_in(field.annotation)):
+            return False
+    return True
+
+
+class BodyDecoder:
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self._validate_json = model.__pydantic_validator__.validate_json
+        self.decoded = 0
+        self.fallbacks = 0  # bodies left to FastAPI (errors, other content types)
+
+    def __repr__(self) -> str:
+        return f"BodyDecoder({self.model.__name__}, decoded={self.decoded}, fallbacks={self.fallbacks})"
+
+    @classmethod
+    def for_route(cls, route: APIRoute) -> Optional["BodyDecoder"]:
+        field = route.body_field
+        if field is None or not fast_path_available(route) or route._embed_body_fields or isinstance(field.field_info, params.Form):
+            return None
+        model = field.field_info.annotation
+        return cls(model) if decodable(model) else None
+
+    def wrap(self, handler: Callable[[Request], Awaitable[Response]]) -> Callable[[Request], Awaitable[Response]]:
+        async def app(request: Request) -> Response:
+            await self.decode(request)
+            return await handler(request)
+        return app
+
+    async def decode(self, request: Request) -> None:
+        if not _json_content_type(request.headers.get("content-type", "")):
+            self.fallbacks += 1
+            return
+        body = await request.body()  # kept by the request, FastAPI reads the same bytes
+        if not body:
+            self.fallbacks += 1
+            return
+        try:
+            model = self._validate_json(body)
+        except ValidationError:
+            self.fallbacks += 1  # FastAPI parses it again and answers 422 its own way
+            return
+        # what request.json() returns from now on: FastAPI validates that instead of a dict
+        request._json = model
+        self.decoded += 1
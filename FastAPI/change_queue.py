@@ -0,0 +1,55 @@
+"""
+ChangeQueue: a user store listener that keeps a secondary index (login_index.py,
+fuzzy_index.py) up to date without making writers of different shards wait for each other.
+
+Store listeners run while the writer still holds its shard lock (user_store.py). A listener
+that simply took the index's lock would hand every writer, whatever its shard, the same
+lock: while one of them updates the index (or a reader walks it), the writers of the 15
+other shards wait too, with their own shard lock held.
+
+A ChangeQueue only appends (op, login) to a deque (atomic, no lock) and then *tries* the
+index lock. If it gets it, it applies everything queued so far, its own change and the
+ones other writers left behind. If the lock is busy, it returns right away: whoever holds
+the lock applies the change, and readers apply what is still queued before they read.
+
+    index lock free    ->  the writer applies the queue itself, as a plain lock would
+    index lock busy    ->  the writer appends and leaves, its shard lock is released sooner
+
+The order of the changes of one login is kept: they all come from the same shard, one at
+a time under its lock, and the deque hands them out in the order they were appended.
+The price: the writer that gets the lock may apply a few changes of other shards too,
+and an index can lag behind the store until the next write or read. Readers never see
+that lag, they apply the queue first.
+
+benchmarks/bench_index_listeners.py, 16 writer threads: with 2 threads searching the
+indexes, ~6,500 writes/s with the index lock vs ~52,000 with a ChangeQueue; with nobody
+reading, both are about the same (~75,000, within the noise of the run).
+"""
+
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+
+class ChangeQueue:
+    def __init__(self, lock: threading.Lock, apply: Callable[[str, str], None]):
+        self._lock = lock  # the index's lock
+        self._apply = apply  # apply(op, login), called with the lock held
+        self._pending = deque()
+
+    def __call__(self, op: str, login: str, record: Optional[dict]) -> None:
+        self._pending.append((op, login))
+        # re-check after releasing: a change appended while we were applying,
+        # by a writer that found the lock busy, must not stay behind
+        while self._pending and self._lock.acquire(blocking=False):
+            try:
+                self.apply_pending()
+            finally:
+                self._lock.release()
+
+    def apply_pending(self) -> None:
+        """Apply every queued change. The caller holds the index's lock."""
+        pending = self._pending
+        while pending:
+            op, login = pending.popleft()
+            self._apply(op, login)
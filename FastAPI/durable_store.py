@@ -0,0 +1,376 @@
+"""
+Persistent user store for lesson6: write-ahead log + snapshots.
+
+A ShardedUserStore only lives in memory, so restarting `uvicorn lesson6:app`
+throws every account away. DurableUserStore keeps the same in-memory shards
+but also appends every change (create / update / delete) to a write-ahead log (WAL)
+before the handler returns.
+
+Group commit:
+    fsync is slow (milliseconds), so instead of one fsync per request a background
+    thread takes every change that arrived in the meantime, writes them in one go
+    and does a single fsync for the whole batch. Each writer only waits until the
+    batch holding its change is on disk.
+
+Snapshots:
+    once the current log segment gets long, the whole store is dumped into a
+    compact snapshot and the older log segments are deleted. Recovery loads the
+    newest snapshot and replays only the log written after it. Both files are
+    read through mmap so the OS pages them straight in without extra copies.
+
+Files in the data directory:
+
+    snapshot-00000003.bin    state of the store before wal-00000003.log
+    wal-00000003.log         changes made after that snapshot
+    wal-00000004.log         (a new segment is started on every open/snapshot)
+
+Every log entry is  <payload length><crc32><marshal payload>  so a torn write at
+the end of a segment (crash in the middle of a write) is detected and ignored.
+"""
+
+import gc
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Union
+
+from user_store import ANY, ShardedUserStore, _Shard
+
+_ENTRY_HEADER = struct.Struct("<II")  # payload length, crc32 of payload
+_SNAPSHOT_MAGIC = b"USERSNAP1\n"
+
+
+def _segment_name(generation: int) -> str:
+    return f"wal-{generation:08d}.log"
+
+
+def _snapshot_name(generation: int) -> str:
+    return f"snapshot-{generation:08d}.bin"
+
+
+def _generations(directory: str, prefix: str, suffix: str) -> List[int]:
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            try:
+                found.append(int(name[len(prefix):-len(suffix)]))
+            except ValueError:
+                pass
+    return sorted(found)
+
+
+def _fsync_dir(directory: str) -> None:
+    # makes a rename / new file itself durable (not supported on Windows)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def _map_file(path: str) -> Iterator[Union[mmap.mmap, bytes]]:
+    """Read-only memory map of a file (empty bytes for an empty file), unmapped on exit."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+class WriteAheadLog:
+    """Append-only, group-committed log split into numbered segments."""
+
+    def __init__(self, directory: str, generation: int, commit_delay: float = 0.0):
+        self.directory = directory
+        self.generation = generation
+        self.commit_delay = commit_delay  # extra wait to gather bigger batches
+        self.entries_in_segment = 0
+
+        self._file = open(os.path.join(directory, _segment_name(generation)), "ab")
+        _fsync_dir(directory)
+        self._lock = threading.Lock()         # protects the pending buffer and counters
+        self._flushed = threading.Condition(self._lock)
+        self._io_lock = threading.RLock()     # one writer of the file at a time
+        self._pending: List[bytes] = []
+        self._appended = 0                    # sequence number of the last appended entry
+        self._durable = 0                     # sequence number of the last entry on disk
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wal-flusher", daemon=True)
+        self._thread.start()
+
+    def append(self, op: str, login: str, record: Optional[dict]) -> int:
+        """Queue one change and return its sequence number (not durable yet, see wait())."""
+        payload = marshal.dumps((op, login, record))
+        entry = _ENTRY_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write-ahead log is closed")
+            self._pending.append(entry)
+            self._appended += 1
+            self.entries_in_segment += 1
+            seq = self._appended
+        self._wakeup.set()
+        return seq
+
+    def wait(self, seq: int) -> None:
+        """Block until the entry `seq` has been fsynced."""
+        with self._flushed:
+            while self._durable < seq:
+                if self._closed:
+                    raise RuntimeError("write-ahead log is closed")
+                self._flushed.wait()
+
+    def flush(self) -> None:
+        """Write and fsync everything appended so far as one batch."""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                seq = self._appended
+            if batch:
+                self._file.write(b"".join(batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            with self._flushed:
+                self._durable = max(self._durable, seq)
+                self._flushed.notify_all()
+
+    def rotate(self) -> int:
+        """
+        Flush, close the current segment and start the next one.
+        The caller must make sure nothing is appended meanwhile.
+        Returns the new generation.
+        """
+        with self._io_lock:
+            self.flush()
+            self._file.close()
+            self.generation += 1
+            self._file = open(os.path.join(self.directory, _segment_name(self.generation)), "ab")
+            _fsync_dir(self.directory)
+            with self._lock:
+                self.entries_in_segment = 0
+            return self.generation
+
+    def close(self) -> None:
+        self.flush()
+        with self._flushed:
+            self._closed = True
+            self._flushed.notify_all()
+        self._wakeup.set()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                return
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            self.flush()
+
+
+class DurableUserStore(ShardedUserStore):
+    """
+    ShardedUserStore whose changes survive a restart.
+
+    `initial` is only used when the data directory is empty (first start). It can be
+    a function returning the dict, then it is only called in that case.
+    A new snapshot is taken in the background every `snapshot_every` log entries.
+    """
+
+    def __init__(self, directory: str, initial: Union[dict, Callable[[], dict], None] = None, shards: int = 16,
+                 snapshot_every: int = 100_000, commit_delay: float = 0.0, copy_on_write: bool = False,
+                 compact: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self._local = threading.local()
+        self._compacting = threading.Lock()
+
+        super().__init__(shards=shards, copy_on_write=copy_on_write, compact=compact)
+        last_generation = self._recover()
+        self._wal = WriteAheadLog(directory, last_generation + 1, commit_delay)
+        if last_generation == 0 and initial:
+            # first start: seed the store and persist the seed as the first snapshot
+            if callable(initial):
+                initial = initial()
+            for login, record in initial.items():
+                self._shard(login).data[login] = record
+            self.snapshot()
+
+    def _shard(self, login: str) -> _Shard:
+        # str hash() is randomized per process, crc32 gives the same shard after a
+        # restart so a snapshot can be loaded shard by shard without re-hashing
+        return self._shards[zlib.crc32(login.encode()) % len(self._shards)]
+
+    # ---------- writes ----------
+
+    def _changed(self, op, login, record):
+        # still under the shard lock: log order == apply order for every login
+        self._local.seq = self._wal.append(op, login, record)
+        super()._changed(op, login, record)
+
+    def create(self, login, record):
+        if not super().create(login, record):
+            return False
+        self._commit()
+        return True
+
+    def update(self, login, record, expected=ANY):
+        if not super().update(login, record, expected):
+            return False
+        self._commit()
+        return True
+
+    def delete(self, login):
+        if not super().delete(login):
+            return False
+        self._commit()
+        return True
+
+    def create_many(self, entries):
+        results = super().create_many(entries)
+        if any(results):
+            self._commit()  # one wait for the whole batch, it usually lands in a single fsync
+        return results
+
+    def upsert_many(self, entries):
+        super().upsert_many(entries)
+        if entries:
+            self._commit()
+
+    def delete_many(self, logins):
+        results = super().delete_many(logins)
+        if any(results):
+            self._commit()
+        return results
+
+    def _commit(self) -> None:
+        self._wal.wait(self._local.seq)
+        # taking the lock here (not in the thread) lets only one committer start a snapshot
+        if self._wal.entries_in_segment >= self.snapshot_every and self._compacting.acquire(blocking=False):
+            try:
+                threading.Thread(target=self._compact_if_needed, name="snapshot", daemon=True).start()
+            except BaseException:
+                self._compacting.release()
+                raise
+
+    # ---------- snapshots ----------
+
+    def _compact_if_needed(self) -> None:
+        # runs with self._compacting already held by _commit
+        try:
+            if self._wal.entries_in_segment >= self.snapshot_every:
+                self._snapshot()
+        finally:
+            self._compacting.release()
+
+    def snapshot(self) -> None:
+        """Write a compacted snapshot and delete the log segments it replaces."""
+        with self._compacting:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        # stop writers only long enough to cut the log and copy the shard dicts
+        for shard in self._shards:
+            shard.lock.acquire()
+        try:
+            generation = self._wal.rotate()
+            # in copy-on-write mode the published dicts never change, no need to copy them
+            # (copying a UserTable is a few memcpy, it is turned into a dict after unlocking)
+            data = [shard.data if self.copy_on_write else shard.data.copy() for shard in self._shards]
+        finally:
+            for shard in self._shards:
+                shard.lock.release()
+        # snapshots always hold plain dicts, so a data folder works with and without compact
+        data = [shard if type(shard) is dict else dict(shard.items()) for shard in data]
+
+        path = os.path.join(self.directory, _snapshot_name(generation))
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_SNAPSHOT_MAGIC)
+            marshal.dump({"shards": len(data), "data": data}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(self.directory)
+
+        for old in _generations(self.directory, "snapshot-", ".bin"):
+            if old < generation:
+                os.remove(os.path.join(self.directory, _snapshot_name(old)))
+        for old in _generations(self.directory, "wal-", ".log"):
+            if old < generation:
+                os.remove(os.path.join(self.directory, _segment_name(old)))
+
+    # ---------- recovery ----------
+
+    def _recover(self) -> int:
+        """Load the newest snapshot, replay the log after it. Returns the last generation seen (0 = empty)."""
+        snapshots = _generations(self.directory, "snapshot-", ".bin")
+        segments = _generations(self.directory, "wal-", ".log")
+        start = snapshots[-1] if snapshots else 0
+
+        # millions of small dicts are created below, the cyclic GC would scan them again and again
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if snapshots:
+                self._load_snapshot(os.path.join(self.directory, _snapshot_name(start)))
+            for generation in segments:
+                path = os.path.join(self.directory, _segment_name(generation))
+                if os.path.getsize(path) == 0:
+                    os.remove(path)  # left behind by a run that never wrote anything
+                elif generation >= start:
+                    self._replay(path)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return max(segments + [start])
+
+    def _load_snapshot(self, path: str) -> None:
+        with _map_file(path) as mapped, memoryview(mapped) as view:
+            if bytes(view[:len(_SNAPSHOT_MAGIC)]) != _SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a user store snapshot")
+            with view[len(_SNAPSHOT_MAGIC):] as body:
+                snapshot = marshal.loads(body)
+        if snapshot["shards"] == len(self._shards):
+            for shard, data in zip(self._shards, snapshot["data"]):
+                shard.data = self._new_data(data)
+        else:
+            # shard count changed since the snapshot was written
+            for data in snapshot["data"]:
+                for login, record in data.items():
+                    self._shard(login).data[login] = record
+
+    def _replay(self, path: str) -> None:
+        with _map_file(path) as mapped, memoryview(mapped) as view:
+            size = len(mapped)
+            offset = 0
+            while offset + _ENTRY_HEADER.size <= size:
+                length, crc = _ENTRY_HEADER.unpack_from(view, offset)
+                start = offset + _ENTRY_HEADER.size
+                # slices must be released too before the file can be unmapped
+                with view[start:start + length] as payload:
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break  # torn write at the end of the segment
+                    op, login, record = marshal.loads(payload)
+                data = self._shard(login).data
+                if op == "delete":
+                    data.pop(login, None)
+                else:
+                    data[login] = record
+                offset = start + length
+
+    def close(self) -> None:
+        """Flush the log and stop the background flusher."""
+        self._wal.close()
@@ -0,0 +1,177 @@
+"""
+Edit-distance ("did you mean ...") search over logins, used by lesson6's /users/search.
+
+The edit (Levenshtein) distance between two words is how many single-character
+inserts, deletes or replacements turn one into the other: kedar -> kedr is 1.
+
+Comparing the query with every login is a full scan. Instead every login is
+split into overlapping 3-letter pieces (trigrams), padded so the edges count too:
+
+    kedr  ->  ##k  #ke  ked  edr  dr$  r$$
+
+and the index maps every trigram to the logins containing it (an inverted index).
+One edit changes at most 3 trigrams, so a login within distance k of the query
+shares at least  len(query trigrams) - 3k  of them. By the pigeonhole principle it
+must then appear in at least one of the  3k + 1  *shortest* posting lists of the
+query's trigrams. Only those few lists are read, the candidates are filtered by
+length (the distance is at least the length difference) and the survivors are
+checked with the exact distance.
+
+Very short queries (fewer than 3k + 1 trigrams) can't be filtered that way and
+fall back to checking every login of a close enough length. Logins are also kept
+grouped by length, so that fallback only copies the (short) logins it can match.
+
+Posting lists are sets: a delete (run from a store listener, under the shard lock)
+removes the login from each of its trigrams in O(1), even from huge postings like "#a".
+The listener goes through a ChangeQueue (change_queue.py), so writers of different
+shards don't wait for each other on the index lock.
+"""
+
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from change_queue import ChangeQueue
+
+
+def _pattern_bits(word: str) -> Dict[str, int]:
+    bits: Dict[str, int] = {}
+    for i, char in enumerate(word):
+        bits[char] = bits.get(char, 0) | (1 << i)
+    return bits
+
+
+def edit_distance(a: str, b: str, a_bits: Optional[Dict[str, int]] = None) -> int:
+    """
+    Levenshtein distance using Myers' bit-parallel algorithm: one column of the
+    classic dynamic-programming table is kept as bits of an int, so the cost is
+    O(len(b)) int operations instead of O(len(a) * len(b)) Python steps.
+    `a_bits` is _pattern_bits(a), pass it when comparing the same `a` many times.
+    """
+    if a == b:
+        return 0
+    if not a or not b:
+        return len(a) or len(b)
+    if a_bits is None:
+        a_bits = _pattern_bits(a)
+    mask = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    vp, vn, score = mask, 0, len(a)
+    for char in b:
+        eq = a_bits.get(char, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | ~(xh | vp)
+        hn = vp & xh
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        hp = (hp << 1) | 1
+        hn <<= 1
+        vp = (hn | ~(xv | hp)) & mask
+        vn = hp & xv & mask
+    return score
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = "\x02\x02" + word + "\x03\x03"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self, words=()):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[str]] = {}
+        self._words: Set[str] = set()
+        self._by_length: Dict[int, Set[str]] = {}
+        for word in words:
+            self._add(word)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, word: str) -> None:
+        with self._lock:
+            self._add(word)
+
+    def _add(self, word: str) -> None:
+        if word in self._words:
+            return
+        self._words.add(word)
+        self._by_length.setdefault(len(word), set()).add(word)
+        for gram in trigrams(word):
+            self._postings.setdefault(gram, set()).add(word)
+
+    def discard(self, word: str) -> None:
+        with self._lock:
+            self._discard(word)
+
+    def _discard(self, word: str) -> None:
+        if word not in self._words:
+            return
+        self._words.discard(word)
+        same_length = self._by_length[len(word)]
+        same_length.discard(word)
+        if not same_length:
+            del self._by_length[len(word)]
+        for gram in trigrams(word):
+            posting = self._postings[gram]
+            posting.discard(word)
+            if not posting:
+                del self._postings[gram]
+
+    def _before_read(self) -> None:
+        """Hook run with the lock held before a search reads the index."""
+
+    def search(self, query: str, max_distance: int, limit: int) -> List[Tuple[str, int]]:
+        """Up to `limit` (word, distance) pairs within `max_distance`, closest first."""
+        grams = trigrams(query)
+        needed = len(grams) - 3 * max_distance
+        with self._lock:
+            self._before_read()
+            if needed > 0:
+                postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+                candidates = set()
+                for posting in postings[:len(grams) - needed + 1]:
+                    candidates.update(posting)
+            else:
+                # query too short to filter on: every word of a close enough length
+                candidates = set()
+                for length in range(max(0, len(query) - max_distance), len(query) + max_distance + 1):
+                    candidates.update(self._by_length.get(length, ()))
+        # the exact (slower) check runs without the lock, so writers aren't held up
+        bits = _pattern_bits(query)
+        found = []
+        for word in candidates:
+            if abs(len(word) - len(query)) <= max_distance:
+                distance = edit_distance(query, word, bits)
+                if distance <= max_distance:
+                    found.append((distance, word))
+        found.sort()
+        return [(word, distance) for distance, word in found[:limit]]
+
+
+class FuzzyLoginIndex(TrigramIndex):
+    """TrigramIndex of a user store's logins, kept up to date through a store listener."""
+
+    def __init__(self, store):
+        super().__init__()
+        self._changes = ChangeQueue(self._lock, self._on_change)
+        store.add_listener(self._changes)
+        for login, _ in store.items():
+            self.add(login)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._changes.apply_pending()
+            return len(self._words)
+
+    def _on_change(self, op: str, login: str) -> None:
+        # called by self._changes with the lock held
+        if op == "delete":
+            self._discard(login)
+        elif op in ("create", "upsert"):
+            self._add(login)
+
+    def _before_read(self) -> None:
+        self._changes.apply_pending()
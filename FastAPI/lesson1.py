@@ -26,10 +26,10 @@ pip install fastapi
 pip install uvicorn[standard]
 """
 
-from fastapi import FastAPI
+from app_factory import create_app
 
 # Creating the FastAPI app object
-app = FastAPI()
+app = create_app()
 
 # This works but is not recommended:
 # @app.get('/')
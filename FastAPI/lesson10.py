@@ -181,3 +181,68 @@ If you want, I can also give you:
 Let me know.
 
 """
+
+import asyncio
+import os
+import time
+
+from app_factory import create_app
+from loop_monitor import LoopMonitor
+from offload import OffloadPool
+
+# the examples above as a real app: uvicorn lesson10:app
+app = create_app()
+
+
+@app.get("/async-task")
+async def async_task():
+    await asyncio.sleep(5)  # Non-blocking sleep
+    return {"message": "Finished async task"}
+
+
+# `def` handlers share one threadpool of 40 threads with every other `def` endpoint of the app:
+# 40 requests to a handler like sync_task() and the whole app waits. So blocking work gets
+# pools of its own, sized for it (see offload.py). When a pool and its queue are full the
+# request gets 503 right away, and the rest of the app keeps answering normally.
+
+# waiting (sleep, sync DB drivers, requests.get ...): threads, the GIL is released while waiting
+io_pool = OffloadPool("io", workers=16, max_queue=32, queue_timeout=10)
+# computing: processes, threads of one process can't compute Python code at the same time
+cpu_pool = OffloadPool("cpu", workers=os.cpu_count() or 1, max_queue=8, queue_timeout=10, processes=True)
+
+
+@app.get("/sync-task")
+@io_pool.offload
+def sync_task():
+    time.sleep(5)  # blocks one of io_pool's threads, not the shared threadpool or the event loop
+    return {"message": "Finished sync task"}
+
+
+@app.get("/cpu-task")
+@cpu_pool.offload
+def cpu_task(n: int = 5_000_000):
+    return {"sum_of_squares": sum(i * i for i in range(n))}  # runs in a worker process
+
+
+@app.get("/offload_stats")
+def offload_stats():
+    # queue depth, running jobs, 503s and wait/run times of each pool
+    return {pool.name: pool.stats() for pool in (io_pool, cpu_pool)}
+
+
+# The ❌ Bad example from above. Try it: LESSON10_BAD_DEMO=1 uvicorn lesson10:app, open /bad,
+# then /loop_stats. The loop monitor (loop_monitor.py) notices the loop is stuck and shows
+# `GET /bad` with the stack that ends in time.sleep, the line to fix.
+# Only with the flag: every request on the server (all of main.py's lessons) waits while it runs.
+loop_monitor = LoopMonitor(threshold=0.1).install(app)
+
+if os.environ.get("LESSON10_BAD_DEMO") == "1":
+    @app.get("/bad")
+    async def bad_handler():
+        time.sleep(1)  # BAD: this blocks event loop
+        return {"msg": "Blocked!"}
+
+
+@app.get("/loop_stats")
+def loop_stats():
+    return loop_monitor.stats()
@@ -1,9 +1,9 @@
 # Creating different routes using FastAPI
 
-from fastapi import FastAPI
+from app_factory import create_app
 
 # Creating the FastAPI application instance
-app = FastAPI()
+app = create_app()
 
 # Root route - GET method at '/'
 @app.get('/')
@@ -1,9 +1,11 @@
 #path parameters in fastapi
 
 
-from fastapi import FastAPI
+from fastapi import Request
+from app_factory import create_app
+from response_cache import ResponseCache, VersionedDict
 
-app=FastAPI()
+app=create_app()
 
 @app.get('/')
 def hello():
@@ -13,20 +15,26 @@ def hello():
 def hello(name):
     return {'data':f"Hi {name}"}
 
-data={
+# VersionedDict is a normal dict that counts its changes (see response_cache.py)
+data=VersionedDict({
     '1':{'data':'Hello from id1','comments':'This is id1 comment'},
     '2':{'data':'Hello from id2','comments':'This is id2 comment'},
     '3':{'data':'Hello from id3','comments':'This is id3 comment'}
-}
+})
+
+# data hardly ever changes, so each answer is turned into JSON once and reused
+# the response has an ETag, a client sending it back in If-None-Match gets 304 Not Modified (no body)
+# an unknown id gives 404 (data.get(id) used to return None and None.get crashed with a 500)
+data_cache=ResponseCache(data)
 
 @app.get('/{id}/data')
-def fetch_data_from_id(id):
-    return data.get(id).get('data')
+def fetch_data_from_id(id, request: Request):
+    return data_cache.respond(request, (id, 'data'), lambda: data[id]['data'])
 
 
 @app.get('/{id}/comments')
-def fetch_comments_from_id(id):
-    return data.get(id).get('comments')
+def fetch_comments_from_id(id, request: Request):
+    return data_cache.respond(request, (id, 'comments'), lambda: data[id]['comments'])
 
 
 #the probelm is we cant control the datatype
@@ -45,6 +53,17 @@ def add(num1:int,num2:int):# FastAPI converts path parameters to int if specifie
     return num1+num2 #now this will return 79
 
 
+# Opt-in radix router:  LESSON3_RADIX_ROUTER=1 uvicorn lesson3:app
+# routes are matched with a tree of path segments instead of top to bottom, static segments
+# win over {parameters} whatever the order, and routes that can never be reached are
+# reported when the server starts (see radix_router.py)
+import os
+
+if os.environ.get("LESSON3_RADIX_ROUTER") == "1":
+    from radix_router import use_radix_router
+    use_radix_router(app)
+
+
 """
 - Static routes: Do not rely on parameters.
   Example: GET '/' or '/about'
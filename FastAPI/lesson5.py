@@ -18,9 +18,19 @@ FastAPI automatically detects query parameters based on whether
 they're used in the function signature but not in the path.
 """
 
-from fastapi import FastAPI
+import itertools
+import os
 
-app = FastAPI()
+from fastapi import HTTPException, Query, Request
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+import batch_math
+from app_factory import create_app
+from query_cache import QueryCache
+from search_index import SearchIndex, lesson_notes, tokenize
+
+app = create_app()
 
 # --------------------------
 # Example 1: Basic Query Parameter with Default
@@ -53,17 +63,115 @@ Note:
 """
 
 # --------------------------
-# Example 3: Optional Search Query
+# Example 2b: Many Sums in One Request
 # --------------------------
-@app.get("/search")
-def search(q: str = None):
-    if q:
-        return {"results": [f"Result for '{q}'"]}
-    return {"results": ["Default search results"]}
+# /sum does one addition per request; adding up a million pairs that way is a million
+# requests. POST /sum:batch takes two whole arrays and adds them with numpy in one go,
+# as JSON or as raw binary numbers (see batch_math.py for the formats).
+# The body is read by hand (not a pydantic model): a model would check the numbers one by one.
+@app.post("/sum:batch")
+async def add_batch(request: Request, dtype: str = None):
+    body = await batch_math.read_body(request)
+    # numpy works outside the event loop, other requests go on meanwhile
+    return await run_in_threadpool(batch_math.respond, body, request.headers.get("content-type", ""), dtype)
 
 """
 Try:
-- http://127.0.0.1:8000/search?q=python     → Result for 'python'
-- http://127.0.0.1:8000/search              → Default search results
+- POST http://127.0.0.1:8000/sum:batch  {"a": [1, 2, 3], "b": [10, 20, 30]}
+  → {"sum": [11, 22, 33], "count": 3, "total": 66, "mean": 22.0, "min": 11, "max": 33}
+- Binary, from Python:
+    a, b = numpy.arange(1_000_000), numpy.ones(1_000_000, dtype=numpy.int64)
+    r = requests.post(url, data=a.tobytes() + b.tobytes(), headers={"Content-Type": "application/octet-stream"})
+    numpy.frombuffer(r.content, dtype="<i8"), r.headers["X-Sum-Total"]
 """
 
+# --------------------------
+# Example 3: Search with Pagination
+# --------------------------
+# A real search over the course notes (the docstrings and "Try:" notes of all the lessons),
+# with an inverted index and BM25 ranking like a search engine (see search_index.py).
+# `limit` and `offset` are query parameters with defaults, as in Example 2, and with bounds:
+# Query(ge=..., le=...) answers 422 for out-of-range values and shows the bounds in /docs.
+NOTES = {note["id"]: note for note in lesson_notes(os.path.dirname(os.path.abspath(__file__)))}
+index = SearchIndex()
+index.add_many((note_id, note["text"]) for note_id, note in NOTES.items())
+
+
+def snippet(text: str, words: set, size: int = 160) -> str:
+    # the text around the first query word found in it
+    lowered = text.lower()
+    positions = [lowered.find(word) for word in words if word in lowered]
+    start = max(0, min(positions, default=0) - size // 4)
+    return " ".join(text[start:start + size].split())
+
+
+def ranked(words: set, limit: int, offset: int) -> list:
+    results = []
+    for note_id, score in index.search(" ".join(words), limit=limit, offset=offset):
+        note = NOTES.get(note_id)
+        if note is None:
+            continue  # removed while this search was running
+        results.append({"id": note_id, "source": note["source"], "title": note["title"],
+                        "score": round(score, 3), "snippet": snippet(note["text"], words)})
+    return results
+
+
+# A few queries are asked over and over: their results are cached (see query_cache.py).
+# The key is the query normalized the way the index sees it, so "Query Parameters",
+# "parameters query" and "query, parameters!" are one entry.
+search_cache = QueryCache(max_bytes=8 * 2 ** 20, ttl=300)
+
+
+@app.get("/search")
+def search(q: str = None, limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0)):
+    if not q:
+        notes = list(NOTES.values())[offset:offset + limit]
+        return {"total": len(NOTES), "results": [{"id": n["id"], "source": n["source"], "title": n["title"]} for n in notes]}
+    words = set(tokenize(q))
+    key = (" ".join(sorted(words)), limit, offset)
+    results = search_cache.get_or_compute(key, lambda: ranked(words, limit, offset))
+    return {"query": q, "offset": offset, "results": results}
+
+
+@app.get("/search_cache")
+def search_cache_stats():
+    # hit ratio, evictions, memory use ... to tune max_bytes and ttl
+    return search_cache.stats()
+
+
+# Documents can be added and removed while the app runs: the index is updated in place, not rebuilt
+class Note(BaseModel):
+    title: str
+    text: str
+
+
+user_note_numbers = itertools.count(1)
+
+
+@app.post("/documents")
+def add_document(note: Note):
+    note_id = f"user:{next(user_note_numbers)}"
+    NOTES[note_id] = {"id": note_id, "source": "user", "title": note.title, "text": note.text}
+    index.add(note_id, note.title + "\n" + note.text)
+    search_cache.clear()  # cached results are for the old documents
+    return {"id": note_id, "documents": len(index)}
+
+
+@app.delete("/documents/{note_id}")
+def remove_document(note_id: str):
+    # out of the index first, so searches from now on can't come up with it
+    if not index.remove(note_id):
+        raise HTTPException(status_code=404, detail="No such document")
+    NOTES.pop(note_id, None)
+    search_cache.clear()
+    return {"removed": note_id, "documents": len(index)}
+
+"""
+Try:
+- http://127.0.0.1:8000/search?q=query parameters              → best matching notes, best first
+- http://127.0.0.1:8000/search?q=async&limit=5&offset=5        → the second page of 5
+- http://127.0.0.1:8000/search                                 → the first notes, no ranking
+- http://127.0.0.1:8000/search_cache                           → cache hits, misses, memory use
+- POST http://127.0.0.1:8000/documents  {"title": "Mine", "text": "my own note about pagination"}
+  then /search?q=pagination finds it; DELETE http://127.0.0.1:8000/documents/user:1 removes it
+"""
@@ -1,12 +1,15 @@
 # Request body is the JSOM message that we recieve from user and response body is the ine give nby server
 # 
 # 
-# Importing FastAPI class from the fastapi module to create the API app instance
-from fastapi import FastAPI
+# Importing create_app, it makes a normal FastAPI() app that writes JSON responses faster (see app_factory.py)
+from app_factory import create_app
 from typing import Optional
+import os
 
-# Creating an instance of the FastAPI class
-app = FastAPI()
+# Creating the FastAPI app instance
+# LESSON6_FAST_BODIES=1: request bodies (User) are validated straight from the raw JSON bytes,
+# without json.loads building a dict first (see body_decoder.py)
+app = create_app(fast_request_bodies=os.environ.get("LESSON6_FAST_BODIES") == "1")
 
 # Importing BaseModel from pydantic for creating data models (schemas)
 from pydantic import BaseModel
@@ -21,25 +24,93 @@ class User(BaseModel):#taking inheritance of pydantic basemodel
     #pydantic supportd int float str bool None (Optional[...]) list[x] (list of x type elements) tuple[x,y] (tuple of x and y datatypes) set[x] dict[str, int] str is key and int is value
     #there are many more librarries like typing but these are the basic ones
 
-# Simulating a simple in-memory user database using a dictionary
-users_db = {
-    "kedard": {"password": "1234"},
-    "johnd": {"password": "abcd"},
-    "1": {"password": "abcd"},
-    "2": {"password": "abcd"},
-    "3": {"password": "abcd"}
-}
+# Simulating a simple user database
+# ShardedUserStore behaves like the old dict but is safe to use from many threads
+# (sync handlers run on Starlette's threadpool, see user_store.py)
+# DurableUserStore is the same thing but also writes every change to disk, so users
+# created through the API are still there after restarting uvicorn (see durable_store.py)
+# the seed users below are only used the very first time, when the data folder is empty
+# passwords are never stored as plain text, only as salted scrypt hashes (see passwords.py)
+from user_store import UserStore
+from durable_store import DurableUserStore
+from passwords import PasswordHasher, hash_password
+
+DATA_DIR = os.environ.get("LESSON6_DATA_DIR", os.path.join(os.path.dirname(__file__), "lesson6_data"))
+
+# hashing/verification runs in a process pool, successful logins are cached for 30 seconds
+passwords = PasswordHasher()
+
+# Read-optimized mode (LESSON6_READ_OPTIMIZED=1): logins are almost all of the traffic, so writers
+# copy a shard, change the copy and publish it, and validate_user reads the current version without
+# ever waiting for a writer. More shards keep those copies small.
+READ_OPTIMIZED = os.environ.get("LESSON6_READ_OPTIMIZED") == "1"
+
+# Compact mode (LESSON6_COMPACT_USERS=1): the users are kept in columns (flat arrays and byte
+# arenas) instead of one small dict per user, about a quarter of the memory for millions of users.
+# get() still returns {"password": ...}, so nothing below changes (see user_table.py)
+COMPACT_USERS = os.environ.get("LESSON6_COMPACT_USERS") == "1"
+
+# a function, so the seed passwords are only hashed (scrypt is slow on purpose) when the data folder is empty
+def seed_users():
+    return {
+        "kedard": {"password": hash_password("1234")},
+        "johnd": {"password": hash_password("abcd")},
+        "1": {"password": hash_password("abcd")},
+        "2": {"password": hash_password("abcd")},
+        "3": {"password": hash_password("abcd")}
+    }
+
+users_db: UserStore = DurableUserStore(DATA_DIR, seed_users,
+                                       shards=256 if READ_OPTIMIZED else 16, copy_on_write=READ_OPTIMIZED, compact=COMPACT_USERS)
+
+# users_db may wait for a disk write (fsync), so async handlers call it through the threadpool
+from starlette.concurrency import run_in_threadpool
+
+# Audit log: every change (and every login) is recorded as one small event
+# print(users_db) used to dump the whole database on every write, which gets slower
+# the more users there are. The events are written to a file by a background thread (see audit_log.py)
+# async handlers use audit.emit_async(): with LESSON6_AUDIT_POLICY=block the wait for free space
+# happens on a worker thread instead of stopping the event loop
+from audit_log import AuditLog
+
+audit = AuditLog(os.path.join(DATA_DIR, "audit.log"), policy=os.environ.get("LESSON6_AUDIT_POLICY", "drop"))
+
+# Rate limiting: without it anyone can try thousands of passwords per second (see rate_limit.py)
+#   - per login: 10 attempts, then 1 more every 6 seconds (guessing one user's password)
+#   - per client IP: 60 attempts, then 5 per second (one client trying many logins)
+# The buckets live in memory by default. With several uvicorn workers set LESSON6_REDIS_URL
+# so they all share the same buckets (needs `pip install redis`).
+from fastapi import Depends
+from rate_limit import LocalBackend, RateLimitBackend, RateLimiter, client_ip, path_param
+
+rate_backend: RateLimitBackend
+if os.environ.get("LESSON6_REDIS_URL"):
+    import redis
+    from rate_limit import RedisBackend
+    rate_backend = RedisBackend(redis.Redis.from_url(os.environ["LESSON6_REDIS_URL"]))
+else:
+    rate_backend = LocalBackend(capacity=100_000)
+
+login_limiter = RateLimiter("login", rate=1 / 6, burst=10, key_func=path_param("login"), backend=rate_backend)
+ip_limiter = RateLimiter("ip", rate=5, burst=60, key_func=client_ip, backend=rate_backend)
 
 # -------------------------------
 # READ OPERATION: User validation
 # -------------------------------
 # Defining a GET route that validates a user's login using path parameters
-@app.get('/validate_user/{login}/{password}')
-def validate_user(login: str, password: str):  # Path parameters captured from URL
-    if login in users_db:  # Check if login exists in the users_db dictionary
-        # If user exists, check if password matches the stored password
-        if users_db.get(login).get('password') == password:
-            print(f'{login} logged in')  # Print to server logs for confirmation
+# async def: the handler only waits for the hashing process, it doesn't block the event loop
+# the limiters run before the handler, too many attempts get 429 Too Many Requests (with Retry-After)
+@app.get('/validate_user/{login}/{password}', dependencies=[Depends(ip_limiter), Depends(login_limiter)])
+async def validate_user(login: str, password: str):  # Path parameters captured from URL
+    record = users_db.get(login)  # One lookup instead of `in` + get, the user may be deleted in between
+    if record is not None:  # Check if login exists in the users_db
+        # If user exists, hash the given password and compare it with the stored hash (constant time)
+        if await passwords.verify(login, password, record['password']):
+            if passwords.needs_rehash(record['password']):
+                # old plaintext record (or old cost settings): store a fresh hash, only if nobody changed it meanwhile
+                new_record = {"password": await passwords.hash(password)}
+                await run_in_threadpool(users_db.update, login, new_record, record)
+            await audit.emit_async("login", login=login)  # Record the login in the audit log
             return {"User logged in"}   # Respond with success message
         else:
             return {'password doesnt match!'}  # Incorrect password case
@@ -51,12 +122,15 @@ def validate_user(login: str, password: str):  # Path parameters captured from U
 # -------------------------------
 # POST method used to create new resources (users) on the server
 @app.post('/create_user')
-def create_user(u: User):  # `u` is automatically parsed from request body using the User Pydantic model
+async def create_user(u: User):  # `u` is automatically parsed from request body using the User Pydantic model
     if u.login in users_db:
+        return {'User already exists'}  # Cheap early check so we don't hash for nothing
+    # create() checks and inserts atomically, two requests can't both create the same login
+    record = {"password": await passwords.hash(u.password)}
+    if not await run_in_threadpool(users_db.create, u.login, record):
         return {'User already exists'}  # Check for uniqueness of login
     else:
-        users_db[u.login] = {"password": u.password}  # Add new user to the dictionary
-        print(users_db)  # Log the updated users_db
+        await audit.emit_async("create", login=u.login)  # Record what changed, not the whole users_db
         return {
             "msg": "User created successfully",
             "user": u  # Return the user object as confirmation
@@ -67,10 +141,10 @@ def create_user(u: User):  # `u` is automatically parsed from request body using
 # -------------------------------
 # PUT method is used for full update of a resource
 @app.put('/update_user')
-def update_user(u: User):  # Accepts request body in form of User model
-    if u.login in users_db:
-        users_db[u.login] = {"password": u.password}  # Overwrite the existing user password
-        print(users_db)  # Log updated state
+async def update_user(u: User):  # Accepts request body in form of User model
+    record = {"password": await passwords.hash(u.password)}
+    if await run_in_threadpool(users_db.update, u.login, record):  # Overwrite the existing user password (only if it exists)
+        await audit.emit_async("update", login=u.login)  # Record what changed
         return {"msg": "User updated successfully", "user": u}
     else:
         return {'This user doesnt exists'}  # Can't update a user that doesn't exist
@@ -81,13 +155,226 @@ def update_user(u: User):  # Accepts request body in form of User model
 # DELETE method is used to delete a resource
 @app.delete('/delete_user')
 def delete_user(login: str):  # Takes login as a query parameter (?login=username)
-    if login not in users_db:
+    if not users_db.delete(login):  # Remove user, False means it wasn't there
         return {'The user doesnt exist to delete'}  # Cannot delete what doesn't exist
     else:
-        del users_db[login]  # Remove user from dictionary
-        print(users_db)  # Log current state of users_db
+        audit.emit("delete", login=login)  # Record what changed
         return {'The user deleted successfully'}
 
+# -------------------------------
+# BATCH OPERATIONS: many users in one request
+# -------------------------------
+# Provisioning jobs create/delete thousands of users at once. Instead of one HTTP request
+# (and one validation + one lock + one disk write) per user, a batch request sends them all:
+#   - body is a JSON array, or NDJSON (one JSON object per line, Content-Type: application/x-ndjson)
+#   - the whole array is validated in one pass by pydantic (TypeAdapter)
+#   - the store applies it taking each lock once and writes it to disk in one go
+#   - the response has one result per item, in the same order
+import json
+from typing import List, Union
+from fastapi import HTTPException, Request
+from pydantic import TypeAdapter, ValidationError
+
+class LoginRef(BaseModel):  # for deletes only the login matters
+    login: str
+
+user_adapter = TypeAdapter(User)
+users_adapter = TypeAdapter(List[User])
+login_adapter = TypeAdapter(Union[str, LoginRef])
+logins_adapter = TypeAdapter(List[Union[str, LoginRef]])
+
+def parse_batch(body: bytes, content_type: str, list_adapter: TypeAdapter, item_adapter: TypeAdapter) -> list:
+    """Validate a batch body. Returns the validated items, invalid ones are replaced by their ValidationError."""
+    ndjson = "ndjson" in content_type
+    lines = [line for line in body.splitlines() if line.strip()] if ndjson else None
+    try:
+        # fast path: one validation pass over the whole array, straight from the raw bytes
+        return list_adapter.validate_json(b"[" + b",".join(lines) + b"]" if ndjson else body)
+    except ValidationError as exc:
+        error = exc
+    if ndjson:
+        # some line is broken: validate one by one so every other line still gets a result
+        results = []
+        for line in lines:
+            try:
+                results.append(item_adapter.validate_json(line))
+            except ValidationError as exc:
+                results.append(exc)
+        return results
+    try:
+        items = json.loads(body)
+    except ValueError:
+        items = None
+    if not isinstance(items, list):  # a JSON object or string would be split into keys / characters
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    # the errors of the whole-array pass start with the index of their item: the other
+    # items are validated again in one list pass, only the broken ones get their own error
+    broken = {e["loc"][0] for e in error.errors() if e["loc"] and isinstance(e["loc"][0], int)}
+    valid = iter(list_adapter.validate_python([item for i, item in enumerate(items) if i not in broken]))
+    results = []
+    for i, item in enumerate(items):
+        if i not in broken:
+            results.append(next(valid))
+            continue
+        try:
+            results.append(item_adapter.validate_python(item))
+        except ValidationError as exc:
+            results.append(exc)
+    return results
+
+def invalid_result(exc: ValidationError) -> dict:
+    return {"login": None, "status": f"invalid: {exc.errors()[0]['msg']}"}
+
+@app.post('/users:batch')
+async def create_users_batch(request: Request):
+    items = parse_batch(await request.body(), request.headers.get("content-type", ""), users_adapter, user_adapter)
+    valid = [item for item in items if not isinstance(item, ValidationError)]
+    hashes = await passwords.hash_many([u.password for u in valid])
+    created = await run_in_threadpool(
+        users_db.create_many, [(u.login, {"password": h}) for u, h in zip(valid, hashes)])
+
+    results = []
+    outcomes = iter(created)
+    for item in items:
+        if isinstance(item, ValidationError):
+            results.append(invalid_result(item))
+        elif next(outcomes):
+            await audit.emit_async("create", login=item.login)
+            results.append({"login": item.login, "status": "created"})
+        else:
+            results.append({"login": item.login, "status": "User already exists"})
+    return {"results": results}
+
+@app.delete('/users:batch')
+async def delete_users_batch(request: Request):  # body: ["login1", "login2"] or [{"login": "login1"}, ...]
+    items = parse_batch(await request.body(), request.headers.get("content-type", ""), logins_adapter, login_adapter)
+    logins = [item if isinstance(item, str) else item.login for item in items
+              if not isinstance(item, ValidationError)]
+    deleted = await run_in_threadpool(users_db.delete_many, logins)
+
+    results = []
+    outcomes = iter(deleted)
+    for item in items:
+        if isinstance(item, ValidationError):
+            results.append(invalid_result(item))
+            continue
+        login = item if isinstance(item, str) else item.login
+        if next(outcomes):
+            await audit.emit_async("delete", login=login)
+            results.append({"login": login, "status": "deleted"})
+        else:
+            results.append({"login": login, "status": "The user doesnt exist to delete"})
+    return {"results": results}
+
+# -------------------------------
+# BULK EXPORT / IMPORT: NDJSON streams
+# -------------------------------
+# Export streams the whole store as NDJSON, one {"login": ..., "password": <hash>} per line.
+# The generator builds one chunk of lines at a time, so memory use stays flat however many users there are.
+# Import reads the request body piece by piece (it is never loaded whole) and inserts or
+# replaces users every IMPORT_CHUNK lines. Plain passwords are hashed, hashes (e.g. from an export) are kept,
+# but only well-formed ones that cost no more than our own settings (the rest are counted as invalid).
+import time
+from fastapi.responses import StreamingResponse
+from passwords import is_hashed
+
+EXPORT_CHUNK = 1000
+IMPORT_CHUNK = 5000
+
+class StoredUser(BaseModel):
+    login: str
+    password: str  # plain password or an existing scrypt hash
+
+stored_user_adapter = TypeAdapter(StoredUser)
+stored_users_adapter = TypeAdapter(List[StoredUser])
+
+def export_lines():
+    for chunk in users_db.scan(EXPORT_CHUNK):
+        yield "".join(json.dumps({"login": login, **record}) + "\n" for login, record in chunk).encode()
+
+@app.get('/users/export')
+def export_users():
+    return StreamingResponse(export_lines(), media_type="application/x-ndjson")
+
+async def import_chunk(lines: List[bytes], counts: dict) -> None:
+    items = parse_batch(b"\n".join(lines), "application/x-ndjson", stored_users_adapter, stored_user_adapter)
+    valid = [item for item in items
+             if not isinstance(item, ValidationError) and (not is_hashed(item.password) or passwords.acceptable(item.password))]
+    plain = [u for u in valid if not is_hashed(u.password)]
+    for u, hashed in zip(plain, await passwords.hash_many([u.password for u in plain])):
+        u.password = hashed
+    await run_in_threadpool(users_db.upsert_many, [(u.login, {"password": u.password}) for u in valid])
+    counts["imported"] += len(valid)
+    counts["invalid"] += len(items) - len(valid)
+
+@app.post('/users/import')
+async def import_users(request: Request):  # body: NDJSON, one {"login": ..., "password": ...} per line
+    start = time.perf_counter()
+    counts = {"imported": 0, "invalid": 0}
+    lines: List[bytes] = []
+    pending = b""  # an incomplete line left at the end of the last piece
+    async for piece in request.stream():
+        *complete, pending = (pending + piece).split(b"\n")
+        lines.extend(line for line in complete if line.strip())
+        if len(lines) >= IMPORT_CHUNK:
+            await import_chunk(lines, counts)
+            lines = []
+    if pending.strip():
+        lines.append(pending)
+    if lines:
+        await import_chunk(lines, counts)
+
+    elapsed = time.perf_counter() - start
+    await audit.emit_async("import", rows=counts["imported"])
+    return {**counts, "seconds": round(elapsed, 3), "rows_per_sec": round(counts["imported"] / elapsed) if elapsed else None}
+
+# -------------------------------
+# LIST OPERATION: paginated list of users
+# -------------------------------
+# GET /users?limit=100                  -> first 100 logins (sorted) + a cursor for the next page
+# GET /users?after=<cursor>&limit=100   -> the 100 logins after that cursor
+# login_index keeps all logins sorted and is updated on every create/delete, so a page
+# costs O(log n + limit) instead of copying and sorting the whole users_db (see login_index.py)
+from fastapi import Query
+from login_index import LoginIndex, decode_cursor, encode_cursor
+
+login_index = LoginIndex(users_db)
+
+@app.get('/users')
+def list_users(after: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    try:
+        after_login = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    logins = login_index.page(after_login, limit)
+    next_cursor = encode_cursor(logins[-1]) if len(logins) == limit else None
+    return {"users": logins, "next": next_cursor}
+
+# -------------------------------
+# SEARCH: find logins by prefix or by similarity
+# -------------------------------
+# GET /users/search?q=ked                               -> logins starting with "ked"
+# GET /users/search?q=kedr&mode=fuzzy&max_distance=1    -> logins at most 1 typo away from "kedr"
+# prefix search uses the sorted login_index, fuzzy search a trigram index (see fuzzy_index.py)
+# both are listeners of users_db, so create/delete keep them up to date
+from typing import Literal
+from fuzzy_index import FuzzyLoginIndex
+
+fuzzy_index = FuzzyLoginIndex(users_db)
+
+@app.get('/users/search')
+def search_users(q: str, mode: Literal["prefix", "fuzzy"] = "prefix",
+                 max_distance: int = Query(1, ge=0, le=3), limit: int = Query(20, ge=1, le=1000)):
+    if mode == "prefix":
+        return {"users": [{"login": login} for login in login_index.starting_with(q, limit)]}
+    return {"users": [{"login": login, "distance": distance}
+                      for login, distance in fuzzy_index.search(q, max_distance, limit)]}
+
+# Counters of the audit log (written / dropped / sampled out events, queue size)
+@app.get('/audit_stats')
+def audit_stats():
+    return audit.stats()
+
 
 """
 Creating a user from react will look something like this
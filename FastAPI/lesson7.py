@@ -1,7 +1,7 @@
-from fastapi import FastAPI
 from pydantic import BaseModel
+from app_factory import create_app
 
-app = FastAPI()
+app = create_app()
 
 # Internal data model
 class InternalUser(BaseModel):
@@ -16,7 +16,9 @@ class PublicUser(BaseModel):
     name: str
     email: str
 
+# the InternalUser was validated when it was created, so create_app() routes don't validate it again
+# into a PublicUser: they just write the PublicUser fields of it (see projection.py)
 @app.get("/user", response_model=PublicUser)#response_model is a keyword
-def get_user():
+def get_user() -> InternalUser: #response_model wins over the return type, this only tells which model comes back
     user = InternalUser(id=1, name="Kedar", email="kedar@example.com", password="secret")
     return user #this will return user but it will remove passwrod as reponse model= public user doesnt contain passwrod
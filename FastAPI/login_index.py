@@ -0,0 +1,150 @@
+"""
+Sorted index of logins, used by lesson6 for `GET /users?after=<cursor>&limit=N`.
+
+Listing users page by page from the store itself would mean copying and sorting
+every login on every request (O(n log n) per page).
+
+LoginIndex keeps the logins sorted all the time instead. It is a list of small
+sorted lists ("chunks", like the sortedcontainers package does it):
+
+    chunks = [["a", "ab", "b"], ["c", "d", "e"], ["f", "zz"]]
+    maxes  = [      "b",             "e",           "zz"   ]
+
+Finding a position is a binary search over `maxes` and then inside one chunk,
+inserting only shifts one small chunk. A page is found in O(log n) and read in O(limit).
+
+The index registers itself as a listener of the store, so it is updated in the same
+code path as create / delete, through a ChangeQueue (change_queue.py) so that writers of
+different shards don't queue up behind the index lock. The cursor is simply the last login of the previous page:
+the next page starts at the first login *after* it, so it stays correct even if users
+(including the cursor's own login) are created or deleted between two page fetches.
+"""
+
+import base64
+import threading
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+from change_queue import ChangeQueue
+
+
+class LoginIndex:
+    def __init__(self, store=None, chunk_size: int = 512):
+        self.chunk_size = chunk_size
+        self._chunks: List[List[str]] = []
+        self._maxes: List[str] = []
+        self._lock = threading.Lock()
+        self._changes = ChangeQueue(self._lock, self._on_change)
+        if store is not None:
+            store.add_listener(self._changes)
+            self._load(sorted(login for login, _ in store.items()))
+
+    def _load(self, logins: List[str]) -> None:
+        with self._lock:
+            for login in logins:  # already sorted, and nothing else is in the index yet
+                self._add(login)
+
+    def _on_change(self, op: str, login: str) -> None:
+        # called by self._changes with the lock held
+        if op == "delete":
+            self._discard(login)
+        elif op in ("create", "upsert"):
+            self._add(login)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._changes.apply_pending()
+            return sum(len(chunk) for chunk in self._chunks)
+
+    def add(self, login: str) -> None:
+        with self._lock:
+            self._add(login)
+
+    def _add(self, login: str) -> None:
+        if not self._maxes:
+            self._chunks.append([login])
+            self._maxes.append(login)
+            return
+        i = bisect_left(self._maxes, login)
+        if i == len(self._maxes):  # bigger than everything: goes at the end of the last chunk
+            i -= 1
+            chunk = self._chunks[i]
+            chunk.append(login)
+            self._maxes[i] = login
+        else:
+            chunk = self._chunks[i]
+            j = bisect_left(chunk, login)
+            if j < len(chunk) and chunk[j] == login:
+                return  # already indexed
+            chunk.insert(j, login)
+        if len(chunk) > 2 * self.chunk_size:
+            # split a chunk that got too big in two halves
+            half = chunk[self.chunk_size:]
+            del chunk[self.chunk_size:]
+            self._chunks.insert(i + 1, half)
+            self._maxes[i] = chunk[-1]
+            self._maxes.insert(i + 1, half[-1])
+
+    def discard(self, login: str) -> None:
+        with self._lock:
+            self._discard(login)
+
+    def _discard(self, login: str) -> None:
+        i = bisect_left(self._maxes, login)
+        if i == len(self._maxes):
+            return
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, login)
+        if j == len(chunk) or chunk[j] != login:
+            return
+        del chunk[j]
+        if not chunk:
+            del self._chunks[i]
+            del self._maxes[i]
+        elif j == len(chunk):
+            self._maxes[i] = chunk[-1]
+
+    def page(self, after: Optional[str], limit: int) -> List[str]:
+        """Up to `limit` logins that sort after `after` (from the start if None)."""
+        result: List[str] = []
+        with self._lock:
+            self._changes.apply_pending()
+            if after is None:
+                i, j = 0, 0
+            else:
+                i = bisect_right(self._maxes, after)
+                j = bisect_right(self._chunks[i], after) if i < len(self._chunks) else 0
+            while i < len(self._chunks) and len(result) < limit:
+                chunk = self._chunks[i]
+                result.extend(chunk[j:j + limit - len(result)])
+                i, j = i + 1, 0
+        return result
+
+    def starting_with(self, prefix: str, limit: int) -> List[str]:
+        """
+        Up to `limit` logins that start with `prefix`.
+        In sorted order they are one contiguous run beginning at the first login >= prefix,
+        so this is O(log n + limit), the same as walking a trie.
+        """
+        result: List[str] = []
+        with self._lock:
+            self._changes.apply_pending()
+            i = bisect_left(self._maxes, prefix)
+            j = bisect_left(self._chunks[i], prefix) if i < len(self._chunks) else 0
+            while i < len(self._chunks) and len(result) < limit:
+                for login in self._chunks[i][j:]:
+                    if not login.startswith(prefix) or len(result) == limit:
+                        return result
+                    result.append(login)
+                i, j = i + 1, 0
+        return result
+
+
+def encode_cursor(login: str) -> str:
+    return base64.urlsafe_b64encode(login.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """Raises ValueError for a cursor that wasn't made by encode_cursor()."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.b64decode(padded.encode(), altchars=b"-_", validate=True).decode()
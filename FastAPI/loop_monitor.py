@@ -0,0 +1,163 @@
+"""
+Event-loop stall monitor, used by lesson10 to catch `time.sleep` (or any other blocking
+call) inside an `async def` handler.
+
+All `async def` handlers share one thread: the event loop. While one of them blocks,
+no other request moves at all, and from the outside it only shows up as latency spikes
+on random endpoints. LoopMonitor finds the culprit:
+
+  - heartbeat: a task on the loop that sleeps `interval` seconds and checks how late it
+    woke up. The delay (lag) is how long the loop was busy with something else; lags
+    above `threshold` are counted as stalls
+  - watchdog: a thread that notices when the heartbeat is overdue by more than
+    `threshold`, i.e. while the loop is still stuck, and takes the stack of the loop's
+    thread right then (sys._current_frames()). That stack ends in the blocking call,
+    e.g. bad_handler -> time.sleep
+  - the middleware remembers which request each task is serving, so the stall is put
+    on the route of the task that was running (`GET /bad`), or on "-" if it wasn't a request
+
+stats() has the lag percentiles, stalls per route and the latest stalls with their
+stacks. A heartbeat every 20 ms and a dict insert/remove per request cost very little,
+so it can stay on in production (see benchmarks/bench_loop_monitor.py).
+
+Stalls shorter than the watchdog's period (threshold / 2) may be counted without a stack.
+"""
+
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Deque, Dict, List, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+def _route_name(scope: Optional[Scope]) -> str:
+    if scope is None:
+        return "-"
+    route = scope.get("route")  # set by the router once the request is matched
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+class LoopMonitor:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.02, stack_limit: int = 25, keep: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_limit = stack_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._beat = time.monotonic()  # when the heartbeat last ran
+        self._scopes: Dict[asyncio.Task, Scope] = {}  # task -> request it is serving
+        self._stall: Optional[Dict[str, Any]] = None  # stall the watchdog is seeing right now
+        self._lock = threading.Lock()
+        self._lags: Deque[float] = collections.deque(maxlen=4096)
+        self.stalls: Deque[Dict[str, Any]] = collections.deque(maxlen=keep)
+        self.routes: Dict[str, List[float]] = {}  # route -> [stalls, total seconds, longest]
+        self.stall_count = 0
+
+    def install(self, app) -> "LoopMonitor":
+        app.add_middleware(LoopMonitorMiddleware, monitor=self)
+        return self
+
+    def start(self) -> None:
+        """Watch the running loop (called by the middleware, so mounted apps work too)."""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        with self._lock:
+            self._loop = loop
+            self._loop_thread = threading.get_ident()
+            self._beat = time.monotonic()
+            self._stall = None  # left over if the previous loop was closed while stuck
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+            self._watchdog.start()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._loop is loop:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - expected)
+            with self._lock:
+                self._lags.append(lag)
+                if lag >= self.threshold:
+                    self._close_stall(lag)
+
+    def _close_stall(self, lag: float) -> None:
+        # the loop is running again: the stall is over and we know how long it was
+        stall = self._stall or {"route": "-", "at": time.time() - lag, "stack": None}
+        self._stall = None
+        stall["ms"] = round(lag * 1000, 1)
+        self.stall_count += 1
+        counters = self.routes.setdefault(stall["route"], [0, 0.0, 0.0])
+        counters[0] += 1
+        counters[1] += lag
+        counters[2] = max(counters[2], lag)
+        self.stalls.append(stall)
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.threshold / 2)
+            loop = self._loop
+            if loop is None or loop.is_closed() or self._stall is not None:
+                continue
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            task = asyncio.current_task(loop)  # the task that is blocking the loop
+            stack = traceback.format_list(traceback.extract_stack(frame)[-self.stack_limit:]) if frame else None
+            with self._lock:
+                if self._beat + self.interval + self.threshold <= time.monotonic():  # still stuck
+                    self._stall = {"route": _route_name(self._scopes.get(task)), "at": time.time() - overdue,
+                                   "task": task.get_name() if task is not None else None,
+                                   "stack": [line.rstrip() for line in stack] if stack else None}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lags = sorted(self._lags)
+            current = dict(self._stall) if self._stall is not None else None
+            routes = {route: {"stalls": count, "total_ms": round(total * 1000, 1), "max_ms": round(longest * 1000, 1)}
+                      for route, (count, total, longest) in self.routes.items()}
+            recent = list(self.stalls)[::-1]
+
+        def lag_ms(fraction: float) -> Optional[float]:
+            return round(lags[min(len(lags) - 1, int(fraction * len(lags)))] * 1000, 2) if lags else None
+
+        if current is not None:
+            current["blocked_ms"] = round((time.monotonic() - self._beat) * 1000, 1)
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {"p50": lag_ms(0.5), "p99": lag_ms(0.99), "max": lag_ms(1.0)},
+            "stalls": self.stall_count,
+            "blocked_now": current,
+            "routes": routes,
+            "recent": recent,
+        }
+
+
+class LoopMonitorMiddleware:
+    def __init__(self, app: ASGIApp, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.monitor.start()
+        task = asyncio.current_task()
+        scopes = self.monitor._scopes
+        scopes[task] = scope  # the same dict the router writes scope["route"] into
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            scopes.pop(task, None)
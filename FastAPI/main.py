@@ -0,0 +1,127 @@
+"""
+All the lesson apps in one process.
+
+Every lesson file makes its own `app`, and running them all meant one uvicorn per lesson:
+one Python interpreter each, every one of them importing FastAPI and pydantic and holding
+its own copy in memory. Here they are mounted under a prefix of a single app:
+
+    cd FastAPI
+    uvicorn main:app
+
+    http://127.0.0.1:8000/lesson1/          -> lesson1's /
+    http://127.0.0.1:8000/lesson6/users     -> lesson6's /users
+    http://127.0.0.1:8000/lesson3/docs      -> lesson3's Swagger UI
+
+A lesson is only imported when its first request comes in (lesson6, for example, opens its
+data folder and starts background threads, no need to pay for that if nobody uses it).
+Set LESSONS_PRELOAD=1 to import them all at startup instead, so no user waits for an import.
+
+GET /apps shows how long each lesson took to import and how much the process memory (RSS)
+grew while it did, which is roughly what that lesson would cost as an extra worker on top of
+the shared FastAPI/pydantic imports. `python main.py` imports them all and prints the same table.
+
+Mounted apps don't get lifespan (startup/shutdown) events; none of the lessons use them.
+"""
+
+import importlib
+import os
+import resource
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app_factory import create_app
+
+LESSONS = ["lesson1", "lesson2", "lesson3", "lesson5", "lesson6", "lesson7", "lesson10"]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # not Linux: peak RSS is the best we have
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LazyApp:
+    """ASGI app that imports `module` and hands over to its `app` on the first request."""
+
+    def __init__(self, module: str, attribute: str = "app"):
+        self.module = module
+        self.attribute = attribute
+        self.app: Optional[ASGIApp] = None
+        self.import_seconds: Optional[float] = None
+        self.rss_growth: Optional[int] = None
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        app = self.app
+        if app is None:
+            # importing runs module code (opening files, hashing seed passwords ...),
+            # so it happens on the threadpool and the event loop keeps serving the other lessons
+            app = await run_in_threadpool(self.load)
+        await app(scope, receive, send)
+
+    def load(self) -> ASGIApp:
+        with self._lock:  # two first requests at once: the second one waits for the first import
+            if self.app is None:
+                before = rss_bytes()
+                start = time.perf_counter()
+                module = importlib.import_module(self.module)
+                self.import_seconds = time.perf_counter() - start
+                self.rss_growth = rss_bytes() - before
+                self.app = getattr(module, self.attribute)
+        return self.app
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": self.app is not None,
+            "import_ms": None if self.import_seconds is None else round(self.import_seconds * 1000, 1),
+            "rss_mb": None if self.rss_growth is None else round(self.rss_growth / 2 ** 20, 1),
+        }
+
+
+lessons = {name: LazyApp(name) for name in LESSONS}
+BASE_RSS = rss_bytes()  # after importing FastAPI itself, which all lessons share
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if os.environ.get("LESSONS_PRELOAD") == "1":
+        for lesson in lessons.values():
+            await run_in_threadpool(lesson.load)
+    yield
+
+
+app = create_app(lifespan=lifespan)
+
+
+@app.get("/")
+def index():
+    return {"lessons": [f"/{name}/" for name in lessons]}
+
+
+@app.get("/apps")
+def apps():
+    return {
+        "process_rss_mb": round(rss_bytes() / 2 ** 20, 1),
+        "shared_rss_mb": round(BASE_RSS / 2 ** 20, 1),
+        "apps": {name: lesson.stats() for name, lesson in lessons.items()},
+    }
+
+
+for name, lesson in lessons.items():
+    app.mount(f"/{name}", lesson, name=name)
+
+
+if __name__ == "__main__":
+    print(f"shared (python + FastAPI + pydantic): {BASE_RSS / 2 ** 20:.1f} MB")
+    for name, lesson in lessons.items():
+        lesson.load()
+        stats = lesson.stats()
+        print(f"{name:<10} import {stats['import_ms']:>8.1f} ms   RSS +{stats['rss_mb']:.1f} MB")
+    print(f"total: {rss_bytes() / 2 ** 20:.1f} MB in one process")
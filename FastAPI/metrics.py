@@ -0,0 +1,207 @@
+"""
+Request metrics for the apps made by create_app() (app_factory.py), in Prometheus format at /metrics.
+
+For every route and method (`GET /users/{login}`, not every login separately):
+
+    http_request_duration_seconds   histogram: time from the request coming in to the last byte sent
+    http_response_size_bytes        histogram: response body size
+    http_requests_total             counter, by status code
+
+plus http_requests_in_flight, the requests being served right now.
+
+Histograms are log-linear, like HdrHistogram: values are kept with two significant
+digits, so every power of ten is split in 90 buckets ((1.0, 1.1] ms, (1.1, 1.2] ms ...).
+That is at most 10% error at any scale, with a fixed 730 counters per histogram however
+many requests come in. /metrics adds them up into the usual Prometheus buckets
+(le="0.005", "0.01" ..., all of which are bucket edges, so nothing is approximated there).
+Buckets include their upper edge, like Prometheus' `le` ("less or equal"): a response of
+exactly 1000 bytes is counted in le="1000".
+
+No locks: the counters are only updated by the middleware, which runs on the event loop
+thread, one request at a time. /metrics is a `def` endpoint, so it is rendered on the
+threadpool from copies of the counters while requests keep being served; a scrape may
+miss a request that is being recorded at that moment, the next one will have it.
+
+All apps of the process share one registry. When main.py mounts the lessons, only the
+outermost middleware records a request and the route includes the mount prefix
+(`GET /lesson6/users`), so /metrics of any of them shows everything.
+"""
+
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.routing import Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+_POW10 = [10 ** k for k in range(12)]
+_MAX_DECADE = 9  # values up to 10**9 (1000 s in microseconds, 1 GB in bytes), bigger ones go in the last bucket
+SIZE = 100 + (_MAX_DECADE - 2) * 90
+
+LATENCY_BOUNDS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # seconds
+SIZE_BOUNDS = [100, 1000, 10_000, 100_000, 1_000_000, 10_000_000]  # bytes
+
+
+def _index(value: int) -> int:
+    if value < 100:
+        return max(value, 0)  # 0 .. 99 exactly
+    decade = bisect.bisect_right(_POW10, value) - 1  # value is in [10**decade, 10**(decade + 1))
+    if decade >= _MAX_DECADE:
+        return SIZE - 1
+    return 100 + (decade - 2) * 90 + value // _POW10[decade - 1] - 10
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * SIZE
+        self.sum = 0
+
+    def record(self, value: int) -> None:
+        # value - 1: the buckets of _index() are [low, high), these are (low, high]
+        self.counts[_index(value - 1)] += 1
+        self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], int]:
+        return list(self.counts), self.sum
+
+    @staticmethod
+    def below(counts: List[int], bounds: List[int]) -> List[int]:
+        """How many values are <= each bound (bounds in the recorded unit, increasing)."""
+        result, total, position = [], 0, 0
+        for bound in bounds:
+            end = _index(bound - 1) + 1
+            total += sum(counts[position:end])
+            position = end
+            result.append(total)
+        return result
+
+
+class RouteSeries:
+    __slots__ = ("latency", "size", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram()  # microseconds
+        self.size = Histogram()  # bytes
+        self.statuses: Dict[int, int] = {}
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.series: Dict[Tuple[str, str], RouteSeries] = {}
+        self.in_flight = 0
+
+    def record(self, route: str, method: str, status: int, seconds: float, size: int) -> None:
+        series = self.series.get((route, method))
+        if series is None:
+            series = self.series[route, method] = RouteSeries()
+        series.latency.record(int(seconds * 1_000_000))
+        series.size.record(size)
+        series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        # list(): a copy, requests may add series meanwhile
+        items = sorted(list(self.series.items()), key=lambda item: item[0])
+        counters = ["# HELP http_requests_total Requests served, by route, method and status.",
+                    "# TYPE http_requests_total counter"]
+        latency = ["# HELP http_request_duration_seconds Time to serve a request.",
+                   "# TYPE http_request_duration_seconds histogram"]
+        sizes = ["# HELP http_response_size_bytes Size of response bodies.",
+                 "# TYPE http_response_size_bytes histogram"]
+        latency_bounds = [round(bound * 1_000_000) for bound in LATENCY_BOUNDS]
+        for (route, method), series in items:
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            for status, count in sorted(dict(series.statuses).items()):
+                counters.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+            counts, total = series.latency.snapshot()
+            for bound, below in zip(LATENCY_BOUNDS, Histogram.below(counts, latency_bounds)):
+                latency.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {below}')
+            latency.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {sum(counts)}')
+            latency.append(f"http_request_duration_seconds_sum{{{labels}}} {total / 1_000_000}")
+            latency.append(f"http_request_duration_seconds_count{{{labels}}} {sum(counts)}")
+            counts, total = series.size.snapshot()
+            for bound, below in zip(SIZE_BOUNDS, Histogram.below(counts, SIZE_BOUNDS)):
+                sizes.append(f'http_response_size_bytes_bucket{{{labels},le="{bound}"}} {below}')
+            sizes.append(f'http_response_size_bytes_bucket{{{labels},le="+Inf"}} {sum(counts)}')
+            sizes.append(f"http_response_size_bytes_sum{{{labels}}} {total}")
+            sizes.append(f"http_response_size_bytes_count{{{labels}}} {sum(counts)}")
+        return "\n".join(lines + counters + latency + sizes) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+_RECORDING = "metrics.recording"  # scope key: an outer middleware is already recording this request
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry = REGISTRY):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get(_RECORDING):
+            await self.app(scope, receive, send)
+            return
+        scope[_RECORDING] = True
+        root_path = scope.get("root_path", "")
+        start = time.perf_counter()
+        status = 500  # if the app fails without answering
+        size = 0
+
+        async def send_and_count(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        registry = self.registry
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_and_count)
+        finally:
+            registry.in_flight -= 1
+            registry.record(self.route_name(scope, root_path), scope["method"], status,
+                            time.perf_counter() - start, size)
+
+    @staticmethod
+    def route_name(scope: Scope, root_path: str) -> str:
+        # the route template, so /users/kedar and /users/john are one series; mounted apps
+        # (main.py) add to root_path on the way in, that part is the mount prefix
+        route: Optional[object] = scope.get("route")
+        path = getattr(route, "path", None)
+        if path is None:
+            path = _plain_route_path(scope)
+        if path is None:
+            return "(unmatched)"  # 404s: not one series per made-up URL
+        return scope.get("root_path", "")[len(root_path):] + path
+
+
+def _plain_route_path(scope: Scope) -> Optional[str]:
+    # FastAPI only puts its own APIRoutes in scope["route"]; plain Starlette routes like
+    # /openapi.json and /docs are looked up again in the router of the app that served the
+    # request (scope["app"] is the innermost one, the mounted lesson under main.py)
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", ()):
+        if not isinstance(route, Mount) and route.matches(scope)[0] == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+def metrics_endpoint(registry: MetricsRegistry = REGISTRY):
+    def metrics(request: Request) -> Response:
+        # `def`: rendered on the threadpool, the event loop keeps serving requests
+        return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    return metrics
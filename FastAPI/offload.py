@@ -0,0 +1,179 @@
+"""
+Bounded pools for blocking handlers, used by lesson10.
+
+FastAPI runs every `def` handler on one shared threadpool (40 threads by default). A few
+dozen requests to a handler doing `time.sleep(5)` take all of them, and then every other
+`def` endpoint of the app waits in line too, even the ones that would answer in 1 ms.
+(`time.sleep` inside an `async def` is worse: it stops the event loop, so nothing runs at all.)
+
+An OffloadPool gives a kind of work its own pool, sized for it:
+
+    io_pool = OffloadPool("io", workers=16, max_queue=32)              # threads, for sleeping/waiting
+    cpu_pool = OffloadPool("cpu", workers=4, max_queue=8, processes=True)  # processes, for computing
+
+    @app.get("/report")
+    @io_pool.offload
+    def report(): ...
+
+The decorated handler becomes an `async def` that hands the work to the pool and waits
+for it without holding a thread of the shared pool or blocking the event loop.
+
+Admission control: at most `workers` jobs run and `max_queue` wait. When both are full the
+request is refused right away with 503 Service Unavailable (and Retry-After) instead of
+piling up, and a job that waited longer than `queue_timeout` seconds without starting gets
+a 503 too (the client has probably given up by then). If the client disconnects, its job
+is dropped from the queue.
+
+Process pools (the GIL lets only one thread compute Python code at a time, so CPU-bound
+work needs processes to use more than one core) run the original function in another
+process: its arguments and result are pickled, and the worker imports the module the
+handler is in. Workers are started with "spawn", which is safe next to the server's threads.
+
+stats() gives the queue depth, jobs running, totals and wait/run time percentiles.
+"""
+
+import asyncio
+import collections
+import functools
+import importlib
+import inspect
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+
+def _timed_call(function: Callable, args: tuple, kwargs: dict) -> Tuple[float, float, Any]:
+    # time.monotonic() is the same clock in every process of the machine
+    started = time.monotonic()
+    result = function(*args, **kwargs)
+    return started, time.monotonic(), result
+
+
+def _call_handler(module: str, qualname: str, args: tuple, kwargs: dict) -> Tuple[float, float, Any]:
+    # in a pool process: the module attribute is the decorated (async) handler, run the function under it
+    target: Any = sys.modules.get(module) or importlib.import_module(module)
+    for name in qualname.split("."):
+        target = getattr(target, name)
+    return _timed_call(inspect.unwrap(target), args, kwargs)
+
+
+def _percentile_ms(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+
+class OffloadPool:
+    def __init__(self, name: str, workers: int, max_queue: int = 0, queue_timeout: Optional[float] = None,
+                 processes: bool = False, retry_after: int = 1, samples: int = 2048):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.processes = processes
+        self.retry_after = retry_after
+        self._executor: Optional[Executor] = None
+        self._pending: Set[Future] = set()  # submitted, not finished: queued or running
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = collections.deque(maxlen=samples)  # seconds, most recent jobs
+        self._runs: Deque[float] = collections.deque(maxlen=samples)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def executor(self) -> Executor:
+        # made on first use: no idle threads or processes for pools nobody calls
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.processes:
+                        self._executor = ProcessPoolExecutor(
+                            self.workers, mp_context=multiprocessing.get_context("spawn"))
+                    else:
+                        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=f"offload-{self.name}")
+        return self._executor
+
+    def _reject(self, detail: str) -> HTTPException:
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    def _finished(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failed += 1
+                if isinstance(future.exception(), BrokenExecutor) and self._executor is future.executor:
+                    self._executor = None  # a worker process died (killed, out of memory ...): start a new pool
+                return
+            started, finished, _ = future.result()
+            self.completed += 1
+            self._waits.append(started - future.submitted)
+            self._runs.append(finished - started)
+
+    async def run(self, function: Callable, *args, **kwargs) -> Any:
+        """Run function(*args, **kwargs) on the pool; 503 if it is full or the job waited too long."""
+        executor = self.executor
+        with self._lock:
+            if len(self._pending) >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise self._reject(f"{self.name} pool is busy")
+            self.submitted += 1
+            submitted = time.monotonic()
+            if self.processes:
+                future = executor.submit(_call_handler, function.__module__, function.__qualname__, args, kwargs)
+            else:
+                future = executor.submit(_timed_call, function, args, kwargs)
+            future.submitted = submitted
+            future.executor = executor
+            self._pending.add(future)
+        future.add_done_callback(self._finished)
+        waiter = asyncio.wrap_future(future)  # cancelling the request cancels a queued job
+        if self.queue_timeout is not None:
+            done, _ = await asyncio.wait({waiter}, timeout=self.queue_timeout)
+            if not done and future.cancel():  # cancel() only succeeds if it hasn't started
+                with self._lock:
+                    self.timed_out += 1
+                raise self._reject(f"waited more than {self.queue_timeout}s for the {self.name} pool")
+        return (await waiter)[2]
+
+    def offload(self, handler: Callable) -> Callable:
+        """Decorator: run the `def` handler on this pool. FastAPI still sees its parameters."""
+        if inspect.iscoroutinefunction(handler):
+            raise TypeError(f"{handler.__qualname__} is async, only `def` handlers can be offloaded")
+        if self.processes and "<locals>" in handler.__qualname__:
+            raise TypeError(f"{handler.__qualname__}: a process pool can only run module-level functions")
+
+        @functools.wraps(handler)  # same signature, so FastAPI reads the same parameters
+        async def offloaded(*args, **kwargs):
+            return await self.run(handler, *args, **kwargs)
+        return offloaded
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sum(1 for future in self._pending if future.running())
+            queued = len(self._pending) - running
+            waits, runs = list(self._waits), list(self._runs)
+        return {
+            "kind": "processes" if self.processes else "threads",
+            "workers": self.workers, "max_queue": self.max_queue,
+            "running": running, "queued": queued,
+            "submitted": self.submitted, "completed": self.completed, "failed": self.failed,
+            "rejected": self.rejected, "timed_out": self.timed_out,
+            "wait_ms": {"p50": _percentile_ms(waits, 0.5), "p99": _percentile_ms(waits, 0.99),
+                        "max": _percentile_ms(waits, 1.0)},
+            "run_ms": {"p50": _percentile_ms(runs, 0.5), "p99": _percentile_ms(runs, 0.99)},
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
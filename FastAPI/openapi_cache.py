@@ -0,0 +1,252 @@
+"""
+OpenAPI document built once and kept on disk, for /docs, /redoc and /openapi.json.
+
+FastAPI builds the OpenAPI schema the first time /openapi.json is requested (the page at
+/docs or /redoc asks for it right away). That walks every route and turns every model into
+JSON schema, which takes a while for big apps, and every worker process does it again.
+
+OpenAPICache does it once:
+
+  - the route table and models are fingerprinted: paths, methods, parameters, response
+    models, and every field of every model involved (plus the FastAPI/pydantic versions).
+    The hash of that names the file, e.g. openapi-lesson6-3f2a...c1.json
+  - if the file is there, it is used as is: memory-mapped, so all workers share the same
+    pages, and served together with a gzip copy (openapi-...json.gz, compressed once at
+    the highest level) to clients that accept gzip
+  - if not, the schema is built with app.openapi(), both files are written (to a temporary
+    name first, then renamed, so a worker never sees half a file) and older files of the
+    same app are removed. Changing a route or a model changes the hash, so the next start
+    builds a new file by itself
+
+The files are made on the first /openapi.json request, or ahead of time (at build time)
+with
+
+    python openapi_cache.py lesson6:app --dir /path/to/cache
+
+Apps made by create_app() use it when OPENAPI_CACHE_DIR is set (or create_app(openapi_cache_dir=...)).
+
+Only what goes into the fingerprint is noticed: things like a custom app.openapi() or an
+edited docstring of a dependency are not. Delete the files (or the folder) after such changes.
+"""
+
+import argparse
+import enum
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+import threading
+import typing
+from collections import Counter
+from typing import Any, List, Optional, Tuple
+
+import fastapi
+import pydantic
+from fastapi import FastAPI, Request, Response
+from fastapi.dependencies.models import Dependant
+from fastapi.routing import APIRoute
+from fastapi.security.base import SecurityBase
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from response_cache import _etag_matches
+
+_ADDRESS = re.compile(r" at 0x[0-9a-f]+")  # <function f at 0x7f..> differs in every process
+
+
+def _stable_repr(value: Any) -> str:
+    return _ADDRESS.sub("", repr(value))
+
+
+def _type_fingerprint(annotation: Any, seen: set, out: List[Any]) -> None:
+    """Add `annotation`, and every model and enum it refers to, to `out`."""
+    out.append(_stable_repr(annotation))
+    if isinstance(annotation, type) and annotation not in seen:
+        if issubclass(annotation, BaseModel):
+            seen.add(annotation)
+            out.append((annotation.__module__, annotation.__qualname__, annotation.__doc__,
+                        _stable_repr(annotation.model_config)))
+            for name, field in annotation.model_fields.items():
+                out.append((name, field.alias, field.serialization_alias, field.description, field.title,
+                            _stable_repr(field.default), _stable_repr(field.examples),
+                            _stable_repr(field.json_schema_extra), _stable_repr(field.metadata)))
+                _type_fingerprint(field.annotation, seen, out)
+        elif issubclass(annotation, enum.Enum):
+            seen.add(annotation)
+            out.append([(member.name, _stable_repr(member.value)) for member in annotation])
+    for arg in typing.get_args(annotation):
+        _type_fingerprint(arg, seen, out)
+
+
+def _dependant_fingerprint(dependant: Dependant, seen: set, out: List[Any]) -> None:
+    """Parameters of a route and of all its dependencies, OAuth2PasswordBearer(...) and friends included."""
+    for params in (dependant.path_params, dependant.query_params, dependant.header_params,
+                   dependant.cookie_params, dependant.body_params):
+        for param in params:
+            info = param.field_info
+            out.append((param.name, param.alias, _stable_repr(info)))
+            _type_fingerprint(info.annotation, seen, out)
+    for sub in dependant.dependencies:
+        if isinstance(sub.call, SecurityBase):  # ends up under components.securitySchemes
+            out.append((sub.call.scheme_name, _stable_repr(sub.call.model), sorted(sub.own_oauth_scopes or [])))
+        _dependant_fingerprint(sub, seen, out)
+
+
+def fingerprint(app: FastAPI) -> str:
+    """Hash of everything the OpenAPI document is made from."""
+    out: List[Any] = [fastapi.__version__, pydantic.VERSION, app.title, app.version, app.openapi_version,
+                      app.summary, app.description, _stable_repr(app.openapi_tags), _stable_repr(app.servers)]
+    seen: set = set()
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            out.append((type(route).__name__, getattr(route, "path", None)))
+            continue
+        if not route.include_in_schema:
+            continue
+        out.append((route.path, sorted(route.methods), route.name, route.operation_id, route.summary,
+                    route.description, route.response_description, route.status_code, route.deprecated,
+                    _stable_repr(route.tags), _stable_repr(route.responses), _stable_repr(route.openapi_extra),
+                    _stable_repr(route.response_class)))
+        _type_fingerprint(route.response_model, seen, out)
+        _dependant_fingerprint(route.dependant, seen, out)
+    return hashlib.blake2b(_stable_repr(out).encode(), digest_size=16).hexdigest()
+
+
+def app_name(app: FastAPI) -> str:
+    """Module most of the routes come from ("lesson6"), to tell apps apart in a shared folder."""
+    modules = Counter(route.endpoint.__module__ for route in app.routes if isinstance(route, APIRoute))
+    return modules.most_common(1)[0][0].replace(".", "_") if modules else "app"
+
+
+def _map(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _write(path: str, data: bytes) -> None:
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".openapi-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)  # atomic: other workers see the old file or the whole new one
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _accepts_gzip(header: str) -> bool:
+    for coding in header.split(","):
+        name, _, parameters = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return parameters.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class OpenAPICache:
+    def __init__(self, app: FastAPI, directory: str):
+        self.app = app
+        self.directory = directory
+        self.key: Optional[str] = None
+        self.built = False  # True if this process had to build the schema
+        self._routes = -1  # len(app.routes) when the key was computed
+        self._json: Optional[mmap.mmap] = None
+        self._gzip: Optional[mmap.mmap] = None
+        self._variants = {}  # root_path -> (json, gzip, etag), see _variant()
+        self._lock = threading.Lock()
+
+    def install(self) -> "OpenAPICache":
+        """Serve app.openapi_url from the cache instead of FastAPI's own handler."""
+        self.app.router.routes[:] = [route for route in self.app.router.routes
+                                     if getattr(route, "path", None) != self.app.openapi_url]
+        self.app.add_route(self.app.openapi_url, self.endpoint, include_in_schema=False)
+        self.app.state.openapi_cache = self
+        return self
+
+    def paths(self, key: str) -> Tuple[str, str]:
+        path = os.path.join(self.directory, f"openapi-{app_name(self.app)}-{key}.json")
+        return path, path + ".gz"
+
+    def load(self) -> Tuple[memoryview, memoryview, str]:
+        """The document, its gzip copy and ETag; built and written first if the file isn't there."""
+        with self._lock:
+            if self._routes != len(self.app.routes):
+                key = fingerprint(self.app)
+                if key != self.key:
+                    self._open(key)
+                self._routes = len(self.app.routes)
+            return memoryview(self._json), memoryview(self._gzip), f'"{self.key}"'
+
+    def _open(self, key: str) -> None:
+        json_path, gzip_path = self.paths(key)
+        try:
+            mapped = _map(json_path), _map(gzip_path)
+        except (OSError, ValueError):  # missing (or empty, mmap refuses those): build it
+            self._build(key)
+            mapped = _map(json_path), _map(gzip_path)
+        self._json, self._gzip = mapped
+        self.key = key
+        self._variants.clear()
+
+    def _build(self, key: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.app.openapi_schema = None  # build it now, not the one FastAPI may have kept
+        # same encoding as FastAPI's JSONResponse
+        body = json.dumps(self.app.openapi(), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+        json_path, gzip_path = self.paths(key)
+        _write(gzip_path, gzip.compress(body, compresslevel=9, mtime=0))
+        _write(json_path, body)  # last: a worker that finds the .json finds the .gz too
+        self.built = True
+        prefix = f"openapi-{app_name(self.app)}-"
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and not name.startswith(os.path.basename(json_path)):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass  # another worker removed it first
+
+    def _variant(self, root_path: str) -> Tuple[Any, Any, str]:
+        body, compressed, etag = self.load()
+        if not root_path or not self.app.root_path_in_servers:
+            return body, compressed, etag
+        # mounted (main.py) or behind a proxy: FastAPI lists the root path as a server,
+        # that document is made once per root path and kept in memory
+        variant = self._variants.get(root_path)
+        if variant is None or variant[2] != etag:
+            schema = json.loads(bytes(body))
+            if root_path not in {server.get("url") for server in schema.get("servers", [])}:
+                schema["servers"] = [{"url": root_path}] + schema.get("servers", [])
+            data = json.dumps(schema, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+            variant = self._variants[root_path] = (data, gzip.compress(data, compresslevel=9, mtime=0), etag)
+        body, compressed, _ = variant
+        return body, compressed, etag[:-1] + "-" + hashlib.blake2b(root_path.encode(), digest_size=4).hexdigest() + '"'
+
+    async def endpoint(self, request: Request) -> Response:
+        # the first request may build the schema: on the threadpool, not on the event loop
+        body, compressed, etag = await run_in_threadpool(self._variant, request.scope.get("root_path", "").rstrip("/"))
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        if _accepts_gzip(request.headers.get("accept-encoding", "")):
+            headers["Content-Encoding"] = "gzip"
+            body = compressed
+        return Response(body, media_type="application/json", headers=headers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="write the OpenAPI files of an app ahead of time")
+    parser.add_argument("target", help="module:app, e.g. lesson6:app")
+    parser.add_argument("--dir", default=os.environ.get("OPENAPI_CACHE_DIR"), help="default: $OPENAPI_CACHE_DIR")
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("--dir or OPENAPI_CACHE_DIR is needed")
+    module_name, _, attribute = args.target.partition(":")
+    __import__(module_name)
+    app = getattr(sys.modules[module_name], attribute or "app")
+    cache = OpenAPICache(app, args.dir)
+    cache.load()
+    print(("built " if cache.built else "up to date ") + cache.paths(cache.key)[0])
@@ -0,0 +1,168 @@
+"""
+Password hashing for lesson6.
+
+Storing plaintext passwords and checking them with `==` has two problems:
+anyone who can read users_db (or the data folder) sees every password, and `==`
+stops at the first different character, so response time leaks how much of a
+guess was right.
+
+Here passwords are stored as salted scrypt hashes. scrypt is memory-hard: every
+guess needs `128 * r * n` bytes of RAM (16 MB with the defaults), which makes
+brute forcing with GPUs expensive. Comparisons use hmac.compare_digest (constant time).
+
+Hashing is slow on purpose, so it must never run on the event loop or on the
+Starlette threadpool. PasswordHasher runs it in a separate process pool and
+keeps a short-lived LRU cache of recent successful logins, so a client that logs
+in many times in a burst only pays for the hash once. The cache key is an HMAC
+of (login, password) with a random per-process key, the password itself is never kept.
+
+Stored format:  scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+"""
+
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+PREFIX = "scrypt"
+
+
+def hash_password(password: str, n: int = 2 ** 14, r: int = 8, p: int = 1) -> str:
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return f"{PREFIX}${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        # plaintext left over from before passwords were hashed
+        return hmac.compare_digest(password.encode(), stored.encode())
+    parsed = parse_hash(stored)
+    if parsed is None:
+        return False  # a damaged hash matches no password
+    n, r, p, salt, digest = parsed
+    return hmac.compare_digest(_scrypt(password, salt, n, r, p), digest)
+
+
+def _hash_chunk(passwords: List[str], n: int, r: int, p: int) -> List[str]:
+    return [hash_password(password, n, r, p) for password in passwords]
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(PREFIX + "$")
+
+
+def parse_hash(stored: str) -> Optional[Tuple[int, int, int, bytes, bytes]]:
+    """(n, r, p, salt, digest) of a stored hash, None if it is not exactly in the stored format."""
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != PREFIX or not all(part.isdigit() and part.isascii() for part in parts[1:4]):
+        return None
+    n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+    try:
+        salt, digest = bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+    except ValueError:
+        return None
+    if n < 2 or n & (n - 1) or r < 1 or p < 1 or not salt or len(digest) != 32:
+        return None
+    return n, r, p, salt, digest
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem must be above 128 * r * n or OpenSSL refuses the bigger cost settings
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n + 1024 * 1024, dklen=32)
+
+
+class PasswordHasher:
+    """Runs hashing/verification in a process pool and caches recent successful logins."""
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1, workers: Optional[int] = None,
+                 cache_size: int = 10_000, cache_ttl: float = 30.0):
+        self.n, self.r, self.p = n, r, p
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._cache_key = os.urandom(32)
+        self._cache: "OrderedDict[bytes, tuple]" = OrderedDict()  # key -> (expires at, stored hash)
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # created on first use so importing lesson6 doesn't start processes; "spawn" because by
+        # then the process has threads (WAL flusher, audit writer ...) and a forked child could
+        # inherit one of their locks held forever
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), hash_password, password, self.n, self.r, self.p)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """hash() for a whole batch, sent to the pool in a few chunks instead of one task per password."""
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        size = max(1, len(passwords) // (4 * (self.workers or os.cpu_count() or 1)))
+        chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, _hash_chunk, chunk, self.n, self.r, self.p) for chunk in chunks))
+        return [hashed for chunk in results for hashed in chunk]
+
+    async def verify(self, login: str, password: str, stored: str) -> bool:
+        key = hmac.new(self._cache_key, login.encode() + b"\0" + password.encode(), hashlib.sha256).digest()
+        if self._cached(key, stored):
+            return True
+        loop = asyncio.get_running_loop()
+        ok = await loop.run_in_executor(self._executor(), verify_password, password, stored)
+        if ok:
+            self._remember(key, stored)
+        return ok
+
+    def needs_rehash(self, stored: str) -> bool:
+        """True for plaintext or hashes made with other cost settings."""
+        parsed = parse_hash(stored)
+        return parsed is None or parsed[:3] != (self.n, self.r, self.p)
+
+    def acceptable(self, stored: str) -> bool:
+        """
+        True if `stored` is a well-formed hash that costs no more than this hasher's settings.
+        Hashes coming from outside (imports) are checked with it: a huge n or r would make
+        every login of that user burn seconds of CPU and gigabytes of memory.
+        """
+        parsed = parse_hash(stored)
+        return parsed is not None and parsed[0] <= self.n and parsed[1] <= self.r and parsed[2] <= self.p
+
+    def _cached(self, key: bytes, stored: str) -> bool:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            # the stored hash is part of the entry, so a password change invalidates it
+            if entry is None or entry[0] < time.monotonic() or entry[1] != stored:
+                self.cache_misses += 1
+                return False
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return True
+
+    def _remember(self, key: bytes, stored: str) -> None:
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, stored)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
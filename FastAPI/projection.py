@@ -0,0 +1,144 @@
+"""
+Response-model projection, used by create_app() routes (app_factory.py) for lesson7's
+InternalUser -> PublicUser.
+
+With `response_model=PublicUser`, a handler returning an InternalUser makes FastAPI
+validate that InternalUser again, field by field, into a new PublicUser (only so the
+password is dropped) and then write the PublicUser as JSON.
+
+But the InternalUser was already validated when it was created. If every PublicUser
+field also exists on InternalUser with the same type, the answer is simply "InternalUser
+without the other fields". A ProjectionPlan works that out once per (source, response
+model) pair and keeps it as an `include` spec for pydantic, e.g.
+
+    {"id": True, "name": True, "email": True, "addresses": {"__all__": {"street": True, ...}}}
+
+and the response is written straight from the source model with that spec: no second
+validation, no PublicUser object, nested models and lists of models included.
+
+A plan is only used when the result is exactly what FastAPI would send (same field
+order, aliases, types and constraints such as Field(max_length=...), no validators or
+custom serializers on the way, Annotated[..., AfterValidator / PlainSerializer] included). Otherwise
+the plan is "not viable" and FastAPI validates as usual. Setting strict mode
+(create_app(strict_responses=True)) always validates, for models that can't be trusted
+(built with model_construct(), changed after creation without validate_assignment ...).
+"""
+
+import types
+import typing
+from typing import Any, Dict, Optional, Set, Tuple, Type, Union
+
+from pydantic import AfterValidator, BaseModel, BeforeValidator, PlainSerializer, PlainValidator, WrapSerializer, WrapValidator
+
+_UNION_TYPES = (Union, types.UnionType)
+_CONTAINERS = (list, tuple, set, frozenset)
+_FIELD_FUNCTIONS = (AfterValidator, BeforeValidator, PlainValidator, WrapValidator, PlainSerializer, WrapSerializer)
+
+
+def has_custom_logic(model: Type[BaseModel]) -> bool:
+    """True if the model has validators, serializers or computed fields (code pydantic must run)."""
+    decorators = model.__pydantic_decorators__
+    return bool(decorators.validators or decorators.field_validators or decorators.root_validators
+                or decorators.model_validators or decorators.field_serializers
+                or decorators.model_serializers or decorators.computed_fields)
+
+
+def _same_checks(source_field: Any, target_field: Any) -> bool:
+    # constraints (max_length, gt ...) and Annotated validators/serializers end up in
+    # FieldInfo.metadata: the source value only passed the target's checks if they are the same
+    return (source_field.metadata == target_field.metadata
+            and not any(isinstance(item, _FIELD_FUNCTIONS) for item in target_field.metadata))
+
+
+def _config(model: Type[BaseModel]) -> Dict[str, Any]:
+    return {key: value for key, value in model.model_config.items() if key != "title"}
+
+
+def _include_for(source: Any, target: Any, seen: Set[Tuple[type, type]]) -> Any:
+    """Include spec that turns a `source` value into a `target` one, or None if there is none."""
+    if source == target:
+        return True
+    if isinstance(source, type) and isinstance(target, type):
+        if issubclass(source, BaseModel) and issubclass(target, BaseModel):
+            return _model_include(source, target, seen)
+        return None
+    origin = typing.get_origin(source)
+    source_args, target_args = typing.get_args(source), typing.get_args(target)
+    if origin in _UNION_TYPES and typing.get_origin(target) in _UNION_TYPES:
+        # only Optional[X] (or X | None): one real type plus None on both sides
+        source_types = [arg for arg in source_args if arg is not type(None)]
+        target_types = [arg for arg in target_args if arg is not type(None)]
+        if len(source_types) != 1 or len(target_types) != 1 or len(source_args) != len(target_args):
+            return None
+        return _include_for(source_types[0], target_types[0], seen)
+    if origin is None or origin != typing.get_origin(target):
+        return None
+    if origin in _CONTAINERS and len(source_args) == len(target_args) == 1:
+        inner = _include_for(source_args[0], target_args[0], seen)
+        return inner if inner is None or inner is True else {"__all__": inner}
+    if origin is dict and len(source_args) == len(target_args) == 2 and source_args[0] == target_args[0]:
+        inner = _include_for(source_args[1], target_args[1], seen)
+        return inner if inner is None or inner is True else {"__all__": inner}
+    return None
+
+
+def _model_include(source: Type[BaseModel], target: Type[BaseModel], seen: Set[Tuple[type, type]]) -> Any:
+    if source is target:
+        return True
+    if (source, target) in seen or has_custom_logic(source) or has_custom_logic(target):
+        return None  # recursive models are left to pydantic
+    if _config(source) != _config(target):
+        return None
+    seen = seen | {(source, target)}
+    source_fields = list(source.model_fields)
+    include = {}
+    last_position = -1
+    for name, target_field in target.model_fields.items():
+        if name not in source.model_fields:
+            return None
+        position = source_fields.index(name)
+        if position < last_position:
+            return None  # the JSON would list the fields in another order
+        last_position = position
+        source_field = source.model_fields[name]
+        if ((source_field.serialization_alias or source_field.alias) != (target_field.serialization_alias or target_field.alias)
+                or source_field.exclude != target_field.exclude or not _same_checks(source_field, target_field)):
+            return None
+        inner = _include_for(source_field.annotation, target_field.annotation, seen)
+        if inner is None:
+            return None
+        include[name] = inner
+    return include
+
+
+class ProjectionPlan:
+    def __init__(self, source: Type[BaseModel], target: Type[BaseModel]):
+        self.source = source
+        self.target = target
+        include = _model_include(source, target, set())
+        self.viable = include is not None
+        self.include = None if include is True else include
+
+    def __repr__(self) -> str:
+        return f"ProjectionPlan({self.source.__name__} -> {self.target.__name__}, include={self.include!r})"
+
+    def dump_json(self, obj: BaseModel, by_alias: bool = True) -> bytes:
+        return obj.__pydantic_serializer__.to_json(obj, include=self.include, by_alias=by_alias)
+
+
+class Projector:
+    """The plans for one response model, one per returned model class (built on first use)."""
+
+    def __init__(self, target: Type[BaseModel], sources=()):
+        self.target = target
+        self._plans: Dict[type, Optional[ProjectionPlan]] = {}
+        for source in sources:
+            self.plan_for(source)
+
+    def plan_for(self, source: type) -> Optional[ProjectionPlan]:
+        try:
+            return self._plans[source]
+        except KeyError:
+            plan = ProjectionPlan(source, self.target) if issubclass(source, BaseModel) else None
+            self._plans[source] = plan if plan is not None and plan.viable else None
+            return self._plans[source]
@@ -0,0 +1,273 @@
+"""
+A cache for query results, used by lesson5 for /search.
+
+Search traffic is skewed: a few queries are asked all the time, most only once. A plain
+LRU cache keeps whatever came last, so a burst of one-off queries pushes the popular
+ones out. QueryCache uses W-TinyLFU (the policy of Java's Caffeine cache) instead:
+
+  - a count-min sketch counts how often every key was asked for, cached or not, in a
+    few KB: 4 rows of small counters, a key's count is the smallest of its 4 counters
+    (collisions can only add). All counters are halved every 10 x width requests, so
+    old popularity fades away
+  - new entries go into a small LRU "window" (1% of the space), which lets a burst of a
+    new query get cached at once
+  - what falls out of the window is a candidate for the main space (a segmented LRU:
+    probation, and protected for entries that were hit again). If there is no room,
+    the candidate is only let in if it is asked for more often than every entry it
+    would push out; one-off queries never get past the window
+
+Sizes are in bytes (an estimate of the memory the value takes, see deep_size), so one
+huge result can't push out a hundred small ones without being worth it.
+
+Entries also expire `ttl` seconds after they were made, and the results must be thrown
+away when the data changes: clear() does that (lesson5 calls it when documents are added
+or removed).
+
+get_or_compute() is single-flight: when several requests miss the same key at the same
+time, only the first one computes the value, the others wait for it and share it.
+
+stats() has the hit ratio, evictions, memory use ... for tuning max_bytes and ttl.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5)
+_MASK64 = (1 << 64) - 1
+
+
+def deep_size(value: Any) -> int:
+    """Approximate memory taken by `value` and what it contains (dicts, lists, strings, numbers)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key) + deep_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item) for item in value)
+    return size
+
+
+class FrequencySketch:
+    """Count-min sketch of 4 rows of counters that saturate at 255 and are halved now and then."""
+
+    def __init__(self, width: int = 4096):
+        self.width = 1 << max(width - 1, 1).bit_length()  # a power of two, to mask instead of %
+        self._table = bytearray(4 * self.width)
+        self._additions = 0
+
+    def _slots(self, key: Hashable):
+        h = hash(key) & _MASK64
+        mask = self.width - 1
+        for row, seed in enumerate(_SEEDS):
+            yield row * self.width + (((h ^ seed) * seed & _MASK64) >> 32 & mask)
+
+    def add(self, key: Hashable) -> None:
+        table = self._table
+        for slot in self._slots(key):
+            if table[slot] < 255:
+                table[slot] += 1
+        self._additions += 1
+        if self._additions >= 10 * self.width:
+            self._table = bytearray(count >> 1 for count in table)
+            self._additions //= 2
+
+    def frequency(self, key: Hashable) -> int:
+        table = self._table
+        return min(table[slot] for slot in self._slots(key))
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires", "segment")
+
+    def __init__(self, value: Any, size: int, expires: float, segment: OrderedDict):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.segment = segment
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int = 16 * 2 ** 20, ttl: float = 60.0, window_ratio: float = 0.01,
+                 protected_ratio: float = 0.8, sizer: Callable[[Any], int] = deep_size, sketch_width: int = 4096):
+        """window_ratio=1.0 turns it into a plain LRU cache, to compare (its evictions count as rejections)."""
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizer = sizer
+        self._window_max = int(max_bytes * window_ratio)
+        self._protected_max = int((max_bytes - self._window_max) * protected_ratio)
+        self._window: "OrderedDict[Hashable, _Entry]" = OrderedDict()  # least recently used first
+        self._probation: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._protected: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = {id(self._window): 0, id(self._probation): 0, id(self._protected): 0}
+        self._sketch = FrequencySketch(sketch_width)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._generation = 0  # moves on with clear(), so results computed before it are not stored
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # misses that waited for another request's computation
+        self.evictions = 0  # entries pushed out to make room
+        self.rejections = 0  # candidates not let into the main space (or too big to cache)
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._window) + len(self._probation) + len(self._protected)
+
+    @property
+    def bytes(self) -> int:
+        return sum(self._bytes.values())
+
+    # ------------------------------------------------------------------ lookups
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry.value
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """The cached value of `key`, or compute() it (once, however many threads ask at the same time)."""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                generation = self._generation
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()  # raises the leader's exception too
+        try:
+            value = compute()
+        except BaseException as error:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_exception(error)  # errors are not cached
+            raise
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if generation == self._generation:
+                self._put(key, value, ttl)
+        future.set_result(value)
+        return value
+
+    def _lookup(self, key: Hashable) -> Optional[_Entry]:
+        self._sketch.add(key)
+        entry = self._window.get(key) or self._probation.get(key) or self._protected.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._remove(key, entry)
+            self.expirations += 1
+            return None
+        segment = entry.segment
+        if segment is self._probation:  # hit again: promoted
+            self._remove(key, entry)
+            self._insert(key, entry, self._protected)
+            while self._bytes[id(self._protected)] > self._protected_max:
+                demoted_key, demoted = next(iter(self._protected.items()))
+                self._remove(demoted_key, demoted)
+                self._insert(demoted_key, demoted, self._probation)
+        else:
+            segment.move_to_end(key)
+        return entry
+
+    # ------------------------------------------------------------------ changes
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            for segment in (self._window, self._probation, self._protected):
+                entry = segment.get(key)
+                if entry is not None:
+                    self._remove(key, entry)
+
+    def clear(self) -> None:
+        """Drop everything, including results being computed right now (they are for the old data)."""
+        with self._lock:
+            for segment in (self._window, self._probation, self._protected):
+                segment.clear()
+                self._bytes[id(segment)] = 0
+            self._inflight.clear()  # later misses compute again instead of waiting for an old result
+            self._generation += 1
+
+    def _put(self, key: Hashable, value: Any, ttl: Optional[float]) -> None:
+        for segment in (self._window, self._probation, self._protected):
+            old = segment.get(key)
+            if old is not None:
+                self._remove(key, old)
+        size = self.sizer(value) + sys.getsizeof(key)
+        if size > self.max_bytes - self._window_max and size > self._window_max:
+            self.rejections += 1  # would not fit anywhere
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._insert(key, _Entry(value, size, expires, self._window), self._window)
+        while self._bytes[id(self._window)] > self._window_max:
+            candidate_key, candidate = next(iter(self._window.items()))
+            self._remove(candidate_key, candidate)
+            self._admit(candidate_key, candidate)
+
+    def _admit(self, key: Hashable, candidate: _Entry) -> None:
+        """Move an entry that fell out of the window into the main space, if it is worth it."""
+        main_max = self.max_bytes - self._window_max
+        if candidate.size > main_max:
+            self.rejections += 1
+            return
+        free = main_max - self._bytes[id(self._probation)] - self._bytes[id(self._protected)]
+        victims, strongest, now = [], -1, time.monotonic()
+        for segment in (self._probation, self._protected):  # least valuable first
+            for victim_key, victim in segment.items():
+                if free >= candidate.size:
+                    break
+                victims.append((victim_key, victim))
+                free += victim.size
+                if victim.expires > now:  # an expired entry is free to take
+                    strongest = max(strongest, self._sketch.frequency(victim_key))
+        if self._sketch.frequency(key) <= strongest:  # a tie keeps what is there
+            self.rejections += 1
+            return
+        for victim_key, victim in victims:
+            self._remove(victim_key, victim)
+            if victim.expires > now:
+                self.evictions += 1
+            else:
+                self.expirations += 1
+        self._insert(key, candidate, self._probation)
+
+    def _insert(self, key: Hashable, entry: _Entry, segment: OrderedDict) -> None:
+        entry.segment = segment
+        segment[key] = entry
+        self._bytes[id(segment)] += entry.size
+
+    def _remove(self, key: Hashable, entry: _Entry) -> None:
+        del entry.segment[key]
+        self._bytes[id(entry.segment)] -= entry.size
+
+    # ------------------------------------------------------------------ tuning
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "coalesced": self.coalesced, "evictions": self.evictions, "rejections": self.rejections,
+                "expirations": self.expirations, "entries": len(self), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "window_bytes": self._bytes[id(self._window)], "probation_bytes": self._bytes[id(self._probation)],
+                "protected_bytes": self._bytes[id(self._protected)],
+            }
@@ -0,0 +1,193 @@
+"""
+Radix-tree (trie) router, used by lesson3 (opt-in with LESSON3_RADIX_ROUTER=1).
+
+The default router keeps the routes in a list and tries their regexes top to bottom
+for every request. Two problems with that:
+
+  - a request for the last route pays for a regex match against every route before it
+  - order decides: if "/blog/{id}" is registered before "/blog/undefined",
+    a request for /blog/undefined always goes to "/blog/{id}" (see the end of lesson3)
+
+RadixRouter compiles the route paths into a tree of path segments:
+
+    "/", "/{name}", "/{id}/data", "/{id}/comments", "/add/{num1}/{num2}"  become
+
+    (root) -- ""     -> hello
+           -- "add"  -- {num1} -- {num2} -> add
+           -- {name} -> hello
+                     -- "data"     -> fetch_data_from_id
+                     -- "comments" -> fetch_comments_from_id
+
+A request walks the tree one segment at a time, so the cost depends on how deep the
+path is, not on how many routes exist. At every level a static segment is tried first,
+then typed parameters ({x:int}, {x:float} ...) and plain {x} last, so the most specific
+route wins no matter in which order the routes were registered.
+
+When the tree is built it also reports (as log warnings):
+
+  - conflicts: two routes with the same shape and method, the second one can never be called
+  - shadowed routes: routes that the default top-to-bottom order would never reach because
+    an earlier, more general route catches their requests (RadixRouter does reach them)
+
+Only plain HTTP routes are put in the tree. Anything else (mounts, websockets, included
+routers, "{path:path}" parameters), 405 Method Not Allowed answers, redirects for a missing
+trailing slash and 404s are left to the normal router, which runs only when the tree has no match.
+"""
+
+import logging
+import re
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple
+
+from fastapi import FastAPI
+from fastapi.routing import APIRouter
+from starlette._utils import get_route_path
+from starlette.convertors import CONVERTOR_TYPES
+from starlette.routing import BaseRoute, Match, Route
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+_PARAM = re.compile(r"^\{(\w+)(?::(\w+))?\}$")
+
+
+class _Node:
+    __slots__ = ("static", "params", "routes")
+
+    def __init__(self):
+        self.static: Dict[str, "_Node"] = {}
+        self.params: List[Tuple[str, Pattern, "_Node"]] = []  # (convertor name, regex, child), "str" last
+        self.routes: List[Tuple[int, Route]] = []  # (registration index, route)
+
+    def param_child(self, convertor: str) -> "_Node":
+        for name, _, child in self.params:
+            if name == convertor:
+                return child
+        child = _Node()
+        self.params.append((convertor, re.compile(CONVERTOR_TYPES[convertor].regex), child))
+        self.params.sort(key=lambda param: param[0] == "str")
+        return child
+
+
+def _segments(path: str) -> Optional[List[Tuple[str, str]]]:
+    """
+    "/add/{num1:int}" -> [("static", "add"), ("param", "int")]
+    None if the path can't be put in the tree ("{rest:path}", "/file-{id}.txt" ...).
+    """
+    result = []
+    for segment in path[1:].split("/"):
+        if "{" not in segment:
+            result.append(("static", segment))
+            continue
+        match = _PARAM.match(segment)
+        convertor = match and (match.group(2) or "str")
+        if convertor is None or convertor == "path" or convertor not in CONVERTOR_TYPES:
+            return None
+        result.append(("param", convertor))
+    return result
+
+
+def _overlap(a: Route, b: Route) -> bool:
+    return a.methods is None or b.methods is None or bool(a.methods & b.methods)
+
+
+class RadixRouter(APIRouter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._reset_tree()
+
+    def _reset_tree(self) -> None:
+        self._root = _Node()
+        self._compiled_routes = -1  # len(self.routes) when the tree was built
+
+    def compile(self) -> List[str]:
+        """Build the tree from self.routes. Returns (and logs) the conflicts and shadowed routes found."""
+        root = _Node()
+        shapes = []
+        for index, route in enumerate(self.routes):
+            shape = _segments(route.path) if isinstance(route, Route) else None
+            if shape is None:
+                continue
+            node = root
+            for kind, value in shape:
+                node = node.static.setdefault(value, _Node()) if kind == "static" else node.param_child(value)
+            node.routes.append((index, route))
+            shapes.append((index, route, shape))
+        self._root = root
+        self._compiled_routes = len(self.routes)
+
+        problems = []
+        for index, route, shape in shapes:
+            for earlier_index, earlier in self._catching(root, shape, 0):
+                if earlier_index >= index or not _overlap(earlier, route):
+                    continue
+                if _segments(earlier.path) == shape:
+                    problems.append(f"conflict: {route.path} {sorted(route.methods or ['*'])} is already "
+                                    f"handled by {earlier.path} (registered first), it can never be called")
+                else:
+                    problems.append(f"shadowed: {route.path} is caught by {earlier.path} (registered first) "
+                                    f"under top-to-bottom matching; the radix router prefers {route.path}")
+        for problem in problems:
+            logger.warning(problem)
+        return problems
+
+    def _catching(self, node: _Node, shape: List[Tuple[str, str]], i: int) -> Iterator[Tuple[int, Route]]:
+        # routes whose path matches every request that `shape` matches
+        if i == len(shape):
+            yield from node.routes
+            return
+        kind, value = shape[i]
+        if kind == "static":
+            child = node.static.get(value)
+            if child is not None:
+                yield from self._catching(child, shape, i + 1)
+        for name, regex, child in node.params:
+            if (regex.fullmatch(value) if kind == "static" else name in (value, "str")):
+                yield from self._catching(child, shape, i + 1)
+
+    def _candidates(self, node: _Node, segments: List[str], i: int) -> Iterator[Tuple[int, Route]]:
+        if i == len(segments):
+            yield from node.routes
+            return
+        segment = segments[i]
+        child = node.static.get(segment)
+        if child is not None:
+            yield from self._candidates(child, segments, i + 1)
+        if segment:
+            for _, regex, child in node.params:
+                if regex.fullmatch(segment):
+                    yield from self._candidates(child, segments, i + 1)
+
+    def match(self, scope: Scope) -> Optional[Tuple[BaseRoute, Scope]]:
+        """The route that fully matches the request (path and method) and its child scope, or None."""
+        if self._compiled_routes != len(self.routes):
+            self.compile()
+        path = get_route_path(scope)
+        for _, route in self._candidates(self._root, path[1:].split("/"), 0):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return route, child_scope
+        return None
+
+    async def app(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan" and self._compiled_routes != len(self.routes):
+            self.compile()  # so the report is printed when the server starts
+        elif scope["type"] == "http":
+            found = self.match(scope)
+            if found is not None:
+                route, child_scope = found
+                scope.setdefault("router", self)
+                scope.update(child_scope)
+                await route.handle(scope, receive, send)
+                return
+        await super().app(scope, receive, send)
+
+
+def use_radix_router(app: FastAPI) -> RadixRouter:
+    """Switch an existing app (routes already registered or not) to the radix router."""
+    router = app.router
+    if getattr(router.middleware_stack, "__func__", None) is not type(router).app:
+        raise ValueError("the app's router has its own middleware, can't switch it")
+    router.__class__ = RadixRouter
+    router._reset_tree()
+    router.middleware_stack = router.app  # Router.__init__ kept a reference to the old app method
+    return router
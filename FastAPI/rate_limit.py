@@ -0,0 +1,178 @@
+"""
+Token-bucket rate limiting, used by lesson6 to throttle /validate_user brute forcing.
+
+Token bucket: every key (a login, a client IP ...) has a bucket that holds at most
+`burst` tokens and refills at `rate` tokens per second. A request takes one token;
+an empty bucket means 429 Too Many Requests. Only two numbers are stored per key
+(tokens left, time of the last refill) and the refill is computed on access, so a
+check is O(1).
+
+The state lives in a backend:
+
+    LocalBackend   in-process table, good for one worker
+    RedisBackend   shared by all workers/machines through Redis (pass your own client)
+
+LocalBackend has a fixed capacity so a flood of made-up logins can't grow it without
+bound. Keys are expired with a time wheel: a ring of slots, one per `tick` seconds.
+A bucket is filed in the slot of the moment it will be full again (after that it is
+the same as having no entry at all) and the wheel deletes whole slots as time moves on.
+If the table is still full, the entries closest to expiry are evicted first.
+"""
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+
+class RateLimitBackend(ABC):
+    # True if take() does network I/O and must not run on the event loop
+    blocking = False
+
+    @abstractmethod
+    def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Take one token from `key`'s bucket. Returns (allowed, seconds until a token is available)."""
+
+
+class LocalBackend(RateLimitBackend):
+    def __init__(self, capacity: int = 100_000, tick: float = 1.0, slots: int = 3600):
+        self.capacity = capacity
+        self.tick = tick
+        self._buckets: Dict[str, list] = {}  # key -> [tokens, last refill, wheel slot]
+        self._wheel: List[Set[str]] = [set() for _ in range(slots)]
+        self._now_tick = int(time.monotonic() / tick)
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            self._advance(int(now / self.tick))
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.capacity:
+                    self._evict_one()
+                bucket = [float(burst), now, None]
+                self._buckets[key] = bucket
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            retry_after = 0.0 if allowed else (1 - bucket[0]) / rate
+
+            # file the bucket under the tick when it will be full again
+            full_at = now + (burst - bucket[0]) / rate
+            slot_tick = min(int(full_at / self.tick) + 1, self._now_tick + len(self._wheel) - 1)
+            slot = slot_tick % len(self._wheel)
+            if bucket[2] != slot:
+                if bucket[2] is not None:
+                    self._wheel[bucket[2]].discard(key)
+                self._wheel[slot].add(key)
+                bucket[2] = slot
+            return allowed, retry_after
+
+    def _advance(self, tick: int) -> None:
+        # drop the slots the wheel passed since the last call (at most one full turn)
+        steps = min(tick - self._now_tick, len(self._wheel))
+        for i in range(1, steps + 1):
+            slot = (self._now_tick + i) % len(self._wheel)
+            for key in self._wheel[slot]:
+                del self._buckets[key]
+            self._wheel[slot] = set()
+        self._now_tick = max(self._now_tick, tick)
+
+    def _evict_one(self) -> None:
+        for i in range(len(self._wheel)):
+            slot = self._wheel[(self._now_tick + i) % len(self._wheel)]
+            if slot:
+                del self._buckets[slot.pop()]
+                self.evicted += 1
+                return
+
+
+class RedisBackend(RateLimitBackend):
+    """
+    Shared token buckets in Redis. `client` is a redis.Redis (or compatible) instance;
+    the refill-and-take runs as one Lua script so concurrent workers can't race.
+    The script reads the time from Redis (TIME), so the clocks of the app servers don't
+    matter. Keys expire by themselves once the bucket would be full again.
+    """
+
+    blocking = True
+
+    _SCRIPT = """
+    -- Redis < 5 only allows TIME before a write in scripts replicated by effects
+    if redis.replicate_commands then redis.replicate_commands() end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or burst)
+    local last = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+    tokens = math.min(burst, tokens + (now - last) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self._SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[rate, burst])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+
+class RateLimiter:
+    """
+    FastAPI dependency:  @app.get(..., dependencies=[Depends(RateLimiter(...))])
+
+    `key_func(request)` picks what is limited (client IP, a path parameter ...);
+    `name` keeps the buckets of different limiters apart in a shared backend.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, key_func: Callable[[Request], Optional[str]],
+                 backend: Optional[RateLimitBackend] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.key_func = key_func
+        self.backend = backend or LocalBackend()
+
+    async def __call__(self, request: Request) -> None:
+        key = self.key_func(request)
+        if key is None:
+            return
+        key = f"{self.name}:{key}"
+        if self.backend.blocking:
+            allowed, retry_after = await run_in_threadpool(self.backend.take, key, self.rate, self.burst)
+        else:
+            allowed, retry_after = self.backend.take(key, self.rate, self.burst)
+        if not allowed:
+            raise HTTPException(status_code=429, detail="Too many requests",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+def client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
+def path_param(name: str) -> Callable[[Request], Optional[str]]:
+    return lambda request: request.path_params.get(name)
@@ -0,0 +1,117 @@
+"""
+Pre-encoded responses with ETags, used by lesson3 for the `data` dict endpoints.
+
+A normal handler returns a dict or a string and FastAPI turns it into JSON on every
+request, even when the data never changes. ResponseCache does that work once:
+
+  - the first request for a key builds the value, encodes it to JSON bytes and hashes
+    them into a strong ETag; every later request sends the same bytes
+  - a client that already has the response sends `If-None-Match: <etag>` and gets an
+    empty 304 Not Modified back instead of the body
+  - the source is a VersionedDict, a dict that counts its changes. A cached entry
+    remembers the version it was built from and is rebuilt when the version moved on
+
+Only top-level changes are counted (`data["4"] = {...}`, `del data["1"]`); changing a
+nested dict in place (`data["1"]["data"] = ...`) is not seen, assign a new value instead.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from fastapi import HTTPException, Request, Response
+
+
+class VersionedDict(dict):
+    """dict whose `version` goes up on every change."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def _changed(self) -> None:
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._changed()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._changed()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match: "a", W/"b"   or   *   (weak comparison, as RFC 9110 asks for this header)
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class ResponseCache:
+    def __init__(self, source: VersionedDict, media_type: str = "application/json"):
+        self.source = source
+        self.media_type = media_type
+        self._entries: Dict[Hashable, Tuple[int, bytes, str]] = {}  # key -> (version, body, etag)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def respond(self, request: Request, key: Hashable, build: Callable[[], Any]) -> Response:
+        """
+        Response for `key`. `build()` makes the value from the source, it is only called
+        when there is no entry for the current version. A KeyError from it becomes a 404.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != self.source.version:
+            self.misses += 1
+            entry = self._build(key, build)
+        else:
+            self.hits += 1
+        _, body, etag = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}  # no-cache: may store, must revalidate
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type=self.media_type, headers=headers)
+
+    def _build(self, key: Hashable, build: Callable[[], Any]) -> Tuple[int, bytes, str]:
+        version = self.source.version  # read before building, so a change during the build isn't lost
+        try:
+            value = build()
+        except KeyError:
+            with self._lock:
+                self._entries.pop(key, None)
+            raise HTTPException(status_code=404)  # detail "Not Found", like any unknown path
+        # same encoding as FastAPI's JSONResponse
+        body = json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+        entry = (version, body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+        with self._lock:
+            self._entries[key] = entry
+        return entry
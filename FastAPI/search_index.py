@@ -0,0 +1,368 @@
+"""
+Full-text search with BM25 ranking, used by lesson5's /search.
+
+Inverted index: for every word (term), the list of documents containing it and how
+many times (its postings). A query only reads the lists of its own words instead of
+looking at every document.
+
+Ranking is BM25, the classic search-engine formula. A document's score for a query
+adds up, for every query term it contains:
+
+    idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_length / average_doc_length))
+
+    tf   how often the term is in the document (more is better, but with diminishing returns: k1)
+    idf  how rare the term is in the whole collection: "fastapi" says more than "the"
+    b    how much long documents are penalized (they contain everything a bit)
+
+Posting lists are compressed. Documents get increasing numbers as they are added, so a
+list is sorted and only the gaps between numbers are stored. They are packed in blocks
+of 128 postings, each block using the smallest width that fits all its gaps (1, 2 or
+4 bytes per number, most gaps of common words fit in 1). A block is decoded with
+array.frombytes + itertools.accumulate, which run in C, and its header holds the last
+document number, so a block can be skipped without decoding it. The newest postings of
+a term wait in a small uncompressed tail until there are 128 of them.
+
+Top-k: scores are added up term by term, rarest term first, and the k best are picked
+with a heap (heapq.nlargest) instead of sorting all matches. Once the k-th best score is
+higher than anything the remaining terms could still add, no other document can make
+it into the top k; from then on only the blocks that contain current candidates are
+decoded ("quit/continue", Moffat & Zobel).
+
+Queries whose words have huge posting lists (say "the fastapi") must score most of the
+documents anyway. If numpy is installed, those are scored all at once in numpy arrays
+(dense_postings: more than 50,000 postings together) instead of one posting at a time.
+
+Adding a document appends to the posting lists of its terms. Removing one only marks it
+as deleted (its postings are skipped); once a quarter of the documents are deleted the
+lists are rewritten without them. Like Lucene, document frequencies count deleted
+documents until then, which moves scores very slightly.
+"""
+
+import ast
+import glob
+import heapq
+import itertools
+import math
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+try:
+    import numpy
+except ImportError:  # optional, only makes queries with very common words faster
+    numpy = None
+
+_TOKEN = re.compile(r"\w+")
+_HEADER = struct.Struct("<BBI")  # postings in the block - 1, widths (ids | tfs << 4), last document number
+_TYPECODES = {1: "B", 2: "H", 4: "I"}
+assert array("I").itemsize == 4 and array("H").itemsize == 2
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _width(largest: int) -> int:
+    return 1 if largest < 0x100 else 2 if largest < 0x10000 else 4
+
+
+def _encode_block(ids: List[int], tfs: List[int], previous: int) -> bytes:
+    gaps = [current - before for current, before in zip(ids, [previous] + ids[:-1])]
+    tfs = [min(tf, 0xFFFF) for tf in tfs]
+    id_width, tf_width = _width(max(gaps)), _width(max(tfs))
+    return (_HEADER.pack(len(ids) - 1, id_width | tf_width << 4, ids[-1])
+            + array(_TYPECODES[id_width], gaps).tobytes() + array(_TYPECODES[tf_width], tfs).tobytes())
+
+
+def _blocks(data: bytes):
+    """(previous last id, last id, start offset, count, id width, tf width) of each block."""
+    position, previous = 0, -1
+    while position < len(data):
+        count, widths, last = _HEADER.unpack_from(data, position)
+        count += 1
+        yield previous, last, position + _HEADER.size, count, widths & 0xF, widths >> 4
+        position += _HEADER.size + count * ((widths & 0xF) + (widths >> 4))
+        previous = last
+
+
+def _decode_block(data: bytes, previous: int, start: int, count: int, id_width: int, tf_width: int):
+    gaps = array(_TYPECODES[id_width])
+    gaps.frombytes(data[start:start + count * id_width])
+    tfs = array(_TYPECODES[tf_width])
+    tf_start = start + count * id_width
+    tfs.frombytes(data[tf_start:tf_start + count * tf_width])
+    ids = list(itertools.accumulate(gaps, initial=previous))
+    del ids[0]
+    return ids, tfs
+
+
+class SearchIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, block_size: int = 128, compact_ratio: float = 0.25):
+        assert block_size <= 256  # the count has one byte
+        self.k1 = k1
+        self.b = b
+        self.block_size = block_size
+        self.compact_ratio = compact_ratio
+        self.dense_postings = 50_000
+        self._terms: Dict[str, int] = {}  # term -> term number
+        self._packed: List[bytearray] = []  # term number -> encoded blocks
+        self._tails: List[array] = []  # term number -> newest postings: id, tf, id, tf ...
+        self._packed_last = array("q")  # term number -> last document number in its blocks, -1 if none
+        self._df: List[int] = []  # term number -> documents containing it (deleted ones included)
+        self._keys: List[Optional[Hashable]] = []  # document number -> key, None once deleted
+        self._numbers: Dict[Hashable, int] = {}  # key -> document number
+        self._lengths = array("I")  # document number -> tokens
+        self._live = bytearray()  # document number -> 1, or 0 once deleted
+        self._total_length = 0  # of live documents
+        self.deleted = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._numbers
+
+    # ------------------------------------------------------------------ changes
+
+    def add(self, key: Hashable, text: str) -> None:
+        """Index `text` under `key` (replacing what `key` had before)."""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            if key in self._numbers:
+                self.remove(key)
+            number = len(self._keys)
+            self._keys.append(key)
+            self._numbers[key] = number
+            length = sum(counts.values())
+            self._lengths.append(length)
+            self._live.append(1)
+            self._total_length += length
+            for term, tf in counts.items():
+                self._append(term, number, tf)
+
+    def add_many(self, documents: Iterable[Tuple[Hashable, str]]) -> None:
+        for key, text in documents:
+            self.add(key, text)
+
+    def _append(self, term: str, number: int, tf: int) -> None:
+        term_number = self._terms.get(term)
+        if term_number is None:
+            term_number = self._terms[sys.intern(term)] = len(self._df)
+            self._packed.append(bytearray())
+            self._tails.append(array("I"))
+            self._packed_last.append(-1)
+            self._df.append(0)
+        self._df[term_number] += 1
+        tail = self._tails[term_number]
+        tail.append(number)
+        tail.append(tf)
+        if len(tail) == 2 * self.block_size:
+            self._flush(term_number)
+
+    def _flush(self, term_number: int) -> None:
+        tail = self._tails[term_number]
+        if not tail:
+            return
+        self._packed[term_number] += _encode_block(list(tail[0::2]), list(tail[1::2]), self._packed_last[term_number])
+        self._packed_last[term_number] = tail[-2]
+        self._tails[term_number] = array("I")
+
+    def remove(self, key: Hashable) -> bool:
+        with self._lock:
+            number = self._numbers.pop(key, None)
+            if number is None:
+                return False
+            self._keys[number] = None
+            self._live[number] = 0
+            self._total_length -= self._lengths[number]
+            self.deleted += 1
+            if self.deleted > 1000 and self.deleted > self.compact_ratio * len(self._keys):
+                self.compact()
+            return True
+
+    def compact(self) -> None:
+        """Rewrite the posting lists without deleted documents, and number the documents again."""
+        with self._lock:
+            renumber = array("i", [-1]) * len(self._keys)
+            keys, lengths = [], array("I")
+            for number, key in enumerate(self._keys):
+                if self._live[number]:
+                    renumber[number] = len(keys)
+                    keys.append(key)
+                    lengths.append(self._lengths[number])
+            for term_number in range(len(self._df)):
+                ids, tfs = [], []
+                for number, tf in self._postings(term_number):
+                    if renumber[number] >= 0:
+                        ids.append(renumber[number])
+                        tfs.append(tf)
+                packed, previous = bytearray(), -1
+                full = len(ids) - len(ids) % self.block_size
+                for start in range(0, full, self.block_size):
+                    packed += _encode_block(ids[start:start + self.block_size], tfs[start:start + self.block_size], previous)
+                    previous = ids[start + self.block_size - 1]
+                tail = array("I")
+                for number, tf in zip(ids[full:], tfs[full:]):
+                    tail.append(number)
+                    tail.append(tf)
+                self._packed[term_number], self._tails[term_number], self._df[term_number] = packed, tail, len(ids)
+                self._packed_last[term_number] = previous
+            unused = [term for term, term_number in self._terms.items() if not self._df[term_number]]
+            for term in unused:
+                del self._terms[term]  # its (empty) slots stay, new terms get new numbers
+            self._keys, self._lengths = keys, lengths
+            self._live = bytearray(b"\x01") * len(keys)
+            self._numbers = {key: number for number, key in enumerate(keys)}
+            self.deleted = 0
+
+    def _postings(self, term_number: int):
+        packed = self._packed[term_number]
+        for previous, last, start, count, id_width, tf_width in _blocks(packed):
+            ids, tfs = _decode_block(packed, previous, start, count, id_width, tf_width)
+            yield from zip(ids, tfs)
+        tail = self._tails[term_number]
+        yield from zip(tail[0::2], tail[1::2])
+
+    # ------------------------------------------------------------------ queries
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> List[Tuple[Hashable, float]]:
+        """(key, score) of the best matches, best first; `offset` skips that many of them."""
+        k = offset + limit
+        with self._lock:
+            documents = len(self._keys)
+            if k <= 0 or not self._numbers:
+                return []
+            k1, b = self.k1, self.b
+            # tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average)) = tf * (k1 + 1) / (tf + c + d * length)
+            c, d = k1 * (1 - b), k1 * b / (self._total_length / len(self._numbers) or 1)
+            terms = []
+            for term in set(tokenize(query)):
+                term_number = self._terms.get(term)
+                if term_number is not None and self._df[term_number]:
+                    df = self._df[term_number]
+                    terms.append((math.log(1 + (documents - df + 0.5) / (df + 0.5)), term_number))
+            terms.sort(reverse=True)  # rarest (highest idf) first
+            if numpy is not None and sum(self._df[term_number] for _, term_number in terms) > self.dense_postings:
+                return self._search_dense(terms, k, offset, c, d)
+            # the most a term can add to a score (tf -> infinity), and what all later terms can add together
+            remaining = list(itertools.accumulate(idf * (k1 + 1) for idf, _ in reversed(terms)))[::-1] + [0.0]
+
+            scores: Dict[int, float] = {}
+            candidates: Optional[List[int]] = None  # set once no new document can make the top k
+            for position, (idf, term_number) in enumerate(terms):
+                weight = idf * (k1 + 1)
+                if candidates is None:
+                    self._score_all(term_number, weight, c, d, scores)
+                    if len(scores) >= k and heapq.nlargest(k, scores.values())[-1] >= remaining[position + 1]:
+                        candidates = sorted(scores)
+                else:
+                    self._score_candidates(term_number, weight, c, d, scores, candidates)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._keys[number], score) for number, score in best[offset:]]
+
+    def _search_dense(self, terms: List[Tuple[float, int]], k: int, offset: int,
+                      c: float, d: float) -> List[Tuple[Hashable, float]]:
+        lengths = numpy.frombuffer(self._lengths, dtype=numpy.uint32)
+        scores = numpy.zeros(len(self._keys))
+        for idf, term_number in terms:
+            ids, tfs = self._posting_arrays(term_number)
+            scores[ids] += idf * (self.k1 + 1) * tfs / (tfs + c + d * lengths[ids])
+        scores[numpy.frombuffer(self._live, dtype=numpy.uint8) == 0] = 0.0
+        k = min(k, int(numpy.count_nonzero(scores)))
+        if k <= offset:
+            return []
+        best = numpy.argpartition(-scores, k - 1)[:k]  # the k best, in no order: no full sort
+        best = best[numpy.lexsort((best, -scores[best]))]  # best first, then lower number (like the heap)
+        return [(self._keys[number], float(scores[number])) for number in best[offset:].tolist()]
+
+    def _posting_arrays(self, term_number: int):
+        """All postings of a term as numpy arrays (ids, tfs)."""
+        packed = self._packed[term_number]
+        gaps, tfs = [], []
+        for previous, last, start, count, id_width, tf_width in _blocks(packed):
+            gaps.append(numpy.frombuffer(packed, _TYPECODES[id_width], count, start))
+            tfs.append(numpy.frombuffer(packed, _TYPECODES[tf_width], count, start + count * id_width))
+        tail = numpy.frombuffer(self._tails[term_number], dtype=numpy.uint32)
+        # the first gap of every block is from the last id of the block before, so one running sum from -1 does all
+        ids = numpy.cumsum(numpy.concatenate(gaps + [numpy.zeros(0, numpy.int64)]).astype(numpy.int64)) - 1
+        return (numpy.concatenate((ids, tail[0::2].astype(numpy.int64))),
+                numpy.concatenate(tfs + [tail[1::2]]).astype(numpy.float64))
+
+    def _score_all(self, term_number: int, weight: float, c: float, d: float, scores: Dict[int, float]) -> None:
+        lengths, live, get = self._lengths, self._live, scores.get
+        packed = self._packed[term_number]
+        for previous, last, start, count, id_width, tf_width in _blocks(packed):
+            ids, tfs = _decode_block(packed, previous, start, count, id_width, tf_width)
+            for number, tf in zip(ids, tfs):
+                if live[number]:
+                    scores[number] = get(number, 0.0) + weight * tf / (tf + c + d * lengths[number])
+        tail = self._tails[term_number]
+        for number, tf in zip(tail[0::2], tail[1::2]):
+            if live[number]:
+                scores[number] = get(number, 0.0) + weight * tf / (tf + c + d * lengths[number])
+
+    def _score_candidates(self, term_number: int, weight: float, c: float, d: float,
+                          scores: Dict[int, float], candidates: List[int]) -> None:
+        lengths = self._lengths
+        packed = self._packed[term_number]
+        for previous, last, start, count, id_width, tf_width in _blocks(packed):
+            first = bisect_right(candidates, previous)
+            if first == len(candidates):
+                return  # all candidates are before this block (the tail is after it too)
+            if candidates[first] > last:
+                continue  # no candidate in this block: not even decoded
+            ids, tfs = _decode_block(packed, previous, start, count, id_width, tf_width)
+            for number in candidates[first:bisect_right(candidates, last)]:
+                i = bisect_left(ids, number)
+                if i < len(ids) and ids[i] == number:
+                    tf = tfs[i]
+                    scores[number] += weight * tf / (tf + c + d * lengths[number])
+        tail = self._tails[term_number]
+        for number, tf in zip(tail[0::2], tail[1::2]):
+            if number in scores:
+                scores[number] += weight * tf / (tf + c + d * lengths[number])
+
+    # ------------------------------------------------------------------ size
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the index structures (not of the keys themselves)."""
+        size = sys.getsizeof(self._terms) + sum(sys.getsizeof(term) for term in self._terms)
+        size += sys.getsizeof(self._packed) + sum(sys.getsizeof(packed) for packed in self._packed)
+        size += sys.getsizeof(self._tails) + sum(sys.getsizeof(tail) for tail in self._tails)
+        size += sys.getsizeof(self._df) + sys.getsizeof(self._keys) + sys.getsizeof(self._numbers)
+        size += sys.getsizeof(self._lengths) + sys.getsizeof(self._live)
+        return size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            compressed = sum(len(packed) for packed in self._packed)
+            in_blocks = sum(self._df) - sum(len(tail) // 2 for tail in self._tails)
+            return {"documents": len(self), "deleted": self.deleted, "terms": len(self._terms),
+                    "postings": sum(self._df), "bytes_per_posting": round(compressed / in_blocks, 2) if in_blocks else None,
+                    "memory_bytes": self.memory_bytes()}
+
+
+def lesson_notes(folder: str) -> List[Dict[str, str]]:
+    """The course notes to search: every paragraph of the strings in the lesson files (docstrings, "Try:" notes)."""
+    documents = []
+    for path in sorted(glob.glob(os.path.join(folder, "lesson*.py"))):
+        source = os.path.basename(path)
+        with open(path, encoding="utf-8") as file:
+            tree = ast.parse(file.read())
+        paragraphs = 0
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                for paragraph in re.split(r"\n\s*\n", node.value.value.strip()):
+                    paragraph = paragraph.strip()
+                    if len(tokenize(paragraph)) >= 3:
+                        paragraphs += 1
+                        documents.append({"id": f"{source}:{paragraphs}", "source": source,
+                                          "title": paragraph.splitlines()[0].strip(" -:#"), "text": paragraph})
+    return documents
@@ -0,0 +1,295 @@
+"""
+Thread-safe user store used by lesson6.
+
+Sync path operation functions (plain `def`) are run by Starlette on a threadpool,
+so two requests can touch the user "database" at the same time.
+With a plain dict this is a race:
+
+    if u.login in users_db:          # thread A checks ... thread B checks
+        ...
+    users_db[u.login] = {...}        # ... both insert, last one wins
+
+`UserStore` is the small interface the handlers talk to, so the backing storage
+can be swapped (in-memory, persistent, remote ...) without touching the routes.
+
+`ShardedUserStore` is the default in-process implementation.
+Logins are hashed into N shards and every shard has its own lock (lock striping),
+so writers working on different shards never wait for each other.
+
+Records are plain dicts like {"password": "..."} and are always *replaced*,
+never mutated in place, so a record returned by get() is safe to read without a lock.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from user_table import UserTable
+
+# sentinel meaning "don't compare, just overwrite" for update()
+ANY = object()
+
+
+class UserStore(ABC):
+    """Interface every user store implements."""
+
+    @abstractmethod
+    def get(self, login: str) -> Optional[dict]:
+        """Return the record for `login` or None."""
+
+    @abstractmethod
+    def create(self, login: str, record: dict) -> bool:
+        """Insert `record` only if `login` is absent. Returns False if it already exists."""
+
+    @abstractmethod
+    def update(self, login: str, record: dict, expected=ANY) -> bool:
+        """
+        Replace the record of an existing login.
+
+        If `expected` is given this is a compare-and-set: the write only happens
+        when the current record equals `expected`.
+        Returns False if the login is missing or the comparison failed.
+        """
+
+    @abstractmethod
+    def delete(self, login: str) -> bool:
+        """Remove `login`. Returns False if it did not exist."""
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """Iterate over (login, record) pairs."""
+
+    def scan(self, chunk_size: int = 1000) -> Iterator[List[Tuple[str, dict]]]:
+        """Iterate over (login, record) pairs in lists of at most `chunk_size`."""
+        chunk = []
+        for item in self.items():
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def upsert_many(self, entries: List[Tuple[str, dict]]) -> None:
+        """Insert or replace many (login, record) pairs."""
+        for login, record in entries:
+            if not self.create(login, record):
+                self.update(login, record)
+
+    def create_many(self, entries: List[Tuple[str, dict]]) -> List[bool]:
+        """create() for many (login, record) pairs, applied in order. Returns one result per pair."""
+        return [self.create(login, record) for login, record in entries]
+
+    def delete_many(self, logins: List[str]) -> List[bool]:
+        """delete() for many logins, applied in order. Returns one result per login."""
+        return [self.delete(login) for login in logins]
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def __contains__(self, login: str) -> bool:
+        return self.get(login) is not None
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class _Shard:
+    __slots__ = ("lock", "data")
+
+    def __init__(self, data: Dict[str, dict]):
+        self.lock = threading.Lock()
+        self.data = data  # a dict, or a UserTable (compact=True) that behaves like one
+
+
+class ShardedUserStore(UserStore):
+    """
+    In-process store split into `shards` lock-striped partitions.
+
+    With `copy_on_write=True` (read-optimized mode) a shard's dict is never changed
+    once published: a writer copies it, changes the copy and swaps the shard's
+    reference to it. Readers just pick up whatever dict is current, without any lock,
+    and always see a complete, consistent version of the shard. Every write costs a
+    copy of one shard (n / shards entries), so use it when writes are rare and
+    raise `shards` to keep those copies small.
+
+    With `compact=True` every shard keeps its users in a UserTable (user_table.py)
+    instead of a dict of dicts: about a quarter of the memory per user, for reads that
+    decode the record on every call.
+    """
+
+    def __init__(self, initial: Optional[Dict[str, dict]] = None, shards: int = 16,
+                 copy_on_write: bool = False, compact: bool = False):
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        self.copy_on_write = copy_on_write
+        self.compact = compact
+        self._shards = [_Shard(self._new_data()) for _ in range(shards)]
+        self._listeners: List[Callable[[str, str, Optional[dict]], None]] = []
+        for login, record in (initial or {}).items():
+            self._shard(login).data[login] = record
+
+    def _shard(self, login: str) -> _Shard:
+        return self._shards[hash(login) % len(self._shards)]
+
+    def _new_data(self, initial: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+        """The mapping a shard keeps its users in (`initial` is taken over, not copied, when it can be)."""
+        if self.compact:
+            return UserTable(initial)
+        return {} if initial is None else initial
+
+    def _writable(self, shard: _Shard) -> Dict[str, dict]:
+        """The dict a write should change: the live one, or a private copy in copy-on-write mode."""
+        return shard.data.copy() if self.copy_on_write else shard.data
+
+    @staticmethod
+    def _publish(shard: _Shard, data: Dict[str, dict]) -> None:
+        # one reference assignment: readers see either the old dict or the new one, never half of a write
+        shard.data = data
+
+    def get(self, login: str) -> Optional[dict]:
+        # a single dict lookup is atomic under the GIL, no lock needed for reads
+        return self._shard(login).data.get(login)
+
+    def create(self, login: str, record: dict) -> bool:
+        shard = self._shard(login)
+        with shard.lock:
+            if login in shard.data:
+                return False
+            data = self._writable(shard)
+            data[login] = record
+            self._publish(shard, data)
+            self._changed("create", login, record)
+            return True
+
+    def update(self, login: str, record: dict, expected=ANY) -> bool:
+        shard = self._shard(login)
+        with shard.lock:
+            current = shard.data.get(login)
+            if current is None:
+                return False
+            if expected is not ANY and current != expected:
+                return False
+            data = self._writable(shard)
+            data[login] = record
+            self._publish(shard, data)
+            self._changed("update", login, record)
+            return True
+
+    def delete(self, login: str) -> bool:
+        shard = self._shard(login)
+        with shard.lock:
+            if login not in shard.data:
+                return False
+            data = self._writable(shard)
+            del data[login]
+            self._publish(shard, data)
+            self._changed("delete", login, None)
+            return True
+
+    @contextmanager
+    def _batch(self, logins: List[str]) -> Iterator[Callable[[str], Dict[str, dict]]]:
+        """
+        Lock every shard touched by `logins` once for a whole batch (in a fixed order,
+        so two batches can't deadlock). Yields a function giving the dict to change for
+        a login; the changed dicts are published when the batch ends.
+        """
+        shards = sorted({id(shard): shard for shard in map(self._shard, logins)}.values(),
+                        key=self._shards.index)
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            staged = {id(shard): self._writable(shard) for shard in shards}
+            try:
+                yield lambda login: staged[id(self._shard(login))]
+            finally:
+                for shard in shards:
+                    self._publish(shard, staged[id(shard)])
+        finally:
+            for shard in shards:
+                shard.lock.release()
+
+    def create_many(self, entries: List[Tuple[str, dict]]) -> List[bool]:
+        results = []
+        with self._batch([login for login, _ in entries]) as data_for:
+            for login, record in entries:
+                data = data_for(login)
+                if login in data:
+                    results.append(False)
+                else:
+                    data[login] = record
+                    self._changed("create", login, record)
+                    results.append(True)
+        return results
+
+    def delete_many(self, logins: List[str]) -> List[bool]:
+        results = []
+        with self._batch(logins) as data_for:
+            for login in logins:
+                if data_for(login).pop(login, None) is None:
+                    results.append(False)
+                else:
+                    self._changed("delete", login, None)
+                    results.append(True)
+        return results
+
+    def upsert_many(self, entries: List[Tuple[str, dict]]) -> None:
+        with self._batch([login for login, _ in entries]) as data_for:
+            for login, record in entries:
+                data_for(login)[login] = record
+                self._changed("upsert", login, record)
+
+    def add_listener(self, listener: Callable[[str, str, Optional[dict]], None]) -> None:
+        """
+        Call `listener(op, login, record)` after every successful write
+        (op is "create", "update", "upsert" or "delete"; record is None for deletes).
+        Used to keep secondary indexes in step with the store.
+        """
+        self._listeners.append(listener)
+
+    def _changed(self, op: str, login: str, record: Optional[dict]) -> None:
+        """
+        Hook called after every successful write, while the shard lock is still held,
+        so listeners see the changes of one login in the order they were applied.
+        Subclasses use it to log changes too.
+        """
+        for listener in self._listeners:
+            listener(op, login, record)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        for chunk in self.scan():
+            yield from chunk
+
+    def scan(self, chunk_size: int = 1000) -> Iterator[List[Tuple[str, dict]]]:
+        # only the logins of one shard are copied (a list of references), records are
+        # fetched chunk by chunk, so a long scan neither blocks writers nor copies the store
+        for shard in self._shards:
+            if self.copy_on_write:
+                # a published dict never changes, so it can be iterated as it is
+                yield from _chunked(shard.data.items(), chunk_size)
+                continue
+            with shard.lock:
+                logins = list(shard.data)
+            for start in range(0, len(logins), chunk_size):
+                chunk = []
+                for login in logins[start:start + chunk_size]:
+                    record = shard.data.get(login)  # None if it was deleted meanwhile
+                    if record is not None:
+                        chunk.append((login, record))
+                if chunk:
+                    yield chunk
+
+    def __len__(self) -> int:
+        return sum(len(shard.data) for shard in self._shards)
+
+
+def _chunked(items, size: int) -> Iterator[list]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
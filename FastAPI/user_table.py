@@ -0,0 +1,320 @@
+"""
+UserTable: a compact, dict-like home for the users of one user store shard (user_store.py).
+
+A shard normally keeps its users in a dict of dicts:
+
+    {"kedard": {"password": "scrypt$16384$8$1$<salt hex>$<hash hex>"}, ...}
+
+Every user then costs a login str, a slot in the shard dict, a dict for the record and
+a 120 character str for the hash: about 500 bytes, mostly object headers and hash table
+slack, for ~60 bytes of actual information. With tens of millions of users that is most
+of the server's memory.
+
+A UserTable keeps the same data in a few flat arrays (columns) with one row per user:
+
+    hashes         array('q')   hash(login) of every row, the index is rebuilt from it
+    logins         array('q')   where the row's login is in the login arena (offset << 24 | length)
+    records        array('q')   where the row's record is in the record arena (same packing)
+    live           bytearray    1 while the row is the current version of its login
+    login_arena    bytearray    all the logins (UTF-8) back to back
+    record_arena   bytearray    all the records back to back
+    index          array('i')   open addressing hash table (linear probing): slot -> row
+
+Each login is stored once, in the login arena, and everything else refers to it by row.
+A record {"password": <scrypt hash>} is stored as the binary salt and hash (58 bytes
+instead of a 120 character str), any other password as its UTF-8 bytes and records with
+other fields with marshal. get() builds the {"password": ...} dict again on every call,
+so the code using the store can't tell the difference. All of it comes to ~110 bytes
+per user instead of ~440 (see benchmarks/bench_user_table.py).
+
+Rows never change once written: an update appends a new row and points the index slot
+at it, a delete only empties the slot. That is what makes reads safe without a lock,
+like a dict lookup: a reader holding an old row still finds the whole old record.
+Writers must not run at the same time (the store's shard lock sees to that).
+The space of the dead rows is given back when the index is rebuilt (it is full, or the
+dead rows outnumber the live ones); the rebuilt columns are new objects published with a
+single assignment, so readers still working on the old ones are not disturbed.
+
+A lookup costs a few microseconds more than a dict lookup (the probe is Python code and
+the record is decoded every time), nothing next to the scrypt check of a login.
+"""
+
+import marshal
+import struct
+from array import array
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Mapping, Optional, Tuple
+
+_EMPTY, _DELETED = -1, -2  # index slots without a row (deleted ones don't end a probe)
+_SHIFT = 24
+_MAX_LENGTH = (1 << _SHIFT) - 1  # 16 MB per login or record
+_MIN_CAPACITY = 8
+
+# record encodings, the first byte of a record in the arena
+_SCRYPT, _PASSWORD, _MARSHAL = ord("s"), ord("p"), ord("m")
+_SCRYPT_HEADER = struct.Struct("<IHHB")  # n, r, p, salt length
+_MISSING = object()
+
+
+def _pack_scrypt(stored: str) -> Optional[bytes]:
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != "scrypt":
+        return None
+    try:
+        salt, digest = bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+        packed = _SCRYPT_HEADER.pack(int(parts[1]), int(parts[2]), int(parts[3]), len(salt)) + salt + digest
+    except (ValueError, struct.error):
+        return None
+    # only if it gives back exactly the same string (no upper case hex, no "016384" ...)
+    return packed if _unpack_scrypt(packed, 0, len(packed)) == stored else None
+
+
+def _unpack_scrypt(arena, start: int, end: int) -> str:
+    n, r, p, salt_length = _SCRYPT_HEADER.unpack_from(arena, start)
+    hexed = arena[start + _SCRYPT_HEADER.size:end].hex()  # salt and hash in one go
+    return f"scrypt${n}${r}${p}${hexed[:2 * salt_length]}${hexed[2 * salt_length:]}"
+
+
+def _encode(record: Any) -> bytes:
+    if type(record) is dict and len(record) == 1 and type(record.get("password")) is str:
+        packed = _pack_scrypt(record["password"])
+        if packed is not None:
+            return bytes((_SCRYPT,)) + packed
+        return bytes((_PASSWORD,)) + record["password"].encode("utf-8", "surrogatepass")
+    return bytes((_MARSHAL,)) + marshal.dumps(record)
+
+
+def _decode(arena: bytearray, packed: int) -> Any:
+    start = packed >> _SHIFT
+    end = start + (packed & _MAX_LENGTH)
+    kind = arena[start]
+    if kind == _SCRYPT:
+        return {"password": _unpack_scrypt(arena, start + 1, end)}
+    if kind == _PASSWORD:
+        return {"password": arena[start + 1:end].decode("utf-8", "surrogatepass")}
+    return marshal.loads(arena[start + 1:end])
+
+
+def _append(arena: bytearray, data: bytes) -> int:
+    if len(data) > _MAX_LENGTH:
+        raise ValueError(f"logins and records are limited to {_MAX_LENGTH} bytes")
+    offset = len(arena)
+    arena += data
+    return offset << _SHIFT | len(data)
+
+
+def _move(packed: int, source: bytearray, target: bytearray) -> int:
+    start = packed >> _SHIFT
+    return _append(target, source[start:start + (packed & _MAX_LENGTH)])
+
+
+def _start(h: int, mask: int) -> int:
+    # first slot to probe; the high half of the hash is folded in because the low bits are
+    # all alike in a shard (ShardedUserStore picks shards by hash(login) % shards)
+    return (h ^ h >> 32) & mask
+
+
+class _Columns:
+    __slots__ = ("hashes", "logins", "records", "live", "login_arena", "record_arena", "index")
+
+    def __init__(self, capacity: int):
+        self.hashes = array("q")
+        self.logins = array("q")
+        self.records = array("q")
+        self.live = bytearray()
+        self.login_arena = bytearray()
+        self.record_arena = bytearray()
+        self.index = array("i", [_EMPTY]) * capacity
+
+    def copy(self) -> "_Columns":
+        columns = _Columns(0)
+        columns.hashes, columns.logins, columns.records = self.hashes[:], self.logins[:], self.records[:]
+        columns.live, columns.login_arena, columns.record_arena = self.live[:], self.login_arena[:], self.record_arena[:]
+        columns.index = self.index[:]
+        return columns
+
+    def find(self, login: str) -> Tuple[int, int]:
+        """(slot, row) of `login`, (-1, -1) if it is not in the table."""
+        h = hash(login)
+        index = self.index
+        mask = len(index) - 1
+        slot = _start(h, mask)
+        key = None
+        while True:
+            row = index[slot]
+            if row == _EMPTY:
+                return -1, -1
+            if row >= 0 and self.hashes[row] == h:
+                if key is None:
+                    key = login.encode("utf-8", "surrogatepass")
+                packed = self.logins[row]
+                start = packed >> _SHIFT
+                if self.login_arena[start:start + (packed & _MAX_LENGTH)] == key:
+                    return slot, row
+            slot = (slot + 1) & mask
+
+    def free_slot(self, h: int) -> int:
+        """First slot without a row on the probe path of `h` (for a login known to be absent)."""
+        index = self.index
+        mask = len(index) - 1
+        slot = _start(h, mask)
+        while index[slot] >= 0:
+            slot = (slot + 1) & mask
+        return slot
+
+    def append(self, h: int, login: bytes, record: bytes) -> int:
+        # the arenas first: the row is only reachable once the index points at it
+        logins = _append(self.login_arena, login)
+        records = _append(self.record_arena, record)
+        self.hashes.append(h)
+        self.logins.append(logins)
+        self.records.append(records)
+        self.live.append(1)
+        return len(self.hashes) - 1
+
+    def login(self, row: int) -> str:
+        packed = self.logins[row]
+        start = packed >> _SHIFT
+        return self.login_arena[start:start + (packed & _MAX_LENGTH)].decode("utf-8", "surrogatepass")
+
+
+class UserTable(MutableMapping):
+    """
+    Mapping login -> record, stored in columns instead of one dict per user.
+
+    Iteration follows the row order: insertion order, except that an updated login
+    moves to the end.
+    """
+
+    def __init__(self, initial: Optional[Mapping[str, Any]] = None):
+        self._columns = _Columns(_MIN_CAPACITY)
+        self._live = 0  # logins in the table
+        self._used = 0  # index slots that are not empty (live + deleted)
+        self._dead = 0  # rows no longer pointed at (updated or deleted)
+        if initial:
+            self.update(initial)
+
+    def __repr__(self) -> str:
+        return f"UserTable({self._live} users)"
+
+    # ---------- reads (no lock needed) ----------
+
+    def get(self, login: str, default: Any = None) -> Any:
+        if type(login) is not str:
+            return default
+        columns = self._columns  # one read: a rebuild can't mix old and new columns under us
+        _, row = columns.find(login)
+        return default if row < 0 else _decode(columns.record_arena, columns.records[row])
+
+    def __getitem__(self, login: str) -> Any:
+        record = self.get(login, _MISSING)
+        if record is _MISSING:
+            raise KeyError(login)
+        return record
+
+    def __contains__(self, login: object) -> bool:
+        return type(login) is str and self._columns.find(login)[1] >= 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __iter__(self) -> Iterator[str]:
+        columns = self._columns
+        live = columns.live
+        for row in range(len(live)):
+            if live[row]:
+                yield columns.login(row)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """(login, record) pairs in one pass over the rows, without a lookup per login."""
+        columns = self._columns
+        live = columns.live
+        for row in range(len(live)):
+            if live[row]:
+                yield columns.login(row), _decode(columns.record_arena, columns.records[row])
+
+    def copy(self) -> "UserTable":
+        """An independent copy (the columns are copied as a few memcpy, not user by user)."""
+        table = UserTable.__new__(UserTable)
+        table._columns = self._columns.copy()
+        table._live, table._used, table._dead = self._live, self._used, self._dead
+        return table
+
+    # ---------- writes (one writer at a time) ----------
+
+    def __setitem__(self, login: str, record: Any) -> None:
+        if type(login) is not str:
+            raise TypeError(f"logins are str, not {type(login).__name__}")
+        columns = self._columns
+        slot, old = columns.find(login)
+        h = hash(login)
+        row = columns.append(h, login.encode("utf-8", "surrogatepass"), _encode(record))
+        if old >= 0:
+            columns.index[slot] = row  # readers see the old record or the new one
+            columns.live[old] = 0
+            self._dead += 1
+            if self._dead > max(self._live, _MIN_CAPACITY):
+                self._rebuild()
+            return
+        slot = columns.free_slot(h)
+        if columns.index[slot] == _EMPTY:
+            self._used += 1
+        columns.index[slot] = row
+        self._live += 1
+        if self._used * 3 >= len(columns.index) * 2:
+            self._rebuild()
+
+    def __delitem__(self, login: str) -> None:
+        if self.pop(login, _MISSING) is _MISSING:
+            raise KeyError(login)
+
+    def pop(self, login: str, default: Any = _MISSING) -> Any:
+        columns = self._columns
+        slot, row = columns.find(login) if type(login) is str else (-1, -1)
+        if row < 0:
+            if default is _MISSING:
+                raise KeyError(login)
+            return default
+        record = _decode(columns.record_arena, columns.records[row])
+        columns.index[slot] = _DELETED
+        columns.live[row] = 0
+        self._live -= 1
+        self._dead += 1
+        if self._dead > max(self._live, _MIN_CAPACITY):
+            self._rebuild()
+        return record
+
+    def clear(self) -> None:
+        self._columns = _Columns(_MIN_CAPACITY)
+        self._live = self._used = self._dead = 0
+
+    def _rebuild(self) -> None:
+        """New columns holding only the live rows, with an index at most half full."""
+        old = self._columns
+        capacity = _MIN_CAPACITY
+        while capacity < self._live * 2:
+            capacity *= 2
+        if self._dead:
+            new = _Columns(capacity)
+            for row in range(len(old.live)):
+                if old.live[row]:
+                    new.hashes.append(old.hashes[row])
+                    new.logins.append(_move(old.logins[row], old.login_arena, new.login_arena))
+                    new.records.append(_move(old.records[row], old.record_arena, new.record_arena))
+            new.live = bytearray(b"\x01") * len(new.hashes)
+        else:
+            # nothing to drop (a table that only grew): keep the rows, make a bigger index
+            new = _Columns(0)
+            new.hashes, new.logins, new.records, new.live = old.hashes, old.logins, old.records, old.live
+            new.login_arena, new.record_arena = old.login_arena, old.record_arena
+            new.index = array("i", [_EMPTY]) * capacity
+        mask = capacity - 1
+        index = new.index
+        for row, h in enumerate(new.hashes):
+            slot = _start(h, mask)
+            while index[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            index[slot] = row
+        self._columns = new  # one assignment: readers use either the old columns or the new ones
+        self._used = self._live
+        self._dead = 0